@@ -0,0 +1,180 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from typing_extensions import Dict
+
+from metrics import counter, gauge, histogram
+
+load_dotenv()
+
+# Priority classes of /invoke actions, highest first. Payouts and user registration are short and
+# latency-critical; fetches are long and can wait; batch fetches and scheduled refreshes are
+# background work.
+CRITICAL = "critical"
+STANDARD = "standard"
+BULK = "bulk"
+PRIORITIES = (CRITICAL, STANDARD, BULK)
+
+ACTION_PRIORITIES = {
+    "resolve": CRITICAL,
+    "register user": CRITICAL,
+    "batch fetch": BULK,
+    "refresh": BULK,
+}
+
+# Requests running at once, and how many of those slots only critical requests may take, so
+# payouts never wait behind a wall of fetches. Waiting requests hold a server thread too, so the
+# running and queued limits together should stay below WEB_THREADS (see gunicorn.conf.py).
+concurrency = int(os.getenv("ADMISSION_CONCURRENCY", "8"))
+reserved = int(os.getenv("ADMISSION_RESERVED", "2"))
+queue_limits = {
+    CRITICAL: int(os.getenv("ADMISSION_QUEUE_CRITICAL", "8")),
+    STANDARD: int(os.getenv("ADMISSION_QUEUE_STANDARD", "8")),
+    BULK: int(os.getenv("ADMISSION_QUEUE_BULK", "2")),
+}
+# Queued requests per repo, so one repo cannot fill a class queue on its own.
+repo_queue_limit = int(os.getenv("ADMISSION_REPO_QUEUE", "2"))
+# Longest a request waits in its queue before it is turned away after all.
+queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+admission_running = gauge("gitgrant_admission_running", "Admitted /invoke requests running, by priority class.", ("priority",))
+admission_queued = gauge("gitgrant_admission_queue_depth", "/invoke requests waiting for admission, by priority class.", ("priority",))
+admission_wait_seconds = histogram("gitgrant_admission_wait_seconds", "Time /invoke requests waited for admission.", ("priority",))
+admission_rejected = counter("gitgrant_admission_rejected_total", "/invoke requests turned away with 429, by priority class and reason.", ("priority", "reason"))
+
+
+class Rejected(Exception):
+    """A request was not admitted; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted or waiting request."""
+
+    def __init__(self, priority: str, repoID: str):
+        self.priority = priority
+        self.repoID = repoID
+        self.start = time.monotonic()
+
+
+class Admission:
+    """
+    Admission control for /invoke: at most `concurrency` requests run at once; the rest wait in
+    bounded per-class FIFO queues and are admitted highest class first. A request whose class
+    queue (or its repo's share of it) is full, or that waited longer than `timeout`, is rejected
+    right away with an estimate of when to retry.
+    """
+
+    def __init__(self, concurrency: int, reserved: int, queue_limits: Dict[str, int], repo_limit: int, timeout: float):
+        self.concurrency = concurrency
+        self.reserved = min(reserved, concurrency - 1)
+        self.queue_limits = queue_limits
+        self.repo_limit = repo_limit
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.running = 0
+        self.queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        # (priority, repoID) -> queued requests
+        self.repo_queued: Dict[tuple, int] = {}
+        # priority -> moving average of run time in seconds, for Retry-After
+        self.durations: Dict[str, float] = {priority: 10.0 for priority in PRIORITIES}
+
+    def _can_run(self, priority: str) -> bool:
+        # caller holds self.cond
+        limit = self.concurrency if priority == CRITICAL else self.concurrency - self.reserved
+        return self.running < limit
+
+    def _next(self, ticket: Ticket) -> bool:
+        # caller holds self.cond; whether the waiting ticket is the one to admit now
+        for priority in PRIORITIES:
+            if priority == ticket.priority:
+                return self.queues[priority][0] is ticket and self._can_run(priority)
+            if self.queues[priority]:
+                return False
+        return False
+
+    def _retry_after(self, priority: str) -> int:
+        # caller holds self.cond; roughly when the queue ahead will have drained
+        ahead = sum(len(self.queues[p]) for p in PRIORITIES[:PRIORITIES.index(priority) + 1]) + 1
+        return max(1, math.ceil(self.durations[priority] * ahead / self.concurrency))
+
+    def _reject(self, ticket: Ticket, reason: str):
+        # caller holds self.cond
+        admission_rejected.inc(priority=ticket.priority, reason=reason)
+        raise Rejected(reason, self._retry_after(ticket.priority))
+
+    def acquire(self, action: str, repoID: str = "") -> Ticket:
+        """
+        Wait until a request may run.
+
+        Args:
+            action (str): The /invoke action, which determines the priority class.
+            repoID (str): The repo the request works on, if any.
+
+        Returns:
+            Ticket: To be passed to release() when the request finished.
+
+        Raises:
+            Rejected: If the queue is full or the request waited too long.
+        """
+        ticket = Ticket(ACTION_PRIORITIES.get(action, STANDARD), repoID)
+        queue = self.queues[ticket.priority]
+        repo_key = (ticket.priority, repoID)
+        with self.cond:
+            if not any(self.queues[p] for p in PRIORITIES[:PRIORITIES.index(ticket.priority) + 1]) \
+                    and self._can_run(ticket.priority):
+                self._admit(ticket)
+                return ticket
+            if len(queue) >= self.queue_limits[ticket.priority]:
+                self._reject(ticket, "queue full")
+            if repoID and self.repo_queued.get(repo_key, 0) >= self.repo_limit:
+                self._reject(ticket, "repo queue full")
+            queue.append(ticket)
+            self.repo_queued[repo_key] = self.repo_queued.get(repo_key, 0) + 1
+            admission_queued.inc(priority=ticket.priority)
+            deadline = ticket.start + self.timeout
+            try:
+                while not self._next(ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        queue.remove(ticket)
+                        # Whoever is behind may be admissible now.
+                        self.cond.notify_all()
+                        self._reject(ticket, "queue timeout")
+                    self.cond.wait(remaining)
+                queue.popleft()
+            finally:
+                admission_queued.dec(priority=ticket.priority)
+                self.repo_queued[repo_key] -= 1
+                if not self.repo_queued[repo_key]:
+                    del self.repo_queued[repo_key]
+            self._admit(ticket)
+            # The next waiter may be admissible as well.
+            self.cond.notify_all()
+        return ticket
+
+    def _admit(self, ticket: Ticket):
+        # caller holds self.cond
+        now = time.monotonic()
+        admission_wait_seconds.observe(now - ticket.start, priority=ticket.priority)
+        ticket.start = now
+        self.running += 1
+        admission_running.inc(priority=ticket.priority)
+
+    def release(self, ticket: Ticket):
+        """Mark an admitted request as finished."""
+        with self.cond:
+            self.running -= 1
+            admission_running.dec(priority=ticket.priority)
+            self.durations[ticket.priority] = 0.8 * self.durations[ticket.priority] + 0.2 * (time.monotonic() - ticket.start)
+            self.cond.notify_all()
+
+
+admission = Admission(concurrency, reserved, queue_limits, repo_queue_limit, queue_timeout)
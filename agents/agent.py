@@ -1,11 +1,10 @@
 import json
 import os
 import sys
-import time
 from dotenv import load_dotenv
 
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from llm_gateway import GatewayChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
@@ -13,7 +12,9 @@ from langgraph.prebuilt import create_react_agent
 from cdp_langchain.agent_toolkits import CdpToolkit
 from cdp_langchain.utils import CdpAgentkitWrapper
 from cdp import *
+import cassette
 from github.issues import get_all_open_issues
+from metrics import LLMMetricsHandler
 
 # Configure a file to persist the agent's CDP MPC Wallet Data.
 wallet_data_file = "wallet_data.txt"
@@ -22,31 +23,33 @@ load_dotenv("../.env")
 def initialize_meta_agent(memory, config):
     """Initialize the agent with CDP Agentkit."""
     # Initialize LLM.
-    llm = ChatOpenAI(model="gpt-4o-mini")
+    llm = GatewayChatOpenAI(model="gpt-4o-mini", callbacks=[LLMMetricsHandler()])
 
-    wallet_data = None
+    tools = []
+    # A replayed run must not reach CDP; the wallet tools are left out (their calls are not recorded).
+    if not cassette.replaying():
+        wallet_data = None
 
-    if os.path.exists(wallet_data_file):
-        with open(wallet_data_file) as f:
-            wallet_data = f.read()
+        if os.path.exists(wallet_data_file):
+            with open(wallet_data_file) as f:
+                wallet_data = f.read()
 
-    # Configure CDP Agentkit Langchain Extension.
-    values = {}
-    if wallet_data is not None:
-        # If there is a persisted agentic wallet, load it and pass to the CDP Agentkit Wrapper.
-        values = {"cdp_wallet_data": wallet_data}
+        # Configure CDP Agentkit Langchain Extension.
+        values = {}
+        if wallet_data is not None:
+            # If there is a persisted agentic wallet, load it and pass to the CDP Agentkit Wrapper.
+            values = {"cdp_wallet_data": wallet_data}
 
-    agentkit = CdpAgentkitWrapper(**values)
-    
+        agentkit = CdpAgentkitWrapper(**values)
 
-    # persist the agent's CDP MPC Wallet Data.
-    wallet_data = agentkit.export_wallet()
-    with open(wallet_data_file, "w") as f:
-        f.write(wallet_data)
+        # persist the agent's CDP MPC Wallet Data.
+        wallet_data = agentkit.export_wallet()
+        with open(wallet_data_file, "w") as f:
+            f.write(wallet_data)
 
-    # Initialize CDP Agentkit Toolkit and get tools.
-    cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(agentkit)
-    tools = cdp_toolkit.get_tools()
+        # Initialize CDP Agentkit Toolkit and get tools.
+        cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(agentkit)
+        tools = cdp_toolkit.get_tools()
     
     # Add github tool to get all open issues to the tools list
     tools.append(get_all_open_issues)
@@ -66,32 +69,13 @@ def initialize_meta_agent(memory, config):
 
 
 # Autonomous Mode
-def run_autonomous_mode(agent_executor, config, interval=10):
-    """Run the agent autonomously with specified intervals."""
+def run_autonomous_mode():
+    """Keep the registered repos rated: check them on a schedule and refresh the ones that changed (see scheduler.py)."""
     print("Starting autonomous mode...")
-    while True:
-        try:
-            # Provide instructions autonomously
-            thought = (
-                "Be creative and do something interesting on the blockchain. "
-                "Choose an action or set of actions and execute it that highlights your abilities."
-            )
-
-            # Run agent in autonomous mode
-            for chunk in agent_executor.stream(
-                {"messages": [HumanMessage(content=thought)]}, config):
-                if "agent" in chunk:
-                    print(chunk["agent"]["messages"][0].content)
-                elif "tools" in chunk:
-                    print(chunk["tools"]["messages"][0].content)
-                print("-------------------")
-
-            # Wait before the next action
-            time.sleep(interval)
-
-        except KeyboardInterrupt:
-            print("Goodbye Agent!")
-            sys.exit(0)
+    # Imported here, since the chain imports this module.
+    from scheduler import serve
+    serve()
+    print("Goodbye Agent!")
 
 
 # Chat Mode
@@ -124,7 +108,7 @@ def choose_mode():
     while True:
         print("\nAvailable modes:")
         print("1. chat    - Interactive chat mode")
-        print("2. auto    - Autonomous action mode")
+        print("2. auto    - Autonomous mode: keep registered repos rated on a schedule")
 
         choice = input(
             "\nChoose a mode (enter number or name): ").lower().strip()
@@ -138,16 +122,14 @@ def choose_mode():
 def main():
     """Start the chatbot agent."""
     # Store buffered conversation history in memory.
-    memory = MemorySaver()
-    config = {"configurable": {"thread_id": "GitGrant"}}
-    
-    agent_executor, config = initialize_meta_agent(memory, config)
-
     mode = choose_mode()
     if mode == "chat":
+        memory = MemorySaver()
+        config = {"configurable": {"thread_id": "GitGrant"}}
+        agent_executor, config = initialize_meta_agent(memory, config)
         run_chat_mode(agent_executor=agent_executor, config=config)
     elif mode == "auto":
-        run_autonomous_mode(agent_executor=agent_executor, config=config)
+        run_autonomous_mode()
 
 
 if __name__ == "__main__":
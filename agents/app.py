@@ -1,12 +1,174 @@
-from flask import Flask, request, jsonify
+import os
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 
 from chain import init_chain
+from batch import run_batch
+from metrics import render, timed, invocation_seconds, invocation_errors
+from profiling import should_profile, profile
+from singleflight import Group
+from admission import admission, Rejected
+from interactions.registry import get_registered_repos
+from ledger import IssueLedger
+import runs
+import budget
+import cassette
+import compression
+import dashboard
+import scheduler
 
 app = Flask(__name__)
 
 # Initialize the chatbot
 chain = init_chain()
 
+# Background chain reads would be recorded in between those of the requests (and take their
+# entries on replay), so while a cassette is active nothing refreshes in the background.
+background = cassette.active is None
+
+# Serve the dashboard endpoints from a local cache of the contract state.
+dashboard.cache.start(refresh=background)
+
+# Concurrent identical requests (same action on the same repo/PR/user, with the same limits)
+# attach to the run already in flight instead of starting a second pipeline that races the first.
+inflight = Group()
+
+# Request fields that change what a run does (time box, partial commits, LLM budget).
+RUN_PARAMETERS = ("time_budget", "max_issues", "commit_every", "commit_interval", "token_budget", "cost_budget")
+
+def coalescing_key(state) -> tuple:
+    # Called before a run_id is assigned, so a fetch or refresh only carries the one its client chose.
+    action = state.get("action", "")
+    if action == "register user":
+        return (action, state.get("username"), state.get("address"))
+    parameters = json.dumps({name: state[name] for name in RUN_PARAMETERS if state.get(name) is not None}, sort_keys=True, default=str)
+    repoID = f"{state.get('owner')}/{state.get('repo')}"
+    if action == "resolve":
+        return (action, repoID, state.get("current_issue"), parameters)
+    if action in ("resume", "flush"):
+        return (action, state.get("run_id"), parameters)
+    if action in ("fetch", "refresh"):
+        return (action, repoID, state.get("run_id"), parameters)
+    return (action, repoID, parameters)
+
+# A fetch takes two graph steps per issue the LLM agents rate, so the limit only guards
+# against routing loops and has to allow for repos with thousands of open issues.
+recursion_limit = int(os.getenv("RECURSION_LIMIT", "100000"))
+
+def run_chain(state, profiled: bool):
+    # Coalesced requests wait for the leader and take no admission slot of their own.
+    repoID = f"{state['owner']}/{state['repo']}" if state.get("owner") and state.get("repo") else ""
+    ticket = admission.acquire(state.get("action", ""), repoID)
+    try:
+        return run_admitted(state, profiled)
+    finally:
+        admission.release(ticket)
+
+def run_admitted(state, profiled: bool):
+    # LLM calls of the run are charged to its budget; the totals are returned as "usage".
+    with budget.track(state) as usage:
+        if profiled:
+            with profile(state.get("action") or "invoke") as profile_name:
+                final_state = chain.invoke(state, {"recursion_limit": recursion_limit})
+        else:
+            final_state, profile_name = chain.invoke(state, {"recursion_limit": recursion_limit}), None
+    return {**final_state, "usage": usage.to_dict()}, profile_name
+
+# Scheduled refresh of the registered repos (see scheduler.py), through the same admission
+# control and request coalescing as /invoke. Enable it in one server process only.
+if os.getenv("SCHEDULER_ENABLED", "false").lower() == "true" and not background:
+    print("SCHEDULER_ENABLED is ignored while a cassette is active.")
+elif os.getenv("SCHEDULER_ENABLED", "false").lower() == "true":
+    # The scheduler picks its own run_id; it is left out of the key, as for a request without one.
+    scheduler.Scheduler(lambda state: inflight.do(coalescing_key({**state, "run_id": None}), lambda: run_chain(state, False))[0][0]).start()
+
+def busy(e: Rejected):
+    response = jsonify({'error': str(e)})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
+
+def serializable(state) -> dict:
+    # Coalesced requests share the final state, so convert a copy.
+    return {key: value.to_dict() if isinstance(value, IssueLedger) else value for key, value in state.items()}
+
+def summary(state) -> dict:
+    # The final state without its per-issue parts, whose size grows with the repo; the ratings of a
+    # run can be read back with GET /runs/<run_id>.
+    result = {key: value for key, value in state.items() if key not in ("issues", "failed", "duplicates", "degraded", "action_items")}
+    issues = state.get("issues")
+    if isinstance(issues, IssueLedger):
+        result["issues"] = len(issues)
+        result["rated"] = len(issues) - issues.unrated
+    for key in ("failed", "duplicates", "degraded"):
+        result[key] = len(state.get(key) or {})
+    return result
+
+def json_response(body: dict, status: int = 200) -> Response:
+    # Compressed as the client accepts (zstd or gzip), if it is worth it.
+    data = app.json.dumps(body).encode()
+    encoding = compression.negotiate(request.accept_encodings)
+    response = Response(status=status, mimetype="application/json")
+    if encoding is not None and len(data) >= compression.MIN_SIZE:
+        data = compression.compress(data, encoding)
+        response.headers["Content-Encoding"] = encoding
+    response.set_data(data)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def ndjson_response(records) -> Response:
+    # One JSON line per record; each chunk of lines is sent (and compressed) as soon as it is ready.
+    chunks = ("".join(json.dumps(record, default=str) + "\n" for record in batch).encode() for batch in records)
+    encoding = compression.negotiate(request.accept_encodings)
+    if encoding is not None:
+        chunks = compression.compress_stream(chunks, encoding)
+    response = Response(stream_with_context(chunks), mimetype="application/x-ndjson")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def update_records(node: str, update: dict, sources: dict) -> list:
+    # NDJSON records of one graph step: ratings as issues complete, failures and partial commits.
+    records = []
+    # Recorded first: a step can rate an issue and say how in the same update (rate_without_llm).
+    for number in update.get("duplicates") or {}:
+        sources[number] = "duplicate"
+    for number, outcome in (update.get("degraded") or {}).items():
+        sources[number] = outcome
+    issues = update.get("issues")
+    if isinstance(issues, IssueLedger):
+        # Start of the rating phase: issues rated before any LLM call (heuristic or offline ratings).
+        records.append({"type": "run", "run_id": update.get("run_id"), "issues": len(issues), "rated": len(issues) - issues.unrated})
+        records.extend({"type": "rating", "issue": number, "rating": rating, "source": "prerated"}
+                       for number, rating in issues.items() if rating)
+    elif issues:
+        records.extend({"type": "rating", "issue": number, "rating": rating, "source": sources.pop(number, "llm")}
+                       for number, rating in issues.items())
+    records.extend({"type": "failed", "issue": number, "error": error} for number, error in (update.get("failed") or {}).items())
+    if node == "partial_commit":
+        records.append({"type": "commit", "committed": update["committed"]})
+    return records
+
+def stream_chain(state):
+    # Runs while the response is being sent; the admission slot is released when it is closed.
+    yield [{"type": "accepted", "action": state.get("action", ""), "run_id": state.get("run_id")}]
+    final_state, sources = {}, {}
+    try:
+        with budget.track(state) as usage:
+            for mode, chunk in chain.stream(state, {"recursion_limit": recursion_limit}, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                records = [record for node, update in chunk.items() for record in update_records(node, update or {}, sources)]
+                if records:
+                    yield records
+    except Exception as e:
+        if state.get("run_id"):
+            runs.fail_run(state["run_id"], str(e))
+        yield [{"type": "error", "error": f'Error while invoking chatbot: {str(e)}', "run_id": state.get("run_id")}]
+        return
+    yield [{"type": "summary", **summary({**final_state, "usage": usage.to_dict()})}]
+
 @app.route('/invoke', methods=['POST'])
 def invoke_chatbot():
     # Get the JSON state from the request.
@@ -14,16 +176,162 @@ def invoke_chatbot():
     if state is None:
         return jsonify({'error': 'Invalid or missing JSON payload.'}), 400
 
+    action = state.get("action", "")
+    if action == "batch fetch":
+        return batch_fetch(state)
+
+    if action in ("resume", "flush") and not state.get("run_id"):
+        return jsonify({'error': f'"{action}" requires "run_id".'}), 400
+    key = coalescing_key(state)
+    if action in ("fetch", "refresh"):
+        # Known up front, so a failed run can be resumed with it. A client-chosen id must be new:
+        # an existing run is only continued with "resume".
+        if state.get("run_id") and runs.run_info(state["run_id"]) is not None:
+            return jsonify({'error': f'Run {state["run_id"]} already exists; use "resume" to continue it.'}), 400
+        state.setdefault("run_id", runs.new_run_id())
+
+    # "response": "full" (default) returns the final state, "summary" only its size-independent
+    # part (the run's ratings are at GET /runs/<run_id>), "stream" NDJSON records as issues are rated.
+    mode = state.pop("response", None) or ("stream" if request.accept_mimetypes.best == "application/x-ndjson" else "full")
+    if mode not in ("full", "summary", "stream"):
+        return jsonify({'error': '"response" must be "full", "summary" or "stream".'}), 400
+    if mode == "stream":
+        # A streamed run is not shared with identical requests; each stream runs its own.
+        try:
+            ticket = admission.acquire(action, f"{state.get('owner')}/{state.get('repo')}" if state.get("owner") and state.get("repo") else "")
+        except Rejected as e:
+            return busy(e)
+        response = ndjson_response(stream_chain(state))
+        response.call_on_close(lambda: admission.release(ticket))
+        return response
+
+    profiled = should_profile(request.headers)
     try:
-        # Invoke the chain with the provided state.
-        # TODO: change recursion limit based on action and issue count
-        final_state = chain.invoke(state, {"recursion_limit": 100})
+        # Invoke the chain with the provided state. The invocation span (if OpenTelemetry is
+        # installed) is the parent of all node, GitHub, LLM and contract spans of this request.
+        with timed(invocation_seconds, invocation_errors, span_name=f"invoke {action}", action=action):
+            (final_state, profile_name), shared = inflight.do(key, lambda: run_chain(state, profiled))
+    except Rejected as e:
+        return busy(e)
     except Exception as e:
+        if state.get("run_id"):
+            runs.fail_run(state["run_id"], str(e))
+            return jsonify({'error': f'Error while invoking chatbot: {str(e)}', 'run_id': state["run_id"]}), 500
         return jsonify({'error': f'Error while invoking chatbot: {str(e)}'}), 500
 
     # Return the final state as JSON.
-    return jsonify(final_state), 200
+    response = json_response(summary(final_state) if mode == "summary" else serializable(final_state))
+    if shared:
+        response.headers["X-GitGrant-Coalesced"] = "true"
+    elif profile_name is not None:
+        response.headers["X-GitGrant-Profile-Id"] = profile_name
+    return response, 200
+
+@app.route('/runs/<run_id>', methods=['GET'])
+def run_results(run_id):
+    # The ratings of a run as NDJSON, read from the checkpoint a row at a time, then its status.
+    info = runs.run_info(run_id)
+    if info is None:
+        return jsonify({'error': f'Run {run_id} not found.'}), 404
+    repoID, status, message = info
+
+    def records():
+        batch = []
+        for number, rating, error in runs.iter_run_issues(run_id):
+            batch.append({"type": "rating", "issue": number, "rating": rating} if error is None or rating
+                         else {"type": "failed", "issue": number, "error": error})
+            if len(batch) == 500:
+                yield batch
+                batch = []
+        yield batch + [{"type": "summary", "run_id": run_id, "repo": repoID, "status": status, "message": message}]
+
+    return ndjson_response(records())
+
+def batch_fetch(state):
+    # "repos" is a list of "owner/repo" IDs or "all" for every registered repo.
+    repos = state.get("repos")
+    if repos == "all":
+        repos = ["all"]
+    if not isinstance(repos, list) or not repos:
+        return jsonify({'error': 'Batch fetch requires "repos": a list of "owner/repo" or "all".'}), 400
+
+    try:
+        ticket = admission.acquire("batch fetch")
+    except Rejected as e:
+        return busy(e)
+
+    # Stream one JSON line per repo as soon as it is rated and committed.
+    results = (json.dumps(result) + "\n" for result in run_batch(repos, state.get("token_budget") or 0, state.get("cost_budget") or 0.0))
+    response = Response(stream_with_context(results), mimetype="application/x-ndjson")
+    # Holds its slot until the stream is finished or the client went away.
+    response.call_on_close(lambda: admission.release(ticket))
+    return response
+
+def cached_json(scope: str, build):
+    # Dashboard responses are rendered from the local cache only; clients revalidate with
+    # If-None-Match and get a 304 while nothing changed.
+    rendered = dashboard.cache.render(scope, request.full_path, build)
+    if rendered is None:
+        return jsonify({'error': 'Not found.'}), 404
+    body, etag, gzipped = rendered
+    encoding = None
+    if gzipped is not None and request.accept_encodings["gzip"]:
+        # The gzipped body is a different representation, so it has an ETag of its own.
+        body, etag, encoding = gzipped, etag + "-gz", "gzip"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def pagination():
+    return request.args.get("page", 1, type=int), request.args.get("per_page", dashboard.DEFAULT_PAGE_SIZE, type=int)
+
+@app.route('/dashboard/repos', methods=['GET'])
+def dashboard_repos():
+    page, per_page = pagination()
+    return cached_json("repos", lambda: dashboard.cache.list_repos(page, per_page))
+
+@app.route('/dashboard/repos/<owner>/<repo>', methods=['GET'])
+def dashboard_repo(owner, repo):
+    repoID = f"{owner}/{repo}"
+    if not dashboard.cache.has_repo(repoID) and repoID in get_registered_repos():
+        # Not cached yet: load it in the background (the request gets a 404 until then).
+        dashboard.cache.request_refresh(repoID)
+    return cached_json(f"repo:{repoID}", lambda: dashboard.cache.repo_summary(repoID))
+
+@app.route('/dashboard/repos/<owner>/<repo>/issues', methods=['GET'])
+def dashboard_repo_issues(owner, repo):
+    repoID = f"{owner}/{repo}"
+    page, per_page = pagination()
+    return cached_json(f"repo:{repoID}", lambda: dashboard.cache.repo_issues(repoID, page, per_page))
+
+@app.route('/dashboard/top-issues', methods=['GET'])
+def dashboard_top_issues():
+    n = request.args.get("n", dashboard.DEFAULT_PAGE_SIZE, type=int)
+    repoID = request.args.get("repo")
+    return cached_json("snapshot", lambda: dashboard.cache.top_issues(n, repoID))
+
+@app.route('/dashboard/repos/<owner>/<repo>/ratings', methods=['GET'])
+def dashboard_rating_histogram(owner, repo):
+    bins = request.args.get("bins", 10, type=int)
+    return cached_json("snapshot", lambda: dashboard.cache.rating_histogram(f"{owner}/{repo}", bins))
+
+@app.route('/dashboard/contributors/<username>/payouts', methods=['GET'])
+def dashboard_payouts(username):
+    page, per_page = pagination()
+    return cached_json(f"user:{username}", lambda: dashboard.cache.contributor_payouts(username, page, per_page))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Expose latency histograms, counters, token usage and gas in Prometheus format.
+    return Response(render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
-    # Run the Flask development server.
-    app.run(debug=True)
+    # Run the Flask development server (for production, serve with gunicorn; see gunicorn.conf.py).
+    app.run(debug=os.getenv("FLASK_DEBUG", "false").lower() == "true")
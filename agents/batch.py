@@ -0,0 +1,235 @@
+import threading
+from queue import Queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing_extensions import List, Iterator
+
+import limits
+import runs
+import budget
+from chain import evaluate, rate, rate_without_llm, with_retries
+from github.issues import get_all_open_issue_details
+from rate_issue.heuristic import pre_rate, prioritize, record_llm_rating, release_pending
+from rate_issue import dedup
+from bulk_rate import imported_ratings
+from interactions.deploy import update_issues
+from interactions.registry import get_registered_repos
+from ledger import IssueLedger
+
+
+class FairQueue:
+    """
+    Work queue that hands out tasks round-robin across repos, so a repo with thousands of
+    issues cannot starve the small ones scheduled after it.
+    """
+
+    def __init__(self):
+        self.queues = OrderedDict()
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, repoID: str, task):
+        with self.cond:
+            if self.closed:
+                return
+            self.queues.setdefault(repoID, deque()).append(task)
+            self.cond.notify()
+
+    def drop(self, repoID: str):
+        """Discard all queued tasks of a repo."""
+        with self.cond:
+            self.queues.pop(repoID, None)
+
+    def get(self):
+        """Return the next (repoID, task), or None once the queue is closed (queued tasks are dropped)."""
+        with self.cond:
+            while not self.queues and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                return None
+            repoID, tasks = self.queues.popitem(last=False)
+            task = tasks.popleft()
+            if tasks:
+                # Move the repo to the back of the line.
+                self.queues[repoID] = tasks
+            return repoID, task
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.queues.clear()
+            self.cond.notify_all()
+
+
+class RepoRun:
+    """Progress of one repo within a batch: a checkpointed run (see runs.py) with its own LLM budget."""
+
+    def __init__(self, repoID: str, usage: budget.RunUsage):
+        self.repoID = repoID
+        self.owner, self.repo = repoID.split("/", 1)
+        self.run_id = runs.new_run_id()
+        self.usage = usage
+        self.issues = {}
+        self.duplicates = {}
+        self.degraded = {}
+        self.failed = {}
+        self.remaining = 0
+        self.done = False
+
+    def rate(self, issue: int) -> dict:
+        """
+        Rate one issue like the evaluate_issue and assign_rating nodes of a fetch: with retries, on a
+        reduced prompt close to the budget and without the LLM agents once it is spent.
+
+        Returns:
+            dict: {"issues": {issue: rating}} with "duplicates" or "degraded" if it was rated that way,
+            or {"failed": {issue: error}}.
+        """
+        with budget.charging(self.usage):
+            mode = self.usage.mode()
+            if mode == budget.EXHAUSTED:
+                return rate_without_llm({"owner": self.owner, "repo": self.repo, "run_id": self.run_id}, issue)
+            try:
+                action_items, duplicate = with_retries(evaluate, self.owner, self.repo, issue, mode == budget.REDUCED)
+                if duplicate is not None:
+                    rating = duplicate["rating"]
+                else:
+                    reduced = action_items if self.usage.mode() == budget.FULL else action_items[:budget.reduced_context_chars]
+                    rating = with_retries(rate, reduced)
+            except Exception as e:
+                runs.record_failure(self.run_id, issue, str(e))
+                return {"failed": {issue: str(e)}}
+        if duplicate is None:
+            record_llm_rating(self.repoID, self.run_id, issue, rating)
+            dedup.add_rated(self.repoID, issue, rating, action_items)
+        runs.record_rating(self.run_id, issue, rating)
+        if duplicate is not None:
+            return {"issues": {issue: rating}, "duplicates": {issue: duplicate}}
+        return {"issues": {issue: rating}}
+
+
+def run_batch(repos: List[str], token_budget: int = 0, cost_budget: float = 0.0) -> Iterator[dict]:
+    """
+    Fetch, rate and commit the open issues of many repos at once.
+
+    Every repo is rated like a fetch: as a checkpointed run that can be resumed, most valuable
+    issues first, reusing offline and heuristic ratings, with its own LLM budget. An issue that
+    fails to be rated (after ISSUE_ATTEMPTS attempts) is left out of the commit and the others
+    are committed; resuming the run retries it.
+
+    Issue listing, evaluation and update_issues writes of all repos share the process-wide
+    GitHub, LLM and transaction limits in limits.py; evaluation work is interleaved fairly
+    between repos.
+
+    Args:
+        repos (List[str]): Repo IDs ("owner/repo"), or ["all"] for every registered repo.
+        token_budget (int), cost_budget (float): LLM budget of each repo (see budget.py).
+
+    Yields:
+        dict: One result per repo, in completion order, with its "run_id" and either "issues",
+        "rating_sum", "duplicates", "degraded", "failed", "usage" and "message", or "error".
+    """
+    if repos == ["all"]:
+        repos = get_registered_repos()
+    repos = list(dict.fromkeys(repos))
+    if not repos:
+        return
+
+    budgets = {"token_budget": token_budget, "cost_budget": cost_budget}
+    repo_runs = {repoID: RepoRun(repoID, budget.account(budgets)) for repoID in repos}
+    work = FairQueue()
+    results = Queue()
+    lock = threading.Lock()
+
+    def finish(run: RepoRun, result: dict):
+        # Emit exactly one result per repo, whichever of success or failure comes first.
+        with lock:
+            if run.done:
+                return
+            run.done = True
+        work.drop(run.repoID)
+        dedup.unstage(run.repoID, run.issues)
+        release_pending(run.run_id)
+        if "error" in result:
+            runs.fail_run(run.run_id, result["error"])
+        results.put({"repo": run.repoID, "run_id": run.run_id, **result})
+
+    def commit(run: RepoRun):
+        try:
+            issues = IssueLedger(run.issues)
+            issueNumbers, ratings = issues.to_lists(rated_only=True)
+            update_issues(run.repoID, issueNumbers, ratings, str(int(issues.rating_sum)))
+        except Exception as e:
+            finish(run, {"error": f"Error while updating issues: {str(e)}"})
+            return
+        message = f"Total {len(issueNumbers)} issues are fetched and rated."
+        if run.failed:
+            message += f" {len(run.failed)} issues failed and can be retried by resuming run {run.run_id}."
+        runs.set_status(run.run_id, runs.FAILED if run.failed else runs.COMMITTED, message)
+        finish(run, {"issues": {number: rating for number, rating in issues.items() if rating},
+                     "rating_sum": issues.rating_sum, "duplicates": run.duplicates, "degraded": run.degraded,
+                     "failed": run.failed, "usage": run.usage.to_dict(), "message": message})
+
+    def fetch(run: RepoRun):
+        # Every failure must finish the repo, or run_batch would wait for its result forever.
+        try:
+            details = get_all_open_issue_details(run.owner, run.repo)
+        except Exception as e:
+            finish(run, {"error": f"Error while fetching issues: {str(e)}"})
+            return
+        try:
+            # Most valuable first; issues rated offline (see bulk_rate.py) keep that rating.
+            offline = imported_ratings(run.repoID)
+            issues = {number: offline.get(number, 0) for number in prioritize(details)}
+            pre_rate(run.repoID, run.run_id, details, issues)
+            unrated = [issue for issue, rating in issues.items() if rating == 0]
+            dedup.stage(run.repoID, [issue for issue in details if issues[issue["number"]] == 0])
+            runs.create_run(run.run_id, run.repoID, issues)
+            with lock:
+                run.issues = issues
+                run.remaining = len(unrated)
+            if not unrated:
+                writers.submit(commit, run)
+            for issue in unrated:
+                work.put(run.repoID, issue)
+        except Exception as e:
+            finish(run, {"error": f"Error while preparing issues: {str(e)}"})
+
+    def worker():
+        while (item := work.get()) is not None:
+            repoID, issue = item
+            run = repo_runs[repoID]
+            if run.done:
+                continue
+            try:
+                update = run.rate(issue)
+            except Exception as e:
+                # Bookkeeping failed (e.g. the runs database): the issue fails, the repo goes on.
+                update = {"failed": {issue: str(e)}}
+            with lock:
+                run.issues.update(update.get("issues", {}))
+                run.duplicates.update(update.get("duplicates", {}))
+                run.degraded.update(update.get("degraded", {}))
+                run.failed.update(update.get("failed", {}))
+                run.remaining -= 1
+                complete = run.remaining == 0 and not run.done
+            if complete:
+                writers.submit(commit, run)
+
+    fetchers = ThreadPoolExecutor(max_workers=limits.github_concurrency, thread_name_prefix="batch-fetch")
+    writers = ThreadPoolExecutor(max_workers=limits.transaction_concurrency, thread_name_prefix="batch-write")
+    workers = [threading.Thread(target=worker, name=f"batch-rate-{i}", daemon=True)
+               for i in range(limits.llm_concurrency)]
+    for thread in workers:
+        thread.start()
+    for run in repo_runs.values():
+        fetchers.submit(fetch, run)
+
+    try:
+        for _ in range(len(repo_runs)):
+            yield results.get()
+    finally:
+        # Also reached when the client disconnects mid-stream: stop handing out work.
+        work.close()
+        fetchers.shutdown(wait=False, cancel_futures=True)
+        writers.shutdown(wait=False)
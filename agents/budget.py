@@ -0,0 +1,109 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing_extensions import Dict, Optional
+
+from metrics import current_usage
+
+load_dotenv()
+
+# Default LLM budget of a graph run (0 = unlimited); a request can set its own with "token_budget"
+# and "cost_budget" (US dollars, see LLM_PRICES in metrics.py).
+default_token_budget = int(os.getenv("LLM_RUN_TOKEN_BUDGET", "0"))
+default_cost_budget = float(os.getenv("LLM_RUN_COST_BUDGET", "0"))
+# Fraction of the budget after which issues are evaluated with less context, and the size the
+# action items given to the rating agent are cut to then.
+reduce_at = float(os.getenv("LLM_BUDGET_REDUCE_AT", "0.8"))
+reduced_context_chars = int(os.getenv("LLM_REDUCED_CONTEXT_CHARS", "2000"))
+
+# Budget modes, from least to most degraded.
+FULL = "full"
+REDUCED = "reduced"
+EXHAUSTED = "exhausted"
+
+
+class RunUsage:
+    """LLM calls, tokens, latency and estimated cost of one graph run, in total and per node, and its budget."""
+
+    def __init__(self, token_budget: int = 0, cost_budget: float = 0.0):
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.lock = threading.Lock()
+        self.totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "seconds": 0.0}
+        self.nodes: Dict[str, dict] = {}
+
+    def add(self, node: str, prompt_tokens: int, completion_tokens: int, cost: float, seconds: float):
+        with self.lock:
+            for totals in (self.totals, self.nodes.setdefault(node or "-", dict.fromkeys(self.totals, 0))):
+                totals["calls"] += 1
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost"] += cost
+                totals["seconds"] += seconds
+
+    def used(self) -> float:
+        """The largest fraction of a budget used so far (0 without budgets)."""
+        with self.lock:
+            tokens = self.totals["prompt_tokens"] + self.totals["completion_tokens"]
+            fractions = [0.0]
+            if self.token_budget:
+                fractions.append(tokens / self.token_budget)
+            if self.cost_budget:
+                fractions.append(self.totals["cost"] / self.cost_budget)
+            return max(fractions)
+
+    def mode(self) -> str:
+        used = self.used()
+        if used >= 1:
+            return EXHAUSTED
+        if used >= reduce_at:
+            return REDUCED
+        return FULL
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            def rounded(totals):
+                return {**totals, "cost": round(totals["cost"], 6), "seconds": round(totals["seconds"], 3)}
+            return {**rounded(self.totals), "token_budget": self.token_budget, "cost_budget": self.cost_budget,
+                    "nodes": {node: rounded(totals) for node, totals in self.nodes.items()}}
+
+
+def current() -> Optional[RunUsage]:
+    """The usage account of the run in progress, or None outside of a tracked run."""
+    return current_usage.get()
+
+
+def mode() -> str:
+    """Budget mode of the run in progress (FULL outside of a tracked run)."""
+    usage = current_usage.get()
+    return usage.mode() if usage is not None else FULL
+
+
+def account(state: dict) -> RunUsage:
+    """A new usage account with the budget given in the run's input state or the default budget."""
+    return RunUsage(int(state.get("token_budget") or default_token_budget),
+                    float(state.get("cost_budget") or default_cost_budget))
+
+
+@contextmanager
+def charging(usage: RunUsage):
+    """Charge all LLM calls made in the enclosed block (graph nodes included) to `usage`."""
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+
+@contextmanager
+def track(state: dict):
+    """
+    Charge all LLM calls made in the enclosed block (graph nodes included) to a new usage account,
+    with the budget given in the run's input state or the default budget.
+
+    Yields:
+        RunUsage: The account.
+    """
+    with charging(account(state)) as usage:
+        yield usage
@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from typing_extensions import Dict, Iterator, List, Optional, Tuple
+
+import limits
+import budget
+from rate_issue import heuristic
+
+load_dotenv()
+
+# Offline rating of issues exported to JSON lines (one issues endpoint object per line; a "repo"
+# field or the repository_url names the repo, and "comments" may hold the comment objects instead
+# of their count). Prompts and heuristic features are built in a process pool, issues are rated
+# with bounded LLM concurrency, and every rating is checkpointed in SQLite, so an interrupted run
+# continues where it stopped. With OFFLINE_RATINGS pointing at that database, fetch and refresh
+# take issues rated there instead of evaluating them again.
+offline_ratings_db = os.getenv("OFFLINE_RATINGS", "")
+issue_attempts = int(os.getenv("ISSUE_ATTEMPTS", "3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratings (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    rating INTEGER NOT NULL DEFAULT 0,
+    source TEXT NOT NULL DEFAULT '',
+    action_items TEXT NOT NULL DEFAULT '',
+    error TEXT,
+    updated INTEGER NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+"""
+
+EVALUATION_PROMPT = (
+    "You are given the title, body, labels and comments of a GitHub issue. "
+    "Based on these details, provide a list of clear, actionable steps to resolve this issue. "
+    "If you require any additional details regarding the repository or the issue for a more accurate diagnosis, "
+    "please specify what extra information is needed."
+)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_ratings(path: str, repoID: str) -> Dict[int, int]:
+    """Issue number -> rating of the issues of a repo rated in a ratings database."""
+    conn = connect(path)
+    try:
+        return dict(conn.execute("SELECT number, rating FROM ratings WHERE repo = ? AND rating > 0", (repoID,)))
+    finally:
+        conn.close()
+
+
+def imported_ratings(repoID: str) -> Dict[int, int]:
+    """Offline ratings of a repo from OFFLINE_RATINGS (empty if it is not set)."""
+    if not offline_ratings_db or not os.path.exists(offline_ratings_db):
+        return {}
+    return load_ratings(offline_ratings_db, repoID)
+
+
+def _repo_of(issue: dict, default: str) -> str:
+    if issue.get("repo"):
+        return issue["repo"]
+    url = issue.get("repository_url") or ""
+    if "/repos/" in url:
+        return url.split("/repos/", 1)[1].strip("/")
+    return default
+
+
+def build_prompt(repoID: str, issue: dict, comments: List, max_chars: int) -> str:
+    """The evaluation prompt of an issue, with its body and comments cut to fit `max_chars`."""
+    labels = [label["name"] if isinstance(label, dict) else str(label) for label in issue.get("labels") or []]
+    parts = [f"Repo: {repoID}", f"Issue: #{issue['number']}", f"Title: {issue.get('title') or ''}",
+             f"Labels: {', '.join(labels) or 'none'}", f"Body:\n{issue.get('body') or ''}"]
+    for comment in comments:
+        if isinstance(comment, dict):
+            parts.append(f"Comment by {(comment.get('user') or {}).get('login', 'unknown')}:\n{comment.get('body') or ''}")
+        else:
+            parts.append(f"Comment:\n{comment}")
+    return "\n\n".join(parts)[:max_chars]
+
+
+def prepare(lines: List[str], default_repo: str, max_chars: int) -> List[Optional[dict]]:
+    """
+    Parse a chunk of dump lines and compute the prompt, features and heuristic rating of each
+    issue (runs in a worker process).
+
+    Returns:
+        list: Per line, the prepared issue ("repo", "number", "prompt", "features", "heuristic",
+        "confidence"), or None if the line is not an open issue.
+    """
+    prepared = []
+    for line in lines:
+        try:
+            issue = json.loads(line)
+            repoID = _repo_of(issue, default_repo)
+            if not repoID or "number" not in issue or "pull_request" in issue or issue.get("state", "open") != "open":
+                raise ValueError
+        except ValueError:
+            prepared.append(None)
+            continue
+        comments = issue.get("comments")
+        if isinstance(comments, list):
+            issue = {**issue, "comments": len(comments)}
+        else:
+            comments = []
+        features = heuristic.extract_features(issue)
+        rating, confidence = heuristic.scorer.score(issue, features) if heuristic.scorer is not None else (0, 0.0)
+        prepared.append({"repo": repoID, "number": int(issue["number"]), "prompt": build_prompt(repoID, issue, comments, max_chars),
+                         "features": features, "heuristic": rating, "confidence": confidence})
+    return prepared
+
+
+def iter_prepared(path: str, pool: ProcessPoolExecutor, processes: int, chunk_size: int,
+                  default_repo: str, max_chars: int) -> Iterator[Optional[dict]]:
+    """
+    Stream the prepared issues of a dump in file order. At most two chunks per process are read
+    ahead, so memory does not grow with the size of the dump.
+    """
+    pending = []
+    with open(path) as f:
+        while True:
+            lines = [line for _, line in zip(range(chunk_size), f)]
+            if lines:
+                pending.append(pool.submit(prepare, lines, default_repo, max_chars))
+            if pending and (len(pending) >= 2 * processes or not lines):
+                yield from pending.pop(0).result()
+            if not lines and not pending:
+                return
+
+
+class Rater:
+    """Rates prepared issues with the LLM: one call for the action items and one for the rating."""
+
+    def __init__(self):
+        from llm_gateway import GatewayChatOpenAI
+        from langgraph.prebuilt import create_react_agent
+        from metrics import LLMMetricsHandler
+        from rate_issue.agent import initialize_rating_agent
+
+        self.evaluation_agent = create_react_agent(
+            GatewayChatOpenAI(model="gpt-4o-mini", callbacks=[LLMMetricsHandler()]), tools=[], state_modifier=EVALUATION_PROMPT)
+        self.rating_agent, _ = initialize_rating_agent(None, None)
+
+    def _rate(self, prompt: str) -> Tuple[int, str]:
+        action_items = self.evaluation_agent.invoke({"messages": [prompt]})["messages"][-1].content
+        rating = self.rating_agent.invoke({"messages": [action_items]})["messages"][-1].content
+        return min(100, max(1, int(rating))), action_items
+
+    def rate(self, item: dict) -> dict:
+        """Rate an issue, retrying failures; returns the item with "rating" and "action_items", or "error"."""
+        for attempt in range(issue_attempts):
+            try:
+                item["rating"], item["action_items"] = self._rate(item["prompt"])
+                item["source"] = "llm"
+                return item
+            except Exception as e:
+                if attempt == issue_attempts - 1:
+                    item["error"] = f"{type(e).__name__}: {e}"
+                    return item
+                time.sleep(2 ** attempt)
+
+
+class Progress:
+    """Counts of the run and issues-per-second reporting."""
+
+    def __init__(self, interval: float):
+        self.counts = {"read": 0, "ignored": 0, "skipped": 0, "heuristic": 0, "llm": 0, "failed": 0}
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last = self.start
+
+    def add(self, outcome: str):
+        self.counts[outcome] += 1
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            print(self.line(now), file=sys.stderr)
+
+    def rated(self) -> int:
+        return self.counts["heuristic"] + self.counts["llm"]
+
+    def line(self, now: float) -> str:
+        elapsed = now - self.start
+        return (f"{elapsed:8.1f}s  {self.rated() / elapsed:8.2f} issues/s  "
+                + "  ".join(f"{name} {count}" for name, count in self.counts.items()))
+
+
+def rate_dump(args) -> dict:
+    conn = connect(args.db)
+    out = open(args.out, "a") if args.out else None
+    progress = Progress(args.report_interval)
+    rater = Rater() if not args.heuristic_only else None
+    writes = 0
+
+    def write(item: dict):
+        nonlocal writes
+        conn.execute("INSERT OR REPLACE INTO ratings (repo, number, rating, source, action_items, error, updated) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (item["repo"], item["number"], item.get("rating", 0), item.get("source", ""),
+                      item.get("action_items", ""), item.get("error"), int(time.time())))
+        writes += 1
+        # Checkpoint every `commit_every` ratings.
+        if writes % args.commit_every == 0:
+            conn.execute("COMMIT")
+            conn.execute("BEGIN")
+        if "error" in item:
+            progress.add("failed")
+            return
+        if out is not None:
+            out.write(json.dumps({"repo": item["repo"], "issue": item["number"], "rating": item["rating"],
+                                  "source": item["source"]}) + "\n")
+        if item["source"] == "llm":
+            heuristic.record_history(item["repo"], item["number"], item["features"], item["rating"])
+        progress.add(item["source"])
+
+    def finished(futures):
+        for future in futures:
+            write(future.result())
+
+    processes = args.processes or os.cpu_count() or 1
+    inflight = set()
+    with budget.track({"token_budget": args.token_budget, "cost_budget": args.cost_budget}) as usage, \
+            ProcessPoolExecutor(max_workers=processes) as pool, \
+            ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bulk-rate") as llm_pool:
+        conn.execute("BEGIN")
+        try:
+            for item in iter_prepared(args.dump, pool, processes, args.chunk_size, args.repo, args.max_chars):
+                progress.counts["read"] += 1
+                if item is None:
+                    progress.add("ignored")
+                    continue
+                if conn.execute("SELECT 1 FROM ratings WHERE repo = ? AND number = ? AND rating > 0",
+                                (item["repo"], item["number"])).fetchone():
+                    progress.add("skipped")
+                    continue
+                if rater is None or item["confidence"] >= heuristic.confidence_threshold or usage.mode() == budget.EXHAUSTED:
+                    if not item["heuristic"]:
+                        item["error"] = "no confident heuristic rating" if rater is None else "LLM budget exhausted"
+                    else:
+                        item["rating"], item["source"] = item["heuristic"], "heuristic"
+                    write(item)
+                    continue
+                if len(inflight) >= 2 * args.concurrency:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    finished(done)
+                # Each call gets its own copy of the context, so its LLM usage is charged to this run.
+                inflight.add(llm_pool.submit(contextvars.copy_context().run, rater.rate, item))
+            finished(wait(inflight).done)
+        finally:
+            conn.execute("COMMIT")
+            conn.close()
+            if out is not None:
+                out.close()
+    elapsed = time.perf_counter() - progress.start
+    return {**progress.counts, "seconds": round(elapsed, 3), "issues_per_second": round(progress.rated() / elapsed, 3),
+            "usage": usage.to_dict()}
+
+
+def commit_ratings(args) -> dict:
+    from interactions.deploy import update_issues
+    from interactions.read import get_repo_issues
+
+    offline = load_ratings(args.db, args.repo)
+    if not offline:
+        return {"error": f"No ratings of {args.repo} in {args.db}."}
+    # updateIssues replaces the repo's whole issue list and rating sum, so the issues already on
+    # the contract are committed again: offline ratings override theirs and add the new issues.
+    ratings = {int(number): int(rating) for number, rating in get_repo_issues(args.repo)}
+    onchain = len(ratings)
+    ratings.update(offline)
+    issueNumbers = [str(number) for number in ratings]
+    update_issues(args.repo, issueNumbers, [str(rating) for rating in ratings.values()], str(sum(ratings.values())))
+    return {"repo": args.repo, "issues": len(issueNumbers), "offline": len(offline), "kept": len(ratings) - len(offline),
+            "added": len(ratings) - onchain, "rating_sum": sum(ratings.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate exported issues offline and commit the ratings to the contract.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rate = commands.add_parser("rate", help="rate the issues of a JSON lines dump")
+    rate.add_argument("dump")
+    rate.add_argument("--db", default="offline_ratings.db", help="SQLite checkpoint and result database")
+    rate.add_argument("--out", help="also append the ratings to this JSON lines file")
+    rate.add_argument("--repo", default="", help="owner/repo of issues that do not name their repo")
+    rate.add_argument("--processes", type=int, help="prompt and feature workers (default: number of CPUs)")
+    rate.add_argument("--concurrency", type=int, default=limits.llm_concurrency, help="issues rated by the LLM at once (LLM calls are also limited by llm_gateway.py)")
+    rate.add_argument("--chunk-size", type=int, default=256, help="dump lines per worker task")
+    rate.add_argument("--max-chars", type=int, default=12000, help="longest evaluation prompt")
+    rate.add_argument("--commit-every", type=int, default=100, help="ratings per checkpoint")
+    rate.add_argument("--heuristic-only", action="store_true", help="only rate issues the heuristic is confident about, without the LLM")
+    rate.add_argument("--token-budget", type=int, default=0, help="LLM tokens for the whole run (0 = unlimited)")
+    rate.add_argument("--cost-budget", type=float, default=0, help="LLM cost in US dollars for the whole run (0 = unlimited)")
+    rate.add_argument("--report-interval", type=float, default=10, help="seconds between progress lines")
+
+    commit = commands.add_parser("commit", help="write the ratings of a repo to the contract with update_issues")
+    commit.add_argument("--db", default="offline_ratings.db")
+    commit.add_argument("--repo", required=True)
+
+    args = parser.parse_args()
+    result = rate_dump(args) if args.command == "rate" else commit_ratings(args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
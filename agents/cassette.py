@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import inspect
+import hashlib
+import argparse
+import threading
+from collections import deque
+from functools import wraps
+from dotenv import load_dotenv
+from typing_extensions import Any, Callable, Dict, Optional
+
+load_dotenv()
+
+# Record/replay of everything the pipeline does over the network: GitHub requests, LLM calls and
+# contract reads and writes. With CASSETTE set, "record" mode runs against the real services and
+# appends every interaction to the file; "replay" mode serves them back from it, with the recorded
+# latency ("original") or none ("zero"), and fails on any interaction that was not recorded.
+cassette_file = os.getenv("CASSETTE", "")
+cassette_mode = os.getenv("CASSETTE_MODE", "record")
+cassette_latency = os.getenv("CASSETTE_LATENCY", "original")
+
+
+class CassetteMiss(Exception):
+    """An interaction was not found in the cassette during replay."""
+
+
+class ReplayedError(Exception):
+    """An error recorded in the cassette, raised again during replay."""
+
+
+def _digest(kind: str, key: Any) -> str:
+    return hashlib.sha256(json.dumps([kind, key], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Cassette:
+    """
+    Interactions keyed by kind and request. Identical requests are replayed in the order they were
+    recorded, the last one repeatedly.
+    """
+
+    def __init__(self, path: str, mode: str, latency: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}.")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries: Dict[str, deque] = {}
+        if mode == "record":
+            # A recording starts from an empty cassette.
+            open(path, "w").close()
+        else:
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], deque()).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, kind: str, key: Any, result: Any = None, error: Optional[BaseException] = None, elapsed: float = 0.0):
+        entry = {"kind": kind, "key": _digest(kind, key), "elapsed": round(elapsed, 6), "result": result}
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        line = json.dumps(entry, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    def take(self, kind: str, key: Any) -> dict:
+        """The next recorded entry of a request; the caller waits its "elapsed" if replaying latency."""
+        with self.lock:
+            entries = self.entries.get(_digest(kind, key))
+            # The last recording of a request is replayed for all further identical requests,
+            # so a recorded run can be repeated, e.g. under load.
+            entry = (entries.popleft() if len(entries) > 1 else entries[0]) if entries else None
+        if entry is None:
+            raise CassetteMiss(f"No recorded {kind} interaction for {json.dumps(key, default=str)[:200]}")
+        return entry
+
+    def delay(self, entry: dict) -> float:
+        return entry["elapsed"] if self.latency == "original" else 0.0
+
+    @staticmethod
+    def result(entry: dict) -> Any:
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        return entry["result"]
+
+
+active: Optional[Cassette] = Cassette(cassette_file, cassette_mode, cassette_latency) if cassette_file else None
+
+
+def replaying() -> bool:
+    """Whether interactions are served from a cassette, i.e. no external service may be contacted."""
+    return active is not None and active.replaying
+
+
+def recorded(kind: str, key: Optional[Callable[..., Any]] = None,
+             encode: Optional[Callable[[Any], Any]] = None, decode: Optional[Callable[[Any], Any]] = None):
+    """
+    Decorate a function (or coroutine function) that talks to an external service so its calls are
+    recorded to or replayed from the active cassette. Without a cassette the function is called directly.
+
+    Args:
+        kind (str): Interaction kind, e.g. "github".
+        key (Callable): Maps the call arguments to the JSON-serializable request key; defaults to all arguments.
+        encode (Callable): Converts the result to JSON-serializable data for the cassette.
+        decode (Callable): Converts recorded data back to the result.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if active is None:
+                    return await fn(*args, **kwargs)
+                request = key(*args, **kwargs) if key is not None else [args, kwargs]
+                if active.replaying:
+                    entry = active.take(kind, request)
+                    await asyncio.sleep(active.delay(entry))
+                    result = active.result(entry)
+                    return decode(result) if decode is not None else result
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    active.record(kind, request, error=e, elapsed=time.perf_counter() - start)
+                    raise
+                active.record(kind, request, encode(result) if encode is not None else result, elapsed=time.perf_counter() - start)
+                return result
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return fn(*args, **kwargs)
+            request = key(*args, **kwargs) if key is not None else [args, kwargs]
+            if active.replaying:
+                entry = active.take(kind, request)
+                time.sleep(active.delay(entry))
+                result = active.result(entry)
+                return decode(result) if decode is not None else result
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                active.record(kind, request, error=e, elapsed=time.perf_counter() - start)
+                raise
+            active.record(kind, request, encode(result) if encode is not None else result, elapsed=time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+def _message_key(message) -> dict:
+    # Message ids are generated per run, so only the content that reaches the model is compared.
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": [{"name": call["name"], "args": call["args"], "id": call["id"]} for call in getattr(message, "tool_calls", None) or []],
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+def _install_llm():
+    # ChatOpenAI is created inside each agent module, so its calls are recorded at the class level.
+    from langchain_openai import ChatOpenAI
+    from langchain_core.messages import message_to_dict, messages_from_dict
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    def encode(result: ChatResult) -> dict:
+        return {
+            "generations": [{"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+                            for generation in result.generations],
+            "llm_output": result.llm_output,
+        }
+
+    def decode(data: dict) -> ChatResult:
+        messages = messages_from_dict([generation["message"] for generation in data["generations"]])
+        return ChatResult(
+            generations=[ChatGeneration(message=message, generation_info=generation["generation_info"])
+                         for message, generation in zip(messages, data["generations"])],
+            llm_output=data["llm_output"],
+        )
+
+    def key(self, messages, stop=None, run_manager=None, **kwargs):
+        return [self.model_name, [_message_key(message) for message in messages], stop]
+
+    ChatOpenAI._generate = recorded("llm", key, encode, decode)(ChatOpenAI._generate)
+
+
+if active is not None:
+    _install_llm()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one chain invocation while recording to or replaying from a cassette.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("cassette")
+    parser.add_argument("--state", required=True, help='chain input as JSON, e.g. \'{"owner": "o", "repo": "r", "action": "fetch"}\'')
+    parser.add_argument("--latency", choices=["original", "zero"], default="original", help="replayed latency")
+    parser.add_argument("--profile", action="store_true", help="write a profile of the run (see profiling.py)")
+    args = parser.parse_args()
+
+    # The modules imported below set up the cassette from the environment when first imported.
+    os.environ["CASSETTE"] = args.cassette
+    os.environ["CASSETTE_MODE"] = args.mode
+    os.environ["CASSETTE_LATENCY"] = args.latency
+    # Heuristic shadow sampling must pick the same issues when recording and replaying.
+    random.seed(0)
+
+    # Not through app.py: importing it starts the dashboard refresher (and maybe the scheduler),
+    # whose chain reads would be recorded, and replayed, in between those of the run.
+    from chain import init_chain
+    from ledger import IssueLedger
+    from profiling import profile
+    import budget
+
+    chain = init_chain()
+    invoke_config = {"recursion_limit": int(os.getenv("RECURSION_LIMIT", "100000"))}
+    state = json.loads(args.state)
+    start = time.perf_counter()
+    with budget.track(state) as usage:
+        if args.profile:
+            with profile(state.get("action") or "invoke") as profile_name:
+                final_state = chain.invoke(state, invoke_config)
+            print(f"Profile: {profile_name}", file=sys.stderr)
+        else:
+            final_state = chain.invoke(state, invoke_config)
+    print(f"{args.mode} finished in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    final_state = {key: value.to_dict() if isinstance(value, IssueLedger) else value for key, value in final_state.items()}
+    print(json.dumps({**final_state, "usage": usage.to_dict()}, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import os
 import json
-from typing_extensions import TypedDict, List, Dict
+import time
+from typing_extensions import TypedDict, Annotated, Dict, Optional, Tuple
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
@@ -8,8 +10,18 @@ from github.agent import initialize_github_agent
 from rate_issue.agent import initialize_rating_agent
 from agent import initialize_meta_agent
 from github.contribution import get_contribution
-from interactions.deploy import register_user, register_repo, update_issues, resolve_issue
-from interactions.read import get_repo_state, check_repo_registration
+from github.issues import get_all_open_issue_details
+from rate_issue.heuristic import pre_rate, prioritize, record_llm_rating, fallback_rating, release_pending
+from rate_issue import dedup
+from bulk_rate import imported_ratings
+from interactions.deploy import register_user, register_repo, update_issues, append_issues, resolve_issue
+from interactions.read import get_repo_state, get_repo_issues, check_repo_registration
+from interactions.registry import add_registered_repo
+from metrics import instrument_node, dedup_matches, budget_degraded
+from ledger import IssueLedger, merge_issues, merge_dicts
+from singleflight import repo_lock
+import runs
+import budget
 class State(TypedDict):
     # User input
     username: str
@@ -19,59 +31,215 @@ class State(TypedDict):
     remaining_budget: int
     action: str
     
+    # LLM budget of this run (see budget.py); 0 or missing uses the default
+    token_budget: int
+    cost_budget: float
+    
     # Issue that is being evaluated
     current_issue: int
     
     # Evaluation results for the issue
     action_items: str
     
-    # List of dictionaries mapping issue numbers to difficulty ratings
-    issues: List[Dict[int, int]]
+    # Issue numbers and their difficulty ratings (0 = not rated yet); nodes return only
+    # {issue number: rating} deltas, which the reducer applies to the ledger in place
+    issues: Annotated[IssueLedger, merge_issues]
     
     # Sum of all difficulty ratings  
     rating_sum: int
     
+    # Near-duplicate issues that reused the rating of an already rated issue
+    duplicates: Annotated[dict, merge_dicts]
+    
+    # Checkpointed fetch run (see runs.py) and the issues of this run that failed to be rated
+    run_id: str
+    failed: Annotated[dict, merge_dicts]
+    
+    # Issues rated without the LLM agents because the LLM budget ran out ("cached" or "heuristic")
+    degraded: Annotated[dict, merge_dicts]
+    
+    # Time box of a fetch, refresh or resume: stop rating after `time_budget` seconds or `max_issues`
+    # evaluated issues and commit what was rated; the run can be resumed for the rest
+    time_budget: float
+    max_issues: int
+    deadline: float
+    evaluated: int
+    
+    # Partial commits: rated issues are written to the contract every `commit_every` new ratings
+    # and/or `commit_interval` seconds while the run goes on (0 or missing uses the defaults)
+    commit_every: int
+    commit_interval: float
+    committed: int
+    committed_at: float
+    # Issues of the ledger's rating order on the contract since the first partial commit of this
+    # pipeline (0 before it); later partial commits append the issues rated after them
+    commit_mark: int
+    
     # Final message to be sent to the user or agent
     message: str
 
 memory = MemorySaver()
 config = {"configurable": {"thread_id": "1"}}
 
-github_agent,_ = initialize_github_agent(memory, config)
-def evaluate_issue(state: State):
+# Attempts per issue before it is marked failed; a failed issue does not abort the run and is
+# retried when the run is resumed.
+issue_attempts = int(os.getenv("ISSUE_ATTEMPTS", "3"))
+# Default partial commit policy (0 = commit only at the end of the run).
+default_commit_every = int(os.getenv("RUN_COMMIT_EVERY", "0"))
+default_commit_interval = float(os.getenv("RUN_COMMIT_INTERVAL", "0"))
+
+def with_retries(fn, *args):
+    for attempt in range(issue_attempts):
+        try:
+            return fn(*args)
+        except Exception:
+            if attempt == issue_attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+# The evaluation agents keep no conversation memory: every issue is evaluated from scratch,
+# and they can be invoked outside of a graph run (e.g. by batch.py).
+github_agent,_ = initialize_github_agent(None, config)
+def evaluate(owner: str, repo: str, issue: int, reduced: bool = False) -> Tuple[str, Optional[Dict]]:
+    """
+    Ask the github agent for the action items needed to resolve an issue.
+    A near-duplicate of an already rated issue reuses its action items (and rating) instead,
+    and a similar one is evaluated with the similar issue's action items as a hint, unless
+    `reduced` asks for a smaller prompt.
+    
+    Returns:
+        tuple: The action items, and the reused issue ("issue", "similarity", "rating") or None.
+    """
+    similar = dedup.find_similar(owner+"/"+repo, issue)
+    if similar is not None and similar["similarity"] >= dedup.reuse_threshold:
+        dedup_matches.inc(kind="reused")
+        return similar.pop("action_items"), similar
+    
+    prompt = f"Owner:{owner}, Repo:{repo}, Issue:{issue}"
+    if similar is not None and not reduced:
+        dedup_matches.inc(kind="seeded")
+        prompt += f"\nA similar issue #{similar['issue']} was evaluated before with these action items:\n{similar['action_items']}"
     action_items = github_agent.invoke(
-        {"messages": [f"Owner:{state['owner']}, Repo:{state['repo']}, Issue:{state['current_issue']}"]},
+        {"messages": [prompt]},
     )
-    return {"action_items": action_items["messages"][-1].content}
+    return action_items["messages"][-1].content, None
 
-rating_agent,_ = initialize_rating_agent(memory, config)
-def assign_rating(state: State):
+def rate_without_llm(state: State, issue: int):
+    # Out of LLM budget: reuse the rating of a similar rated issue, else take the heuristic's rating
+    # whatever its confidence; an issue neither can rate is left for a resumed run.
+    repoID = state["owner"]+"/"+state["repo"]
+    similar = dedup.find_similar(repoID, issue)
+    if similar is not None:
+        rating, outcome = similar["rating"], "cached"
+    else:
+        rating, outcome = fallback_rating(state["run_id"], issue), "heuristic"
+    if rating is None:
+        budget_degraded.inc(outcome="skipped")
+        runs.record_failure(state["run_id"], issue, "LLM budget exhausted")
+        return {"current_issue": issue, "failed": {issue: "LLM budget exhausted"}}
+    budget_degraded.inc(outcome=outcome)
+    runs.record_rating(state["run_id"], issue, rating)
+    return {"current_issue": issue, "issues": {issue: rating}, "degraded": {issue: outcome}}
+
+@instrument_node
+def evaluate_issue(state: State):
+    current_issue = state["issues"].next_pending(skip=state["failed"])
+    evaluated = {"evaluated": state.get("evaluated", 0) + 1}
+    mode = budget.mode()
+    if mode == budget.EXHAUSTED:
+        return {**rate_without_llm(state, current_issue), **evaluated}
+    try:
+        action_items, duplicate = with_retries(evaluate, state["owner"], state["repo"], current_issue, mode == budget.REDUCED)
+    except Exception as e:
+        runs.record_failure(state["run_id"], current_issue, str(e))
+        return {"current_issue": current_issue, "failed": {current_issue: str(e)}, **evaluated}
+    if duplicate is None:
+        return {"current_issue": current_issue, "action_items": action_items, **evaluated}
+    return {"current_issue": current_issue, "action_items": action_items, "duplicates": {current_issue: duplicate}, **evaluated}
+
+rating_agent,_ = initialize_rating_agent(None, config)
+def rate(action_items: str) -> int:
+    """Ask the rating agent for the difficulty rating of an issue given its action items."""
     rating = rating_agent.invoke(
-        {"messages": [f"{state['action_items']}"]},
+        {"messages": [f"{action_items}"]},
     )
-    issues = state.get("issues", {}) 
-    issues[state["current_issue"]] = int(rating["messages"][-1].content)
-    sum=0
-    for issue, rating_val in issues.items():
-        sum+=int(rating_val)
-        if rating_val == 0:
-            current_issue = issue
-            return {"issues": issues, "current_issue": current_issue, "action": "evaluate"}
-    issueNumbers=[str(num) for num in list(issues.keys())]
-    ratings=[str(num) for num in list(issues.values())]
-    update_issues(state["owner"]+"/"+state["repo"],issueNumbers,ratings,str(int(sum)))
-    return {"issues": issues,"action_items":"","current_issue":0, "action":"", "rating_sum":sum,"message":f"Total {len(issueNumbers)} issues are fetched and rated."}
+    return int(rating["messages"][-1].content)
+
+@instrument_node
+def assign_rating(state: State):
+    duplicate = (state.get("duplicates") or {}).get(state["current_issue"])
+    if duplicate is not None:
+        rating = duplicate["rating"]
+    else:
+        action_items = state["action_items"]
+        if budget.mode() != budget.FULL:
+            # Close to or over budget: the issue was evaluated already, rate it on a shorter prompt.
+            action_items = action_items[:budget.reduced_context_chars]
+        try:
+            rating = with_retries(rate, action_items)
+        except Exception as e:
+            runs.record_failure(state["run_id"], state["current_issue"], str(e))
+            return {"failed": {state["current_issue"]: str(e)}}
+        record_llm_rating(state["owner"]+"/"+state["repo"], state["run_id"], state["current_issue"], rating)
+        dedup.add_rated(state["owner"]+"/"+state["repo"], state["current_issue"], rating, state["action_items"])
+    runs.record_rating(state["run_id"], state["current_issue"], rating)
+    return {"issues": {state["current_issue"]: rating}}
+
+@instrument_node
+def commit_issues(state: State):
+    # update repo state in smart contract; issues that failed to be rated are left out until the run is resumed
+    issues = state["issues"]
+    issueNumbers, ratings = issues.to_lists(rated_only=True)
+    update_issues(state["owner"]+"/"+state["repo"],issueNumbers,ratings,str(int(issues.rating_sum)))
+    dedup.unstage(state["owner"]+"/"+state["repo"], [number for number, _ in issues.items()])
+    release_pending(state["run_id"])
+    message = f"Total {len(issueNumbers)} issues are fetched and rated."
+    # issues neither rated nor failed were cut off by the time box
+    unrated = issues.unrated - sum(1 for issue in state["failed"] if issues.get(issue) == 0)
+    if unrated:
+        message += f" {unrated} issues were left unrated by the time box and can be rated by resuming run {state['run_id']}."
+    if state["failed"]:
+        message += f" {len(state['failed'])} issues failed and can be retried by resuming run {state['run_id']}."
+        runs.set_status(state["run_id"], runs.FAILED, message)
+    elif unrated:
+        runs.set_status(state["run_id"], runs.PARTIAL, message)
+    else:
+        runs.set_status(state["run_id"], runs.COMMITTED, message)
+    return {"action_items":"","current_issue":0, "action":"", "rating_sum":issues.rating_sum,"message":message}
+
+@instrument_node
+def partial_commit(state: State):
+    # commit the issues rated so far while the run goes on, so they can be funded right away; the first
+    # commit replaces the repo's issues, later ones only add the issues rated since, so a long run does
+    # not write its whole issue list again every time
+    issues = state["issues"]
+    if not state.get("commit_mark"):
+        issueNumbers, ratings = issues.to_lists(rated_only=True)
+        update_issues(state["owner"]+"/"+state["repo"],issueNumbers,ratings,str(int(issues.rating_sum)))
+    else:
+        issueNumbers, ratings = issues.rated_since(state["commit_mark"])
+        append_issues(state["owner"]+"/"+state["repo"],issueNumbers,ratings)
+    return {"committed": len(issues) - issues.unrated, "committed_at": time.time(), "commit_mark": len(issues.rated)}
+
+def time_box(state: State, issues: IssueLedger) -> dict:
+    # start of the rating phase of a run: its deadline and the partial commit baseline
+    now = time.time()
+    return {"deadline": now + state["time_budget"] if state.get("time_budget") else 0.0, "evaluated": 0,
+            "committed": len(issues) - issues.unrated, "committed_at": now, "commit_mark": 0}
 
 meta_agent,_ = initialize_meta_agent(memory, config)
+@instrument_node
 def meta_agent_routing(state: State):
     if state["action"] == "register user":
         register_user(state["username"],state["address"])
         return {"action":"","message":f"User {state["username"]} registered with address {state["address"]}."}
     elif state["action"] == "register repo":
         if check_repo_registration(state["owner"]+"/"+state["repo"]):
+            add_registered_repo(state["owner"]+"/"+state["repo"])
             return {"action":"","message":f"Repo {state["owner"]+"/"+state["repo"]} already registered."}
         
         register_repo(state["owner"],state["repo"])
+        add_registered_repo(state["owner"]+"/"+state["repo"])
         return {"action":"", "message":f"Repo {state["owner"]+"/"+state["repo"]} successfully registered."}
     elif state["action"] == "fetch":
         response =  meta_agent.invoke(
@@ -81,21 +249,73 @@ def meta_agent_routing(state: State):
         action=json_response["ACTION"]
         result=json_response["RESULT"]
         
-        if action == "FETCH":
-            issues = {issue: 0 for issue in result}
-            current_issue = 0
-            for issue, rating in issues.items():
-                if rating == 0:
-                    current_issue = issue
-                    return {"issues": issues, "current_issue": current_issue, "action": "evaluate"}
-        else: 
-            print("Invalid action")
+        if action != "FETCH":
+            return {"action":"", "message":"Invalid action"}
         
-        # update repo state in smart contract
-        issueNumbers=[str(num) for num in list(issues.keys())]
-        ratings=[str(num) for num in list(issues.values())]
-        update_issues(state["owner"]+"/"+state["repo"],issueNumbers,ratings,str(int(state["rating_sum"])))
-        return {"issues":issues, "action":"","message":f"Total {len(issueNumbers)} issues are fetched and rated."}
+        # Issues are rated most valuable first (labels, reactions, recent activity); issues rated
+        # offline (see bulk_rate.py) keep that rating
+        details = get_all_open_issue_details(state["owner"], state["repo"])
+        rank = {number: position for position, number in enumerate(prioritize(details))}
+        offline = imported_ratings(state["owner"]+"/"+state["repo"])
+        issues = {issue: offline.get(issue, 0) for issue in sorted(result, key=lambda issue: rank.get(int(issue), len(rank)))}
+        # Issues the heuristic pre-scorer is confident about get their rating here and skip the LLM agents;
+        # the others are matched against already rated near-duplicates when they are evaluated
+        run_id = state.get("run_id") or runs.new_run_id()
+        pre_rate(state["owner"]+"/"+state["repo"], run_id, details, issues)
+        dedup.stage(state["owner"]+"/"+state["repo"], [issue for issue in details if issues.get(issue["number"]) == 0])
+        try:
+            runs.create_run(run_id, state["owner"]+"/"+state["repo"], issues)
+        except ValueError as e:
+            return {"action":"", "message":str(e)}
+        ledger = IssueLedger(issues)
+        return {"issues": ledger, "run_id": run_id, "action": "evaluate", **time_box(state, ledger)}
+    
+    elif state["action"] == "refresh":
+        # Incremental fetch without the meta agent: open issues already rated on the contract keep
+        # their rating, closed ones are dropped and only new issues are evaluated
+        repoID = state["owner"]+"/"+state["repo"]
+        rated = dict(get_repo_issues(repoID))
+        details = get_all_open_issue_details(state["owner"], state["repo"])
+        offline = imported_ratings(repoID)
+        issues = {number: rated.get(number) or offline.get(number, 0) for number in prioritize(details)}
+        if issues == rated:
+            return {"action":"", "message":f"Repo {repoID} is up to date."}
+        new = [issue for issue in details if issues[issue["number"]] == 0]
+        run_id = state.get("run_id") or runs.new_run_id()
+        pre_rate(repoID, run_id, new, issues)
+        dedup.stage(repoID, [issue for issue in new if issues[issue["number"]] == 0])
+        try:
+            runs.create_run(run_id, repoID, issues)
+        except ValueError as e:
+            return {"action":"", "message":str(e)}
+        ledger = IssueLedger(issues)
+        return {"issues": ledger, "run_id": run_id, "action": "evaluate", **time_box(state, ledger)}
+    
+    elif state["action"] == "resume":
+        run = runs.load_run(state["run_id"])
+        if run is None:
+            return {"action":"", "message":f"Run {state['run_id']} not found."}
+        repoID, status, issues, _ = run
+        if status == runs.COMMITTED:
+            return {"action":"", "message":f"Run {state['run_id']} is already committed."}
+        # continue with the issues not rated yet, failed ones included; two pipelines must never
+        # write the same run
+        if not runs.claim_run(state["run_id"]):
+            return {"action":"", "message":f"Run {state['run_id']} is still running."}
+        owner, repo = repoID.split("/", 1)
+        return {"owner": owner, "repo": repo, "issues": issues, "action": "evaluate", **time_box(state, issues)}
+    
+    elif state["action"] == "flush":
+        run = runs.load_run(state["run_id"])
+        if run is None:
+            return {"action":"", "message":f"Run {state['run_id']} not found."}
+        repoID, status, issues, failed = run
+        # commit the ratings collected so far; the run itself can still be resumed
+        issueNumbers, ratings = issues.to_lists(rated_only=True)
+        update_issues(repoID,issueNumbers,ratings,str(int(issues.rating_sum)))
+        owner, repo = repoID.split("/", 1)
+        return {"owner": owner, "repo": repo, "issues": issues, "failed": failed, "rating_sum": issues.rating_sum, "action":"",
+                "message":f"{len(issueNumbers)} of {len(issues)} issues of run {state['run_id']} ({status}) committed."}
         
     elif state["action"] == "resolve":
         contribution = get_contribution(owner=state["owner"], repo=state["repo"], pr=state["current_issue"])
@@ -106,13 +326,15 @@ def meta_agent_routing(state: State):
         elif contribution["issue_state"]=="open":
             return {"message": f"Linked issue {contribution['linked issue']} is still open.", "action":""}
         
-        # mark issue resolved and pay contributor through smart contract
-        amount=calculate_reward_amount(state["owner"]+"/"+state["repo"],contribution["linked issue"])
+        # mark issue resolved and pay contributor through smart contract; the reward is computed from
+        # the repo's current budget, so no other write to the repo may happen in between
+        with repo_lock(state["owner"]+"/"+state["repo"]):
+            amount=calculate_reward_amount(state["owner"]+"/"+state["repo"],contribution["linked issue"])
+            
+            if amount is None:
+                return {"message": f"Linked issue {contribution['linked issue']} is has no reward assigned.", "action":""}
         
-        if amount is None:
-            return {"message": f"Linked issue {contribution['linked issue']} is has no reward assigned.", "action":""}
-    
-        resolve_issue(state["owner"]+"/"+state["repo"],str(contribution["linked issue"]),contribution["author"],str(amount))
+            resolve_issue(state["owner"]+"/"+state["repo"],str(contribution["linked issue"]),contribution["author"],str(amount))
         
         return {"action":"", "message":f"Issue #{contribution["linked issue"]} resolved and {amount} paid to {contribution["author"]}."}
     
@@ -120,10 +342,36 @@ def next_step(state: State):
     if state["action"] == "fetch":
         return "meta_agent_routing"
     elif state["action"] == "evaluate":
-        return "evaluate_issue"
+        return next_issue_step(state)
     elif state["action"] == "":
         return END
 
+def time_boxed_out(state: State) -> bool:
+    if state.get("deadline") and time.time() >= state["deadline"]:
+        return True
+    return bool(state.get("max_issues")) and state.get("evaluated", 0) >= state["max_issues"]
+
+def partial_commit_due(state: State) -> bool:
+    issues = state["issues"]
+    new = len(issues) - issues.unrated - state.get("committed", 0)
+    if new <= 0:
+        return False
+    every = state.get("commit_every") or default_commit_every
+    interval = state.get("commit_interval") or default_commit_interval
+    return bool(every and new >= every) or bool(interval and time.time() - state.get("committed_at", 0) >= interval)
+
+def next_issue_step(state: State):
+    if state["issues"].next_pending(skip=state["failed"]) is None or time_boxed_out(state):
+        return "commit_issues"
+    if partial_commit_due(state):
+        return "partial_commit"
+    return "evaluate_issue"
+
+def evaluated_step(state: State):
+    if state["current_issue"] in state["failed"] or state["current_issue"] in state["degraded"]:
+        return next_issue_step(state)
+    return "assign_rating"
+
 
 def init_chain():
     workflow = StateGraph(State)
@@ -131,11 +379,15 @@ def init_chain():
     workflow.add_node(meta_agent_routing)
     workflow.add_node(evaluate_issue)
     workflow.add_node(assign_rating)
+    workflow.add_node(commit_issues)
+    workflow.add_node(partial_commit)
 
     workflow.add_edge(START, "meta_agent_routing")
-    workflow.add_conditional_edges("meta_agent_routing", next_step, ["evaluate_issue", END])
-    workflow.add_edge("evaluate_issue", "assign_rating")
-    workflow.add_conditional_edges("assign_rating", next_step, ["evaluate_issue", END])
+    workflow.add_conditional_edges("meta_agent_routing", next_step, ["evaluate_issue", "partial_commit", "commit_issues", END])
+    workflow.add_conditional_edges("evaluate_issue", evaluated_step, ["assign_rating", "evaluate_issue", "partial_commit", "commit_issues"])
+    workflow.add_conditional_edges("assign_rating", next_issue_step, ["evaluate_issue", "partial_commit", "commit_issues"])
+    workflow.add_conditional_edges("partial_commit", next_issue_step, ["evaluate_issue", "commit_issues"])
+    workflow.add_edge("commit_issues", END)
 
     chain = workflow.compile()
     return chain
@@ -172,7 +424,7 @@ if __name__ == '__main__':
     
     print("Fetching issues....")
     state={"owner": "grafana", "repo": "grafana-app-sdk", "action": "fetch"}
-    state = chain.invoke(state,{"recursion_limit": 100})
+    state = chain.invoke(state,{"recursion_limit": 100000})
     print("Final state:", state)
     
     # print("Resolving issue....")
@@ -0,0 +1,52 @@
+import zlib
+from typing_extensions import Iterable, Iterator, Optional
+
+# zstd is optional; without the zstandard package responses are offered as gzip only.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are sent uncompressed.
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """
+    The content coding to answer with, from the request's Accept-Encoding (werkzeug MIMEAccept):
+    "zstd", "gzip", or None for an uncompressed body.
+    """
+    offered = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    return accept_encodings.best_match(offered)
+
+
+def _compressor(encoding: str):
+    # (compress, flush the data so far, finish the stream)
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        return compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+    raise ValueError(f"Unsupported content coding {encoding}.")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a whole body."""
+    compress_chunk, _, finish = _compressor(encoding)
+    return compress_chunk(body) + finish()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Compress a streamed body. Every chunk is flushed on its own, so the client can decode each
+    one as soon as it arrives instead of waiting for the compressor's buffer to fill.
+    """
+    compress_chunk, flush, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = compress_chunk(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
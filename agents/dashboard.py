@@ -0,0 +1,294 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from queue import Queue, Empty
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing_extensions import Callable, Dict, List, Optional, Tuple
+
+from interactions.read import get_repo_state
+from interactions.registry import get_registered_repos
+from interactions import deploy
+import snapshot
+
+load_dotenv()
+
+# Local copy of the contract state and payouts the dashboard endpoints are served from, and how
+# often every registered repo is re-read from the chain (writes made by the agent refresh the
+# affected repo right away; deposits made directly to the contract show up on the next refresh).
+dashboard_db = os.getenv("DASHBOARD_DB", "dashboard.db")
+refresh_interval = float(os.getenv("DASHBOARD_REFRESH", "300"))
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Responses smaller than this are not worth compressing.
+GZIP_MIN_SIZE = 1024
+# Rendered responses kept in memory.
+RENDERED_MAX = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    repo TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payouts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    issue INTEGER NOT NULL,
+    amount TEXT NOT NULL,
+    time INTEGER NOT NULL
+);
+"""
+
+
+def _page(items: list, page: int, per_page: int) -> dict:
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    page = max(1, page)
+    start = (page - 1) * per_page
+    return {"items": items[start:start + per_page], "page": page, "per_page": per_page, "total": len(items)}
+
+
+class DashboardCache:
+    """
+    Repo state, issue ratings with projected rewards, and contributor payouts, kept in memory and in
+    SQLite and refreshed from the chain in the background, so that dashboard requests never wait on
+    the RPC endpoint or GitHub.
+
+    Rendered responses are memoized per scope (all repos, one repo, one contributor, the ratings
+    snapshot) and rebuilt only after that scope changed.
+
+    After a batch of refreshes changed ratings, they are also written to the columnar ratings
+    snapshot (snapshot.py), which the cross-repo aggregates are computed from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # repoID -> summary with "issues": [[number, rating, projected reward], ...]
+        self.repos: Dict[str, dict] = {}
+        # username -> payouts, newest first
+        self.payouts: Dict[str, List[dict]] = {}
+        # repoID -> total paid out, in wei
+        self.paid: Dict[str, int] = {}
+        # repoID -> issue number -> when it last got its current rating
+        self.rated_at: Dict[str, Dict[int, int]] = {}
+        # Memory-mapped ratings snapshot the aggregates are computed from, and whether the ratings
+        # changed since it was written.
+        self.snapshot: Optional[snapshot.Snapshot] = None
+        self.snapshot_stale = False
+        self.versions: Dict[str, int] = {}
+        self.rendered = OrderedDict()
+        self.queue = Queue()
+        self.queued = set()
+        self.conn = None
+        self.thread = None
+
+    def start(self, refresh: bool = True):
+        """Load the persisted cache and, unless `refresh` is False, start refreshing it in the background."""
+        with self.lock:
+            if self.conn is not None:
+                return
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            for repoID, state in self.conn.execute("SELECT repo, state FROM repos"):
+                self.repos[repoID] = json.loads(state)
+            for username, repoID, issue, amount, paid_at in self.conn.execute(
+                    "SELECT username, repo, issue, amount, time FROM payouts ORDER BY id DESC"):
+                self.payouts.setdefault(username, []).append({"repo": repoID, "issue": issue, "amount": amount, "time": paid_at})
+                self.paid[repoID] = self.paid.get(repoID, 0) + int(amount)
+            self.snapshot = snapshot.load()
+            for repoID, repo in self.repos.items():
+                issues = self.snapshot.issues(repoID) if self.snapshot is not None else None
+                if issues is not None:
+                    self.rated_at[repoID] = {number: updated_at for number, _, _, updated_at in issues}
+                else:
+                    self.rated_at[repoID] = {number: repo["updated"] for number, _, _ in repo["issues"]}
+                    self.snapshot_stale = True
+            if not refresh:
+                return
+            self.thread = threading.Thread(target=self._run, name="dashboard-refresh", daemon=True)
+            self.thread.start()
+        deploy.write_listeners.append(self.contract_written)
+
+    def _bump(self, *scopes: str):
+        # caller holds self.lock
+        for scope in scopes:
+            self.versions[scope] = self.versions.get(scope, 0) + 1
+
+    def has_repo(self, repoID: str) -> bool:
+        """Whether the state of a repo is cached."""
+        with self.lock:
+            return repoID in self.repos
+
+    def request_refresh(self, repoID: str):
+        """Re-read a repo from the chain in the background."""
+        with self.lock:
+            if repoID in self.queued:
+                return
+            self.queued.add(repoID)
+        self.queue.put(repoID)
+
+    def contract_written(self, method: str, args: dict):
+        repoID = args.get("repoName")
+        if method == "resolveIssue":
+            self.record_payout(repoID, int(args["issueNumber"]), args["githubUsername"], int(args["amount"]))
+        if repoID:
+            self.request_refresh(repoID)
+
+    def record_payout(self, repoID: str, issue: int, username: str, amount: int):
+        payout = {"repo": repoID, "issue": issue, "amount": str(amount), "time": int(time.time())}
+        with self.lock:
+            self.conn.execute("INSERT INTO payouts (username, repo, issue, amount, time) VALUES (?, ?, ?, ?, ?)",
+                              (username, repoID, issue, str(amount), payout["time"]))
+            self.payouts.setdefault(username, []).insert(0, payout)
+            self.paid[repoID] = self.paid.get(repoID, 0) + amount
+            if repoID in self.repos:
+                self.repos[repoID]["paid_out"] = str(self.paid[repoID])
+            self._bump("repos", f"repo:{repoID}", f"user:{username}")
+
+    def refresh(self, repoID: str):
+        state = get_repo_state(repoID)
+        remaining_budget, rating_sum = int(state["remaining_budget"]), int(state["total_rating"])
+        issues = [[int(number), int(rating), str(remaining_budget * int(rating) // rating_sum if rating_sum else 0)]
+                  for number, rating in state["issues"]]
+        summary = {
+            "repo": repoID,
+            "owner": state["owner"],
+            "remaining_budget": str(remaining_budget),
+            "rating_sum": rating_sum,
+            "issue_count": len(issues),
+            "updated": int(time.time()),
+            "issues": issues,
+        }
+        with self.lock:
+            summary["paid_out"] = str(self.paid.get(repoID, 0))
+            previous = {number: rating for number, rating, _ in self.repos.get(repoID, {}).get("issues", [])}
+            rated_at = self.rated_at.get(repoID, {})
+            self.rated_at[repoID] = {number: rated_at.get(number, summary["updated"]) if previous.get(number) == rating else summary["updated"]
+                                     for number, rating, _ in issues}
+            self.snapshot_stale = self.snapshot_stale or self.repos.get(repoID, {}).get("issues") != issues
+            self.conn.execute("INSERT OR REPLACE INTO repos (repo, state, updated) VALUES (?, ?, ?)",
+                              (repoID, json.dumps(summary), summary["updated"]))
+            self.repos[repoID] = summary
+            self._bump("repos", f"repo:{repoID}")
+
+    def write_snapshot(self):
+        """Write the ratings snapshot and map the new one."""
+        with self.lock:
+            repos = {repoID: [(number, rating, int(reward), self.rated_at[repoID].get(number, repo["updated"]))
+                              for number, rating, reward in repo["issues"]]
+                     for repoID, repo in self.repos.items()}
+            self.snapshot_stale = False
+        snapshot.write(snapshot.snapshot_file, repos)
+        mapped = snapshot.Snapshot(snapshot.snapshot_file)
+        with self.lock:
+            self.snapshot = mapped
+            self._bump("snapshot")
+
+    def _run(self):
+        # Warm start: repos refreshed less than DASHBOARD_REFRESH ago are not read again on startup.
+        with self.lock:
+            fresh = {repoID for repoID, repo in self.repos.items() if time.time() - repo["updated"] < refresh_interval}
+        next_full = 0.0
+        while True:
+            if time.monotonic() >= next_full:
+                for repoID in get_registered_repos():
+                    if repoID not in fresh:
+                        self.request_refresh(repoID)
+                fresh = set()
+                next_full = time.monotonic() + refresh_interval
+            if self.snapshot_stale and self.queue.empty():
+                # Written once a batch of refreshes is done, e.g. after the writes of a run.
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    self.snapshot_stale = True
+                    print(f"Writing the ratings snapshot failed: {e}")
+            try:
+                repoID = self.queue.get(timeout=max(0.0, next_full - time.monotonic()))
+            except Empty:
+                continue
+            with self.lock:
+                self.queued.discard(repoID)
+            try:
+                self.refresh(repoID)
+            except Exception as e:
+                # Keep serving the last known state; the next refresh retries.
+                print(f"Dashboard refresh of {repoID} failed: {e}")
+
+    def render(self, scope: str, key: str, build: Callable[[], Optional[dict]]) -> Optional[Tuple[bytes, str, Optional[bytes]]]:
+        """
+        Return the JSON body, its ETag and its gzipped body (None if too small to bother) of a
+        response, rebuilding it only if its scope changed since it was last rendered.
+
+        Returns:
+            tuple: (body, etag, gzipped body), or None if `build` found nothing.
+        """
+        with self.lock:
+            version = self.versions.get(scope, 0)
+            rendered = self.rendered.get(key)
+            if rendered is not None and rendered[0] == version:
+                self.rendered.move_to_end(key)
+                return rendered[1]
+            payload = build()
+        if payload is None:
+            return None
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+        with self.lock:
+            self.rendered[key] = (version, (body, etag, gzipped))
+            self.rendered.move_to_end(key)
+            while len(self.rendered) > RENDERED_MAX:
+                self.rendered.popitem(last=False)
+        return body, etag, gzipped
+
+    # The builders below run under self.lock (called from render).
+
+    def _summary(self, repoID: str) -> Optional[dict]:
+        repo = self.repos.get(repoID)
+        if repo is None:
+            return None
+        return {key: value for key, value in repo.items() if key != "issues"}
+
+    def list_repos(self, page: int, per_page: int) -> dict:
+        return _page([self._summary(repoID) for repoID in sorted(self.repos)], page, per_page)
+
+    def repo_summary(self, repoID: str) -> Optional[dict]:
+        return self._summary(repoID)
+
+    def repo_issues(self, repoID: str, page: int, per_page: int) -> Optional[dict]:
+        repo = self.repos.get(repoID)
+        if repo is None:
+            return None
+        result = _page(repo["issues"], page, per_page)
+        result["items"] = [{"issue": number, "rating": rating, "reward": reward} for number, rating, reward in result["items"]]
+        return result
+
+    def top_issues(self, n: int, repoID: Optional[str] = None) -> Optional[dict]:
+        if self.snapshot is None or (repoID is not None and self.snapshot.rows(repoID) is None):
+            return None
+        return {"items": self.snapshot.top_issues(max(1, min(n, MAX_PAGE_SIZE)), repoID), "snapshot": self.snapshot.created}
+
+    def rating_histogram(self, repoID: str, bins: int) -> Optional[dict]:
+        histogram = self.snapshot.rating_histogram(repoID, max(1, min(bins, 100))) if self.snapshot is not None else None
+        if histogram is None:
+            return None
+        counts, edges = histogram
+        return {"repo": repoID, "edges": edges.tolist(), "counts": counts.tolist(), "snapshot": self.snapshot.created}
+
+    def contributor_payouts(self, username: str, page: int, per_page: int) -> dict:
+        payouts = self.payouts.get(username, [])
+        result = _page(payouts, page, per_page)
+        result["total_paid"] = str(sum(int(payout["amount"]) for payout in payouts))
+        return result
+
+
+cache = DashboardCache(dashboard_db)
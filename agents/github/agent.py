@@ -1,12 +1,13 @@
 import sys
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
+from llm_gateway import GatewayChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 from langchain_core.messages import HumanMessage
 
 from github.issues import get_issue,get_all_issue_comments,get_issue_lable_names
+from metrics import LLMMetricsHandler
 
 # Load environment variables (OpenAI token)
 load_dotenv()
@@ -14,7 +15,7 @@ load_dotenv()
 def initialize_github_agent(memory, config):
     """Initialize the agent with github tools."""
     # Initialize LLM.
-    llm = ChatOpenAI(model="gpt-4o-mini")
+    llm = GatewayChatOpenAI(model="gpt-4o-mini", callbacks=[LLMMetricsHandler()])
 
     # Create ReAct Agent using the LLM and CDP Agentkit tools.
     return create_react_agent(
@@ -0,0 +1,205 @@
+import os
+import asyncio
+import threading
+from dotenv import load_dotenv
+from typing_extensions import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+import httpx
+
+import limits
+from cassette import recorded
+from metrics import timed, github_seconds, github_errors, github_requests
+
+load_dotenv()
+
+API_URL = "https://api.github.com"
+# All requests to api.github.com are multiplexed as HTTP/2 streams over one connection (requires
+# the h2 package); GITHUB_HTTP2=false falls back to a pool of HTTP/1.1 connections.
+http2 = os.getenv("GITHUB_HTTP2", "true").lower() == "true"
+request_timeout = float(os.getenv("GITHUB_TIMEOUT", "30"))
+
+T = TypeVar("T")
+
+
+def _encode_response(response: httpx.Response) -> dict:
+    return {"url": str(response.request.url), "status": response.status_code, "headers": dict(response.headers),
+            "content": response.content.decode("utf-8", "replace")}
+
+
+def _decode_response(data: dict) -> httpx.Response:
+    # Recorded content is already decoded, so the encoding headers no longer apply.
+    headers = {name: value for name, value in data["headers"].items() if name.lower() not in ("content-encoding", "content-length")}
+    return httpx.Response(data["status"], headers=headers, content=data["content"].encode(),
+                          request=httpx.Request("GET", data["url"]))
+
+
+def _last_page(response: httpx.Response) -> Optional[int]:
+    last = response.links.get("last", {}).get("url")
+    return int(httpx.URL(last).params.get("page", 1)) if last else None
+
+
+class GitHubClient:
+    """
+    Asynchronous GitHub REST client for one event loop.
+
+    At most `concurrency` requests are in flight at once (the rest wait on a semaphore, not on a
+    thread), and with HTTP/2 they share a single connection, so thousands of requests can be
+    awaited together at the cost of a coroutine each.
+
+    Use as `async with GitHubClient() as github: ...`, or from synchronous code through run().
+    """
+
+    def __init__(self, token: Optional[str] = None, concurrency: int = limits.github_concurrency):
+        self.token = token or os.getenv("GITHUB_TOKEN")
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=API_URL,
+            http2=http2,
+            timeout=request_timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            headers={"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"},
+        )
+
+    async def __aenter__(self) -> "GitHubClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    # The token is not part of the key, so a cassette replays with any GITHUB_TOKEN.
+    @recorded("github", key=lambda self, path, params, etag=None: [API_URL + path, params] + ([etag] if etag else []),
+              encode=_encode_response, decode=_decode_response)
+    async def _send(self, path: str, params: Optional[dict], etag: Optional[str] = None) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {self.token}"}
+        if etag:
+            headers["If-None-Match"] = etag
+        return await self.client.get(path, params=params, headers=headers)
+
+    async def get(self, endpoint: str, path: str, params: Optional[dict] = None, etag: Optional[str] = None) -> httpx.Response:
+        """
+        Make a GET request to the GitHub API and record its latency and response status.
+
+        Args:
+            endpoint (str): Short name of the API endpoint, used as the metrics label.
+            path (str): Request path, e.g. "/repos/{owner}/{repo}/issues".
+            params (dict): Query parameters.
+            etag (str): ETag of an earlier response; if the resource did not change, GitHub answers
+                304 Not Modified (which does not count against the rate limit).
+
+        Returns:
+            httpx.Response: The response, with raise_for_status() already applied (a 304 answer
+            to a conditional request is returned as is).
+
+        Raises:
+            ValueError: If the GITHUB_TOKEN is not set.
+            httpx.HTTPStatusError: If the request failed.
+        """
+        if not self.token:
+            raise ValueError("GITHUB_TOKEN not set in environment variables")
+        async with self.semaphore:
+            with timed(github_seconds, github_errors, span_name=f"github {endpoint}", endpoint=endpoint):
+                response = await self._send(path, params, etag)
+                github_requests.inc(endpoint=endpoint, status=response.status_code)
+                if not (etag and response.status_code == 304):
+                    response.raise_for_status()
+        return response
+
+    async def paginate(self, endpoint: str, path: str, params: Optional[dict] = None, per_page: int = 100) -> AsyncIterator[list]:
+        """
+        Yield the pages of a list endpoint in order. Once the first page tells how many there are
+        (Link header), all remaining pages are requested at once.
+        """
+        params = {**(params or {}), "per_page": per_page}
+        first = await self.get(endpoint, path, {**params, "page": 1})
+        yield first.json()
+        last = _last_page(first)
+        if last is None:
+            return
+        pages = [asyncio.ensure_future(self.get(endpoint, path, {**params, "page": page})) for page in range(2, last + 1)]
+        try:
+            for page in pages:
+                yield (await page).json()
+        finally:
+            for page in pages:
+                page.cancel()
+
+    async def open_issues(self, owner: str, repo: str, per_page: int = 100) -> AsyncIterator[dict]:
+        """Yield the open issues of a repository (issues endpoint JSON objects), pull requests excluded."""
+        async for page in self.paginate("issues", f"/repos/{owner}/{repo}/issues", {"state": "open"}, per_page):
+            for issue in page:
+                if "pull_request" not in issue:
+                    yield issue
+
+    async def issue(self, owner: str, repo: str, issue_number: int) -> dict:
+        """The JSON object of an issue."""
+        return (await self.get("issue", f"/repos/{owner}/{repo}/issues/{issue_number}")).json()
+
+    async def issue_comments(self, owner: str, repo: str, issue_number: int, per_page: int = 100) -> AsyncIterator[dict]:
+        """Yield the comments of an issue, oldest first."""
+        async for page in self.paginate("issue_comments", f"/repos/{owner}/{repo}/issues/{issue_number}/comments", per_page=per_page):
+            for comment in page:
+                yield comment
+
+    async def issue_labels(self, owner: str, repo: str, issue_number: int) -> List[str]:
+        """The label names of an issue."""
+        labels = (await self.get("issue_labels", f"/repos/{owner}/{repo}/issues/{issue_number}/labels")).json()
+        return [label["name"] for label in labels]
+
+    async def latest_activity(self, owner: str, repo: str, etag: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        Cheaply check a repository for issue activity: one conditional request for its most
+        recently updated issue or pull request (any state).
+
+        Args:
+            etag (str): The ETag this method returned last time, if any.
+
+        Returns:
+            tuple: The new ETag and the "updated_at" time of the latest issue ("" if it has none),
+            or None if nothing changed since `etag`.
+        """
+        response = await self.get("issues_activity", f"/repos/{owner}/{repo}/issues",
+                                  {"state": "all", "sort": "updated", "direction": "desc", "per_page": 1}, etag)
+        if response.status_code == 304:
+            return None
+        latest = response.json()
+        return response.headers.get("ETag", ""), latest[0]["updated_at"] if latest else ""
+
+    async def pull_request(self, owner: str, repo: str, pr: int) -> dict:
+        """The JSON object of a pull request."""
+        return (await self.get("pull", f"/repos/{owner}/{repo}/pulls/{pr}")).json()
+
+
+async def collect(items: AsyncIterator[T]) -> List[T]:
+    """Gather the items of an async iterator into a list."""
+    return [item async for item in items]
+
+
+# Client shared by synchronous callers, running on its own event-loop thread, so requests made
+# from any number of threads are multiplexed over the same connection and share one limit.
+_shared: Optional[Tuple[asyncio.AbstractEventLoop, GitHubClient]] = None
+_shared_lock = threading.Lock()
+
+
+def _shared_client() -> Tuple[asyncio.AbstractEventLoop, GitHubClient]:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="github-client", daemon=True).start()
+
+            async def create():
+                return GitHubClient()
+            _shared = loop, asyncio.run_coroutine_threadsafe(create(), loop).result()
+        return _shared
+
+
+def run(fn: Callable[[GitHubClient], Awaitable[T]]) -> T:
+    """
+    Call an async function with the shared client from synchronous code and wait for its result,
+    e.g. `run(lambda github: github.issue(owner, repo, 1))`.
+    """
+    loop, client = _shared_client()
+    return asyncio.run_coroutine_threadsafe(fn(client), loop).result()
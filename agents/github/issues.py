@@ -1,10 +1,13 @@
-import os
-import requests
 from dotenv import load_dotenv
 
+from github.client import run, collect
+
 # Load environment variables from the .env file
 load_dotenv()
 
+# Synchronous wrappers around the async client in github/client.py, used as LangChain tools and by
+# the graph nodes; all of them share one event loop and one HTTP/2 connection to GitHub.
+
 def get_all_open_issues(owner: str, repo: str, per_page: int = 100) -> list:
     """
     Retrieve all open issues for a given GitHub repository.
@@ -17,47 +20,32 @@ def get_all_open_issues(owner: str, repo: str, per_page: int = 100) -> list:
         per_page (int): Number of results per page (max 100).
     
     Returns:
-        list: A list of open issues (each issue is a JSON object).
+        list: A list of open issue numbers.
     
     Raises:
         ValueError: If the GITHUB_TOKEN is not found.
-        requests.HTTPError: For HTTP errors during API requests.
+        httpx.HTTPStatusError: For HTTP errors during API requests.
     """
-    # Retrieve the GitHub API token from environment variables
-    token = os.getenv("GITHUB_TOKEN")
-    if not token:
-        raise ValueError("GITHUB_TOKEN not set in environment variables")
-    
-    # Common headers for both requests
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {token}",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
-    
-    all_issues = []
-    page = 1
-    while True:
-        params = {
-            "state": "open",
-            "per_page": per_page,
-            "page": page
-        }
-        issues_url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-        issues_response = requests.get(issues_url, headers=headers, params=params)
-        issues_response.raise_for_status()
-        issues_page = issues_response.json()
-        
-        if not issues_page:
-            # No more issues on this page, break the loop.
-            break
-        
-        for issue in issues_page:
-            if "pull_request" not in issue:
-                all_issues.append(issue.get('number'))
-        page += 1
+    return [issue.get('number') for issue in get_all_open_issue_details(owner, repo, per_page)]
 
-    return all_issues
+def get_all_open_issue_details(owner: str, repo: str, per_page: int = 100) -> list:
+    """
+    Retrieve all open issues for a given GitHub repository, with the fields returned by the
+    issues endpoint (title, body, labels, comments count, reactions, timestamps, ...).
+    
+    Args:
+        owner (str): Repository owner.
+        repo (str): Repository name.
+        per_page (int): Number of results per page (max 100).
+    
+    Returns:
+        list: A list of open issues (each issue is a JSON object). Pull requests are excluded.
+    
+    Raises:
+        ValueError: If the GITHUB_TOKEN is not found.
+        httpx.HTTPStatusError: For HTTP errors during API requests.
+    """
+    return run(lambda github: collect(github.open_issues(owner, repo, per_page)))
 
 def get_issue(owner: str, repo: str, issue_number: int) -> dict:
     """
@@ -73,32 +61,11 @@ def get_issue(owner: str, repo: str, issue_number: int) -> dict:
     
     Raises:
         ValueError: If the GITHUB_TOKEN is not set in environment variables.
-        requests.HTTPError: If any API request fails.
+        httpx.HTTPStatusError: If any API request fails.
     """
-    # Retrieve the GitHub API token from environment variables
-    token = os.getenv("GITHUB_TOKEN")
-    if not token:
-        raise ValueError("GITHUB_TOKEN not set in environment variables")
-    
-    # Define the base URL for fetching issue details
-    base_url = f"https://api.github.com/repos/{owner}/{repo}/issues/{issue_number}"
-    
-    # Set the required headers
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {token}",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
-    
-    # Make the GET request to fetch issue details
-    response = requests.get(base_url, headers=headers)
-    response.raise_for_status()  # Raise an error if the request failed
-    
-    # Parse the JSON response
-    issue = response.json()
+    issue = run(lambda github: github.issue(owner, repo, issue_number))
     
     return {"issue_number":issue.get('number'),"title":issue.get('title'),"body":issue.get('body')}
-    
 
 def get_all_issue_comments(owner: str, repo: str, issue_number: int, per_page: int = 100) -> list:
     """
@@ -115,52 +82,11 @@ def get_all_issue_comments(owner: str, repo: str, issue_number: int, per_page: i
     
     Raises:
         ValueError: If the GITHUB_TOKEN is not set in environment variables.
-        requests.HTTPError: If any API request fails.
+        httpx.HTTPStatusError: If any API request fails.
     """
-    # Retrieve the GitHub API token from environment variables
-    token = os.getenv("GITHUB_TOKEN")
-    if not token:
-        raise ValueError("GITHUB_TOKEN not set in environment variables")
-    
-    # Define the base URL for fetching issue comments
-    base_url = f"https://api.github.com/repos/{owner}/{repo}/issues/{issue_number}/comments"
-    
-    # Set the required headers
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {token}",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
-    
-    all_comments = []
-    page = 1
-
-    while True:
-        # Set pagination parameters
-        params = {
-            "per_page": per_page,
-            "page": page
-        }
-        
-        # Make the GET request to fetch comments for the current page
-        response = requests.get(base_url, headers=headers, params=params)
-        response.raise_for_status()  # Raise an error if the request failed
-        
-        # Parse the JSON response
-        comments = response.json()
-        
-        # If no comments are returned, exit the loop
-        if not comments:
-            break
-        
-        all_comments.extend(comments)
-        page += 1
-        
-    final_comments = []
-    for comment in all_comments:
-        final_comments.append(comment.get('user').get('login')+": "+comment.get('body'))
-
-    return final_comments
+    comments = run(lambda github: collect(github.issue_comments(owner, repo, issue_number, per_page)))
+    
+    return [comment.get('user').get('login')+": "+comment.get('body') for comment in comments]
 
 def get_issue_lable_names(owner:str, repo:str, issue_number:int):
     """
@@ -176,35 +102,9 @@ def get_issue_lable_names(owner:str, repo:str, issue_number:int):
     
     Raises:
         ValueError: If the GITHUB_TOKEN is not set in environment variables.
-        requests.HTTPError: If any API request fails.
+        httpx.HTTPStatusError: If any API request fails.
     """
-    # Retrieve the GitHub API token from environment variables
-    token = os.getenv("GITHUB_TOKEN")
-    if not token:
-        raise ValueError("GITHUB_TOKEN not set in environment variables")
-    
-    # Define the base URL for fetching issue labels
-    base_url = f"https://api.github.com/repos/{owner}/{repo}/issues/{issue_number}/labels"
-    
-    # Set the required headers
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {token}",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
-    
-    # Make the GET request to fetch labels for the issue
-    response = requests.get(base_url, headers=headers)
-    response.raise_for_status()  # Raise an error if the request failed
-    
-    # Parse the JSON response
-    labels = response.json()
-    
-    label_names = []
-    for label in labels:
-        label_names.append(label["name"])        
-    
-    return label_names
+    return run(lambda github: github.issue_labels(owner, repo, issue_number))
 
 
 # Example usage:
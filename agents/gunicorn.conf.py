@@ -0,0 +1,22 @@
+import os
+
+# Production serving of app.py: `gunicorn -c gunicorn.conf.py app:app` from this directory.
+#
+# Requests spend most of their time waiting on GitHub, the LLM and the chain, so each worker
+# serves many of them on threads. Coalescing of identical requests, per-repo write locks, the
+# wallet pool and the dashboard cache live in the worker process: with more than one worker,
+# identical requests are no longer coalesced across workers and writes to the same repo may be
+# sent from different wallets concurrently, so scale with WEB_THREADS first.
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "32"))
+# gthread workers heartbeat from their main loop, so long fetches do not trip the timeout.
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+# Let in-flight fetches and payouts finish on restart.
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "300"))
+keepalive = 5
+accesslog = "-"
+# Not preloaded: the app starts background threads (dashboard refresh, receipt watcher) at import,
+# which must run in the workers.
+preload_app = False
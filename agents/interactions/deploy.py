@@ -1,10 +1,16 @@
 import os
 import json
 from dotenv import load_dotenv
-from typing_extensions import List, Tuple
+from typing_extensions import Callable, List, Tuple
 
-from cdp import Wallet
-from cdp_langchain.utils import CdpAgentkitWrapper
+from web3 import Web3
+
+import limits
+from cassette import recorded
+from singleflight import repo_lock
+from metrics import timed, contract_seconds, contract_errors, contract_gas
+from interactions.receipts import wait_for_receipt
+from interactions.wallets import get_pool
 
 load_dotenv()
 
@@ -24,31 +30,6 @@ class Issue:
 Uint256 = int
 Uint256Array = List[List[Uint256]] 
     
-def setup_wallet(wallet_data_file):
-    wallet_data = None
-
-    if os.path.exists(wallet_data_file):
-        with open(wallet_data_file) as f:
-            wallet_data = f.read()
-
-    # Configure CDP Agentkit Langchain Extension.
-    values = {}
-    if wallet_data is not None:
-        # If there is a persisted agentic wallet, load it and pass to the CDP Agentkit Wrapper.
-        values = {"cdp_wallet_data": wallet_data}
-        
-    agentkit = CdpAgentkitWrapper(**values)
-
-    agentkit.wallet.save_seed_to_file("seed.txt")
-
-    wallet_data = json.loads(wallet_data)
-
-    wallet=Wallet.fetch(wallet_data["wallet_id"])
-    wallet.load_seed_from_file("seed.txt")
-
-    return wallet
-
-wallet = setup_wallet("wallet_data.txt")
 contract_address_file = "contract_address.txt"
 
 contract_address=None
@@ -56,8 +37,11 @@ if os.path.exists(contract_address_file):
         with open(contract_address_file) as f:
             contract_address = f.read()
 
+# Called with (method, args) after every mined contract write, e.g. to refresh caches of contract state.
+write_listeners: List[Callable[[str, dict], None]] = []
+
 def deploy_contract(contract_name, contract_input_file):
-    contract = wallet.deploy_contract(
+    contract = get_pool().primary.deploy_contract(
         solidity_version="0.8.26+commit.8a97fa7a",
         solidity_input_json=contract_input_file,
         contract_name=contract_name,
@@ -65,41 +49,70 @@ def deploy_contract(contract_name, contract_input_file):
     )
     contract.wait()
 
-def register_user(username: str, address: str):
-    invocation = wallet.invoke_contract(
-    contract_address=contract_address,
-    abi=abi,
-    method="registerUser",
-    args={"username": username, "wallet": address})
+def transaction_hash(invocation) -> str:
+    transaction = invocation.transaction
+    if transaction.signed:
+        # Signed locally with the wallet seed: the hash is that of the signed payload.
+        return Web3.keccak(hexstr=transaction.signature).to_0x_hex()
+    # Signed by the CDP server signer: wait until it is broadcast.
+    return invocation.wait().transaction_hash
+
+@recorded("chain", key=lambda method, args, repoID, owner: [method, args])
+def _send(method: str, args: dict, repoID: str, owner: bool) -> dict:
+    with get_pool().acquire(repoID, primary=owner) as wallet:
+        invocation = wallet.invoke_contract(
+            contract_address=contract_address,
+            abi=abi,
+            method=method,
+            args=args)
+        
+        # The receipt watcher polls all in-flight transactions together.
+        receipt = wait_for_receipt(transaction_hash(invocation))
+    return {"transactionHash": receipt["transactionHash"].to_0x_hex(), "gasUsed": receipt["gasUsed"]}
+
+def invoke(method: str, args: dict, owner: bool = False) -> dict:
+    """
+    Invoke a contract method, wait for it to be mined and record its latency and gas.
+    Writes touching the same repo are serialized; writes are spread over the wallet pool.
     
-    invocation.wait()
+    Args:
+        method (str): The contract method.
+        args (dict): The method arguments.
+        owner (bool): Send from the primary wallet (the contract owner), for owner-only methods.
     
-def register_repo(gitHubOwner: str, repoName: str):
-    invocation = wallet.invoke_contract(
-    contract_address=contract_address,
-    abi=abi,
-    method="registerRepo",
-    args={"repoName": gitHubOwner+"/"+repoName, "githubOwnerName": gitHubOwner, "githubRepoName": repoName})
+    Returns:
+        dict: The transaction hash ("transactionHash") and gas used ("gasUsed").
     
-    invocation.wait()
+    Raises:
+        TransactionReverted: If the transaction reverted, with the decoded revert reason.
+    """
+    repoID = args.get("repoName", "")
+    with repo_lock(repoID), limits.transactions, timed(contract_seconds, contract_errors, span_name=f"contract {method}", method=method, kind="write"):
+        sent = _send(method, args, repoID, owner)
+    
+    contract_gas.inc(sent["gasUsed"], method=method)
+    for listener in write_listeners:
+        listener(method, args)
+    
+    return sent
 
-def update_issues(repoID: str, issueNumbers: List[str], difficultyRatings: List[str], totalRating: str):
-    invocation = wallet.invoke_contract(
-    contract_address=contract_address,
-    abi=abi,
-    method="updateIssues",
-    args={"repoName": repoID, "issueNumbers": issueNumbers, "difficultyRatings": difficultyRatings, "totalRating": totalRating})
+def add_agent(address: str):
+    invoke("addAgent", {"agent": address}, owner=True)
+
+def register_user(username: str, address: str):
+    invoke("registerUser", {"username": username, "wallet": address})
     
-    invocation.wait()
+def register_repo(gitHubOwner: str, repoName: str):
+    invoke("registerRepo", {"repoName": gitHubOwner+"/"+repoName, "githubOwnerName": gitHubOwner, "githubRepoName": repoName})
+
+def update_issues(repoID: str, issueNumbers: List[str], difficultyRatings: List[str], totalRating: str):
+    invoke("updateIssues", {"repoName": repoID, "issueNumbers": issueNumbers, "difficultyRatings": difficultyRatings, "totalRating": totalRating})
     
+def append_issues(repoID: str, issueNumbers: List[str], difficultyRatings: List[str]):
+    invoke("appendIssues", {"repoName": repoID, "issueNumbers": issueNumbers, "difficultyRatings": difficultyRatings})
+
 def resolve_issue(repoID: str, issueNumber: str, githubUsername: str, amount: str):
-    invocation = wallet.invoke_contract(
-    contract_address=contract_address,
-    abi=abi,
-    method="resolveIssue",
-    args={"repoName": repoID, "issueNumber": issueNumber, "githubUsername": githubUsername, "amount": amount})
-    
-    invocation.wait()
+    invoke("resolveIssue", {"repoName": repoID, "issueNumber": issueNumber, "githubUsername": githubUsername, "amount": amount})
 
 if __name__ == "__main__":
 
@@ -1,9 +1,15 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from typing_extensions import Iterator, List, Optional, Tuple
 from web3 import Web3
 
-base_sepolia_url="https://sepolia.base.org"
-web3 = Web3(Web3.HTTPProvider(base_sepolia_url))
+from cassette import recorded
+from metrics import timed, contract_seconds, contract_errors
+from interactions.rpc import PooledProvider, rpc_urls
+
+# Base Sepolia by default; see RPC_URLS in interactions/rpc.py
+web3 = Web3(PooledProvider(rpc_urls))
 
 abi_file_path = "../contracts/abi.json"
 
@@ -22,18 +28,56 @@ if os.path.exists(contract_address_file_path):
 
 contract = web3.eth.contract(address=contract_address, abi=abi)
 
+# Issues per getRepoIssues call, and how many pages are requested at once (concurrent calls are
+# sent to the RPC endpoint as one batch).
+issue_page_size = int(os.getenv("ISSUE_PAGE_SIZE", "500"))
+issue_page_concurrency = int(os.getenv("ISSUE_PAGE_CONCURRENCY", "8"))
+_pages = ThreadPoolExecutor(max_workers=issue_page_concurrency, thread_name_prefix="issue-pages")
+
+# Block numbers differ between a recording and its replay, so reads are keyed by method and arguments only.
+@recorded("chain", key=lambda method, *args, block=None: [method, args])
+def _call(method: str, *args, block: Optional[int] = None):
+    return getattr(contract.functions, method)(*args).call(block_identifier=block if block is not None else "latest")
+
+def call(method: str, *args, block: Optional[int] = None):
+    """Call a view function of the contract (at `block`, default latest), recording its latency."""
+    with timed(contract_seconds, contract_errors, span_name=f"contract {method}", method=method, kind="read"):
+        return _call(method, *args, block=block)
+
+@recorded("chain", key=lambda: ["blockNumber"])
+def latest_block() -> int:
+    """The latest block number."""
+    return web3.eth.block_number
+
 def get_contributor_address(username: str) -> str:
-    return contract.functions.userWallets(username).call()
+    return call("userWallets", username)
 
 def check_repo_registration(repoID: str) -> bool:
-    repo_data=contract.functions.repoStates(repoID).call()
+    repo_data=call("repoStates", repoID)
     if len(repo_data[0])>0:
         return True
     return False
 
+def iter_repo_issue_pages(repoID: str, block: Optional[int] = None) -> Iterator[List[Tuple[int, int]]]:
+    """
+    Read the (issue number, rating) pairs of a repo page by page, fetching several pages concurrently.
+    All pages are read at the same block, so they are consistent with each other.
+    
+    Yields:
+        list: The next page of issues, in contract order.
+    """
+    block = block if block is not None else latest_block()
+    count = call("getRepoIssueCount", repoID, block=block)
+    offsets = range(0, count, issue_page_size)
+    yield from _pages.map(lambda offset: call("getRepoIssues", repoID, offset, issue_page_size, block=block), offsets)
+
+def get_repo_issues(repoID: str, block: Optional[int] = None) -> List[Tuple[int, int]]:
+    return [issue for page in iter_repo_issue_pages(repoID, block) for issue in page]
+
 def get_repo_state(repoID: str):
-    repo_data = contract.functions.repoStates(repoID).call()
-    issues= contract.functions.getRepoIssues(repoID).call()
+    block = latest_block()
+    repo_data = call("repoStates", repoID, block=block)
+    issues = get_repo_issues(repoID, block)
     
     state = {
         "owner": repo_data[0],
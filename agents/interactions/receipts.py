@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from typing_extensions import Callable, Dict, Optional
+
+from web3.exceptions import ContractLogicError
+from web3._utils.method_formatters import PYTHONIC_RESULT_FORMATTERS
+from web3._utils.rpc_abi import RPC
+
+from interactions.read import web3
+
+load_dotenv()
+
+# How often the watcher checks for a new block (Base produces one every 2 seconds), and how long
+# a transaction may stay unmined before its waiters get a TimeoutError.
+poll_interval = float(os.getenv("RECEIPT_POLL_INTERVAL", "1"))
+receipt_timeout = float(os.getenv("RECEIPT_TIMEOUT", "300"))
+
+_format_receipt = PYTHONIC_RESULT_FORMATTERS[RPC.eth_getTransactionReceipt]
+
+
+class TransactionReverted(Exception):
+    """A watched transaction was mined but reverted."""
+
+    def __init__(self, transaction_hash: str, reason: str, receipt: dict):
+        super().__init__(f"Transaction {transaction_hash} reverted: {reason}")
+        self.transaction_hash = transaction_hash
+        self.reason = reason
+        self.receipt = receipt
+
+
+def revert_reason(receipt: dict) -> str:
+    """Replay a reverted transaction as a call at its block to recover the revert reason."""
+    try:
+        tx = web3.eth.get_transaction(receipt["transactionHash"])
+        web3.eth.call({"from": tx["from"], "to": tx["to"], "data": tx["input"], "value": tx["value"], "gas": tx["gas"]},
+                      receipt["blockNumber"])
+    except ContractLogicError as e:
+        return e.message
+    except Exception as e:
+        return f"unknown ({e})"
+    return "unknown"
+
+
+class ReceiptWatcher:
+    """
+    Waits for the receipts of all pending transactions in one thread.
+
+    Every poll_interval the watcher asks for the latest block number; only when a new block has
+    arrived does it request the receipts of all pending transactions, in a single JSON-RPC batch.
+    RPC traffic therefore depends on the block rate, not on the number of transactions in flight.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # transaction hash -> (future, deadline)
+        self.pending: Dict[str, tuple] = {}
+        self.last_block = -1
+        self.thread = None
+
+    def watch(self, transaction_hash: str, callback: Optional[Callable[[Future], None]] = None) -> Future:
+        """
+        Start watching a transaction.
+
+        Args:
+            transaction_hash (str): Hash of a broadcast transaction.
+            callback (Callable): Called with the future once the transaction is mined, reverted or timed out.
+
+        Returns:
+            Future: Resolves to the receipt, or fails with TransactionReverted or TimeoutError.
+        """
+        with self.lock:
+            entry = self.pending.get(transaction_hash)
+            if entry is None:
+                entry = self.pending[transaction_hash] = (Future(), time.monotonic() + receipt_timeout)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="receipt-watcher", daemon=True)
+                self.thread.start()
+        if callback is not None:
+            entry[0].add_done_callback(callback)
+        return entry[0]
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+            try:
+                self._poll()
+            except Exception:
+                # Transient RPC failures are retried on the next tick; waiters time out eventually.
+                pass
+            self._expire()
+            time.sleep(poll_interval)
+
+    def _poll(self):
+        block = web3.eth.block_number
+        if block == self.last_block:
+            return
+        with self.lock:
+            hashes = list(self.pending)
+        responses = web3.provider.make_batch_request([(RPC.eth_getTransactionReceipt, [h]) for h in hashes])
+        # Only advance once the receipts for this block were fetched, so a failed batch is retried.
+        self.last_block = block
+        for transaction_hash, response in zip(hashes, responses):
+            if response.get("result") is None:
+                continue
+            receipt = _format_receipt(response["result"])
+            with self.lock:
+                future, _ = self.pending.pop(transaction_hash, (None, None))
+            if future is None:
+                continue
+            if receipt["status"] == 1:
+                future.set_result(receipt)
+            else:
+                future.set_exception(TransactionReverted(transaction_hash, revert_reason(receipt), receipt))
+
+    def _expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [h for h, (_, deadline) in self.pending.items() if deadline < now]
+            futures = [self.pending.pop(h)[0] for h in expired]
+        for transaction_hash, future in zip(expired, futures):
+            future.set_exception(TimeoutError(f"Transaction {transaction_hash} not mined after {receipt_timeout}s"))
+
+
+watcher = ReceiptWatcher()
+
+
+def wait_for_receipt(transaction_hash: str, timeout: Optional[float] = None) -> dict:
+    """Block until a transaction is mined and return its receipt; raise TransactionReverted if it reverted."""
+    return watcher.watch(transaction_hash).result(timeout)
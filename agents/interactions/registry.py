@@ -0,0 +1,24 @@
+import os
+import threading
+from typing_extensions import List
+
+# The contract cannot enumerate its repos, so every repo registered (or found registered)
+# through the agent is also recorded locally.
+registered_repos_file = "registered_repos.txt"
+
+_lock = threading.Lock()
+
+def get_registered_repos() -> List[str]:
+    """Return the IDs ("owner/repo") of all repos known to be registered in the contract."""
+    if not os.path.exists(registered_repos_file):
+        return []
+    with open(registered_repos_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def add_registered_repo(repoID: str):
+    """Record a repo as registered in the contract."""
+    with _lock:
+        if repoID in get_registered_repos():
+            return
+        with open(registered_repos_file, "a") as f:
+            f.write(repoID + "\n")
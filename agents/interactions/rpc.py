@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+import itertools
+from urllib.parse import urlsplit
+from queue import Queue, Empty
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+from typing_extensions import Any, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from eth_utils import to_bytes
+from web3._utils.encoding import FriendlyJsonSerde, Web3JsonEncoder
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from metrics import timed, rpc_seconds, rpc_errors, rpc_batch_size
+
+load_dotenv()
+
+# Comma-separated JSON-RPC endpoints of the chain, tried in order of measured latency.
+rpc_urls = [url.strip() for url in os.getenv("RPC_URLS", "https://sepolia.base.org").split(",") if url.strip()]
+rpc_timeout = float(os.getenv("RPC_TIMEOUT", "10"))
+# Keep-alive connections kept per endpoint.
+rpc_pool_size = int(os.getenv("RPC_POOL_SIZE", "16"))
+# Consecutive failures after which an endpoint is skipped for `breaker_cooldown` seconds.
+breaker_threshold = int(os.getenv("RPC_BREAKER_THRESHOLD", "3"))
+breaker_cooldown = float(os.getenv("RPC_BREAKER_COOLDOWN", "30"))
+# Concurrent requests of these methods are sent together as one JSON-RPC batch post, collected
+# for at most `batch_window` seconds and up to `batch_max` requests.
+BATCHED_METHODS = {"eth_call", "eth_getTransactionReceipt"}
+batch_window = float(os.getenv("RPC_BATCH_WINDOW", "0.005"))
+batch_max = int(os.getenv("RPC_BATCH_MAX", "50"))
+# Answers that never change for a chain (web3 asks for the chain id before every call).
+CONSTANT_METHODS = {"eth_chainId", "net_version"}
+
+# Weight of the newest sample in the latency moving average.
+LATENCY_ALPHA = 0.2
+
+
+class RPCUnavailable(Exception):
+    """No endpoint could serve a request."""
+
+
+class RPCEndpointError(Exception):
+    """A post to one endpoint failed; the message does not contain the endpoint's URL."""
+
+
+class Endpoint:
+    """
+    One JSON-RPC endpoint: a pooled keep-alive session, its latency and its circuit breaker.
+
+    Hosted endpoint URLs usually carry an API key in the path or query, so the URL is never
+    exported: metrics, spans, logs and errors name the endpoint by its position in RPC_URLS and its host.
+    """
+
+    def __init__(self, url: str, index: int = 0):
+        self.url = url
+        self.name = f"{index}:{urlsplit(url).hostname or 'unknown'}"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=rpc_pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.latency = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def redact(self, message: str) -> str:
+        """A message with this endpoint's URL (as given, as sent, or its path and query) replaced by its name."""
+        prepared = requests.Request("POST", self.url).prepare().url
+        parts = urlsplit(prepared)
+        # urllib3 errors name the request target (path and query) without the host
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        for url in sorted({self.url, prepared, target} - {"", "/"}, key=len, reverse=True):
+            message = message.replace(url, self.name)
+        return message
+
+    def available(self, now: float) -> bool:
+        # Once the cooldown has passed the next request is a trial; one more failure reopens the breaker.
+        return now >= self.open_until
+
+    def post(self, payload: bytes) -> Any:
+        start = time.perf_counter()
+        try:
+            with timed(rpc_seconds, rpc_errors, span_name="rpc post", endpoint=self.name):
+                response = self.session.post(self.url, data=payload, timeout=rpc_timeout)
+                response.raise_for_status()
+                result = response.json()
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+                if self.failures >= breaker_threshold:
+                    self.open_until = time.monotonic() + breaker_cooldown
+            raise RPCEndpointError(self.redact(str(e))) from None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.failures = 0
+            self.latency = elapsed if self.latency == 0.0 else (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * elapsed
+        return result
+
+
+class PooledProvider(JSONBaseProvider):
+    """
+    web3 provider spreading requests over several endpoints.
+
+    Every request goes to the healthy endpoint with the fewest recent failures and the lowest latency
+    (endpoints not measured yet first) and fails over to the next one on connection errors, timeouts and HTTP errors such as 429.
+    eth_call and eth_getTransactionReceipt requests made concurrently from different threads are
+    sent as a single JSON-RPC batch.
+    """
+
+    def __init__(self, urls: List[str], **kwargs):
+        super().__init__(**kwargs)
+        if not urls:
+            raise ValueError("At least one RPC endpoint is required.")
+        self.endpoints = [Endpoint(url, index) for index, url in enumerate(urls)]
+        self.ids = itertools.count()
+        self.constants = {}
+        self.queue = Queue()
+        # Batches are collected by one thread and posted from a pool, so a slow post does not hold up the next batch.
+        self.senders = ThreadPoolExecutor(max_workers=rpc_pool_size, thread_name_prefix="rpc-send")
+        self.batcher = threading.Thread(target=self._batch_loop, name="rpc-batcher", daemon=True)
+        self.batcher.start()
+
+    def __str__(self) -> str:
+        return f"PooledProvider({', '.join(endpoint.name for endpoint in self.endpoints)})"
+
+    def _ranked(self) -> List[Endpoint]:
+        now = time.monotonic()
+        healthy = sorted((e for e in self.endpoints if e.available(now)), key=lambda e: (e.failures, e.latency))
+        # With every breaker open, still try the endpoint that recovers first rather than failing outright.
+        return healthy or sorted(self.endpoints, key=lambda e: e.open_until)[:1]
+
+    def _post(self, payload: bytes) -> Any:
+        error = None
+        for endpoint in self._ranked():
+            try:
+                return endpoint.post(payload)
+            except Exception as e:
+                error = e
+        raise RPCUnavailable(f"All RPC endpoints failed: {error}") from error
+
+    def _encode(self, method: str, params: Any, request_id: int) -> bytes:
+        return to_bytes(text=FriendlyJsonSerde().json_encode(
+            {"jsonrpc": "2.0", "method": method, "params": params or [], "id": request_id}, Web3JsonEncoder))
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method in BATCHED_METHODS:
+            future = Future()
+            self.queue.put((method, params, future))
+            return future.result()
+        if method in self.constants:
+            return self.constants[method]
+        rpc_batch_size.observe(1)
+        response = self._post(self._encode(method, params, next(self.ids)))
+        if method in CONSTANT_METHODS and "result" in response:
+            self.constants[method] = response
+        return response
+
+    def make_batch_request(self, requests: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        # Explicit web3 batches (w3.batch_requests()) skip the batcher but still get failover.
+        return self._send_batch([(method, params, None) for method, params in requests])
+
+    def _send_batch(self, batch: List[Tuple[str, Any, Optional[Future]]]) -> List[RPCResponse]:
+        ids = [next(self.ids) for _ in batch]
+        payload = b"[" + b",".join(self._encode(method, params, i) for (method, params, _), i in zip(batch, ids)) + b"]"
+        rpc_batch_size.observe(len(batch))
+        responses = self._post(payload)
+        if not isinstance(responses, list):
+            # Endpoints without batch support answer with a single error; send the requests one by one.
+            return [self._post(self._encode(method, params, i)) for (method, params, _), i in zip(batch, ids)]
+        by_id = {response.get("id"): response for response in responses}
+        return [by_id.get(i) or {"jsonrpc": "2.0", "id": i, "error": {"code": -32603, "message": "Missing from batch response"}}
+                for i in ids]
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + batch_window
+            while len(batch) < batch_max:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            self.senders.submit(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[str, Any, Future]]):
+        try:
+            if len(batch) == 1:
+                method, params, _ = batch[0]
+                rpc_batch_size.observe(1)
+                responses = [self._post(self._encode(method, params, next(self.ids)))]
+            else:
+                responses = self._send_batch(batch)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), response in zip(batch, responses):
+            future.set_result(response)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        try:
+            return "result" in self.make_request(RPCEndpoint("web3_clientVersion"), [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
@@ -0,0 +1,120 @@
+import os
+import argparse
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing_extensions import Dict, List, Optional
+
+from cdp import Wallet
+from cdp_langchain.utils import CdpAgentkitWrapper
+
+load_dotenv()
+
+# Comma-separated wallet data files (as exported by CdpAgentkitWrapper.export_wallet) of the agent
+# wallets that send contract writes. The first one is the primary wallet: the contract owner,
+# which authorizes the others as agents.
+wallet_data_files = [path.strip() for path in os.getenv("WALLET_DATA_FILES", "wallet_data.txt").split(",") if path.strip()]
+
+
+class PooledWallet:
+    """A loaded agent wallet and the number of its transactions in flight."""
+
+    def __init__(self, wallet: Wallet):
+        self.wallet = wallet
+        self.address = wallet.default_address.address_id
+        self.in_flight = 0
+
+
+def load_wallet(wallet_data_file: str) -> Wallet:
+    """Load a wallet from its exported data (wallet id and seed), without writing the seed anywhere."""
+    with open(wallet_data_file) as f:
+        wallet_data = f.read()
+    return CdpAgentkitWrapper(cdp_wallet_data=wallet_data).wallet
+
+
+class WalletPool:
+    """
+    Agent wallets that contract writes are spread over, so transactions of different repos
+    do not queue up behind one nonce sequence.
+
+    A write goes to the wallet its repo used last (keeping the repo's transactions in order on one
+    nonce sequence) unless another wallet has fewer transactions pending, in which case the repo
+    moves to the least loaded wallet.
+    """
+
+    def __init__(self, wallets: List[Wallet]):
+        if not wallets:
+            raise ValueError("The wallet pool needs at least one wallet.")
+        self.wallets = [PooledWallet(wallet) for wallet in wallets]
+        self.affinity: Dict[str, PooledWallet] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def primary(self) -> Wallet:
+        return self.wallets[0].wallet
+
+    @contextmanager
+    def acquire(self, repoID: str = "", primary: bool = False):
+        """
+        Pick the wallet for a write to a repo and count the write as pending until the block exits.
+        
+        Args:
+            repoID (str): The repo written to, if any.
+            primary (bool): Use the primary wallet, for methods only the contract owner may call.
+        """
+        with self.lock:
+            if primary:
+                chosen = self.wallets[0]
+            else:
+                least_loaded = min(self.wallets, key=lambda w: w.in_flight)
+                chosen = self.affinity.get(repoID)
+                if chosen is None or chosen.in_flight > least_loaded.in_flight:
+                    chosen = least_loaded
+                if repoID:
+                    self.affinity[repoID] = chosen
+            chosen.in_flight += 1
+        try:
+            yield chosen.wallet
+        finally:
+            with self.lock:
+                chosen.in_flight -= 1
+
+
+_pool: Optional[WalletPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> WalletPool:
+    """The process-wide wallet pool, loaded on first use and cached."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WalletPool([load_wallet(path) for path in wallet_data_files])
+        return _pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create agent wallets for the wallet pool and authorize them in the contract.")
+    parser.add_argument("--create", type=int, default=1, help="number of wallets to create")
+    parser.add_argument("--faucet", action="store_true", help="request testnet funds for gas for every new wallet")
+    args = parser.parse_args()
+
+    # deploy.py imports this module
+    from interactions.deploy import add_agent
+
+    created = []
+    for i in range(len(wallet_data_files), len(wallet_data_files) + args.create):
+        agentkit = CdpAgentkitWrapper()
+        path = f"wallet_data_{i}.txt"
+        with open(path, "w") as f:
+            f.write(agentkit.export_wallet())
+        if args.faucet:
+            agentkit.wallet.faucet().wait()
+        add_agent(agentkit.wallet.default_address.address_id)
+        created.append(path)
+        print(f"Created agent wallet {agentkit.wallet.default_address.address_id} in {path}.")
+    print("WALLET_DATA_FILES=" + ",".join(wallet_data_files + created))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process-wide concurrency budgets shared by every request, batch and background job,
+# so that fanning out over many repos cannot overrun GitHub, OpenAI or the wallet.
+# GitHub requests are limited by the async client (github/client.py), which waits on an asyncio semaphore.
+github_concurrency = int(os.getenv("GITHUB_CONCURRENCY", "8"))
+# LLM calls start with this limit, which llm_gateway.py then adapts to the provider's rate limits.
+llm_concurrency = int(os.getenv("LLM_CONCURRENCY", "8"))
+# Two transactions in flight per wallet of the wallet pool (WALLET_DATA_FILES) by default.
+wallet_count = len([path for path in os.getenv("WALLET_DATA_FILES", "wallet_data.txt").split(",") if path.strip()])
+transaction_concurrency = int(os.getenv("TX_CONCURRENCY", str(2 * wallet_count)))
+
+transactions = threading.BoundedSemaphore(transaction_concurrency)
@@ -0,0 +1,295 @@
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from typing_extensions import Callable, Dict, Optional
+
+import openai
+from langchain_openai import ChatOpenAI
+from langchain_core.outputs import ChatResult
+from pydantic import Field
+
+import limits
+from metrics import counter, gauge, histogram, current_node, current_usage, record_llm_usage
+
+load_dotenv()
+
+# All chat model calls of the process go through one gateway. It starts with LLM_CONCURRENCY
+# calls in flight and adapts the limit to the provider's rate-limit headers (additive increase
+# while there is headroom, multiplicative decrease when it runs low or on 429), gives every call a
+# deadline, and hedges a call that is slower than the recent p95 latency with a duplicate request,
+# taking whichever answer comes first.
+max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", str(2 * limits.llm_concurrency)))
+min_concurrency = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+# Seconds a call may take, waiting for a slot, 429 back-off and hedges included.
+call_timeout = float(os.getenv("LLM_TIMEOUT", "120"))
+# Fraction of the request or token rate limit left below which the limit is decreased.
+headroom = float(os.getenv("LLM_HEADROOM", "0.1"))
+# Latency quantile after which a call is hedged, latencies needed before hedging starts, and
+# the largest fraction of calls that may be hedged.
+hedge_quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+hedge_budget = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+# Retries of a call after a connection error, request timeout or 5xx response (429s are retried
+# until the deadline instead).
+retries = int(os.getenv("LLM_RETRIES", "2"))
+
+# Errors worth sending the request again for.
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+llm_concurrency_limit = gauge("gitgrant_llm_concurrency_limit", "Current adaptive limit of LLM calls in flight.")
+llm_in_flight = gauge("gitgrant_llm_in_flight", "LLM requests in flight, hedges included.")
+llm_slot_wait_seconds = histogram("gitgrant_llm_slot_wait_seconds", "Time LLM calls waited for a concurrency slot.")
+llm_throttled = counter("gitgrant_llm_throttled_total", "Decreases of the LLM concurrency limit, by cause.", ("reason",))
+llm_hedges = counter("gitgrant_llm_hedges_total", "Hedged LLM requests, launched and won.", ("outcome",))
+llm_timeouts = counter("gitgrant_llm_timeouts_total", "LLM calls that missed their deadline.", ("model",))
+llm_retries = counter("gitgrant_llm_retries_total", "LLM requests sent again after a transient error, by error.", ("error",))
+
+
+class LLMTimeout(TimeoutError):
+    """An LLM call did not complete before its deadline."""
+
+
+def _seconds(value: str) -> Optional[float]:
+    # "1.5", "20ms", "6m0s" (x-ratelimit-reset-*) -> seconds
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if not value:
+        return None
+    total, number = 0.0, ""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    i = 0
+    while i < len(value):
+        if value[i].isdigit() or value[i] == ".":
+            number += value[i]
+            i += 1
+            continue
+        unit = "ms" if value.startswith("ms", i) else value[i]
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+    return total
+
+
+def _headroom(headers: Dict[str, str]) -> Optional[float]:
+    # Smallest fraction of the request and token limits still available, if the headers tell.
+    fractions = []
+    for kind in ("requests", "tokens"):
+        try:
+            fractions.append(int(headers[f"x-ratelimit-remaining-{kind}"]) / int(headers[f"x-ratelimit-limit-{kind}"]))
+        except (KeyError, ValueError, ZeroDivisionError):
+            continue
+    return min(fractions) if fractions else None
+
+
+class Gateway:
+    """
+    Shared limit, deadline and hedging policy for LLM calls.
+
+    Args:
+        initial (int): Calls in flight to start with.
+        minimum (int), maximum (int): Bounds of the adaptive limit.
+        timeout (float): Deadline of a call in seconds.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, timeout: float):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        # No call starts before this time after a 429 (monotonic clock).
+        self.paused_until = 0.0
+        self.latencies: Dict[str, deque] = {}
+        self.decreased = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self.pool = ThreadPoolExecutor(max_workers=self.maximum, thread_name_prefix="llm")
+        llm_concurrency_limit.set(self.limit)
+
+    def _acquire(self, deadline: float) -> bool:
+        start = time.monotonic()
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.in_flight < int(self.limit) and now >= self.paused_until:
+                    self.in_flight += 1
+                    llm_in_flight.set(self.in_flight)
+                    llm_slot_wait_seconds.observe(now - start)
+                    return True
+                if now >= deadline:
+                    return False
+                # Woken by a release, else at the end of a 429 pause or at the deadline.
+                wake = self.paused_until if now < self.paused_until else deadline
+                self.cond.wait(min(wake, deadline) - now)
+
+    def _acquire_hedge(self) -> bool:
+        # A hedge only takes a slot that is free right now, and only within the hedge budget;
+        # under pressure it would add to the overload.
+        with self.cond:
+            if self.hedged >= hedge_budget * self.calls or self.in_flight >= int(self.limit) \
+                    or time.monotonic() < self.paused_until:
+                return False
+            self.hedged += 1
+            self.in_flight += 1
+            llm_in_flight.set(self.in_flight)
+            return True
+
+    def _release(self):
+        with self.cond:
+            self.in_flight -= 1
+            llm_in_flight.set(self.in_flight)
+            self.cond.notify_all()
+
+    def _decrease(self, reason: str, pause: float = 0.0):
+        with self.cond:
+            now = time.monotonic()
+            # Low headroom is reported by every call in flight; it counts once per second.
+            if reason == "headroom" and now - self.decreased < 1.0:
+                return
+            self.decreased = now
+            self.limit = max(self.minimum, self.limit * (0.5 if reason == "429" else 0.75))
+            self.paused_until = max(self.paused_until, now + pause)
+            llm_concurrency_limit.set(self.limit)
+        llm_throttled.inc(reason=reason)
+
+    def _succeeded(self, model: str, seconds: float, headers: Dict[str, str]):
+        fraction = _headroom(headers)
+        if fraction is not None and fraction < headroom:
+            self._decrease("headroom")
+        else:
+            with self.cond:
+                # About +1 per `limit` successful calls.
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                llm_concurrency_limit.set(self.limit)
+                self.cond.notify_all()
+        with self.cond:
+            self.latencies.setdefault(model, deque(maxlen=500)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """The recent p95 (LLM_HEDGE_QUANTILE) latency of a model, or None until enough calls were seen."""
+        with self.cond:
+            latencies = sorted(self.latencies.get(model, ()))
+        if len(latencies) < hedge_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(hedge_quantile * len(latencies)))]
+
+    def _start(self, fn: Callable[[bool], ChatResult], model: str, hedge: bool) -> Future:
+        # The caller holds a slot, which the request gives back when it finishes, even if its answer is no longer wanted.
+        def request():
+            start = time.monotonic()
+            try:
+                result = fn(hedge)
+            except openai.RateLimitError as e:
+                self._decrease("429", _seconds(e.response.headers.get("retry-after")) or 1.0)
+                raise
+            finally:
+                self._release()
+            headers = {}
+            for generation in result.generations:
+                headers = (generation.generation_info or {}).pop("headers", None) or headers
+            self._succeeded(model, time.monotonic() - start, headers)
+            return result
+        return self.pool.submit(contextvars.copy_context().run, request)
+
+    @staticmethod
+    def _charge_unused(model: str, node: str, account) -> Callable[[Future], None]:
+        # Only the answer that is returned reaches the callback handlers; the other requests of the
+        # call (the slower of a hedged pair, or any still running at the deadline) cost tokens too.
+        def charge(future: Future):
+            if not future.cancelled() and future.exception() is None:
+                record_llm_usage(model, node, (future.result().llm_output or {}).get("token_usage") or {}, 0.0, account)
+        return charge
+
+    def call(self, fn: Callable[[bool], ChatResult], model: str) -> ChatResult:
+        """
+        Make a chat model request within the concurrency limit and the deadline, hedging it when it is slow.
+
+        Args:
+            fn (Callable): Makes the request; called with True for a hedge.
+            model (str): Model name; latency percentiles are kept per model.
+
+        Returns:
+            ChatResult: The first answer.
+
+        Raises:
+            LLMTimeout: If no answer arrived before the deadline.
+            Exception: Whatever the request raised (429s, and up to LLM_RETRIES connection errors,
+                timeouts and 5xx responses, are retried within the deadline).
+        """
+        deadline = time.monotonic() + self.timeout
+        charge_unused = self._charge_unused(model, current_node.get(), current_usage.get())
+        with self.cond:
+            self.calls += 1
+        attempt = 0
+        while self._acquire(deadline):
+            hedge = None
+            futures = {self._start(fn, model, False)}
+            started = set(futures)
+            delay = self.hedge_delay(model)
+            if delay is not None:
+                done, _ = wait(futures, timeout=max(0.0, min(delay, deadline - time.monotonic())))
+                if not done and time.monotonic() < deadline and self._acquire_hedge():
+                    hedge = self._start(fn, model, True)
+                    futures.add(hedge)
+                    started.add(hedge)
+                    llm_hedges.inc(outcome="launched")
+            error = None
+            while futures:
+                done, futures = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            llm_hedges.inc(outcome="won")
+                        for other in started - {future}:
+                            other.add_done_callback(charge_unused)
+                        return future.result()
+                    error = future.exception()
+            if futures:
+                # The deadline passed with requests still running.
+                for future in futures:
+                    future.add_done_callback(charge_unused)
+                break
+            if isinstance(error, openai.RateLimitError):
+                # Rate limited: try again once the pause is over, if the deadline allows.
+                continue
+            if not isinstance(error, TRANSIENT_ERRORS) or attempt >= retries:
+                raise error
+            # Connection error, timeout or 5xx: back off briefly and send the request again.
+            delay = 0.5 * 2 ** attempt
+            if time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            llm_retries.inc(error=type(error).__name__)
+            time.sleep(delay)
+        llm_timeouts.inc(model=model)
+        raise LLMTimeout(f"LLM call to {model} did not complete within {self.timeout}s.")
+
+
+gateway = Gateway(limits.llm_concurrency, min_concurrency, max_concurrency, call_timeout)
+
+
+class GatewayChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose requests go through the shared gateway (concurrency limit, deadline, hedging)."""
+
+    # The gateway reads the rate-limit headers and retries 429s and transient errors itself, within
+    # the call's deadline.
+    include_response_headers: bool = True
+    max_retries: int = 0
+    request_timeout: Optional[float] = Field(default=call_timeout, alias="timeout")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Streaming callbacks are only given to the first request.
+        return gateway.call(
+            lambda hedge: super(GatewayChatOpenAI, self)._generate(messages, stop, None if hedge else run_manager, **kwargs),
+            self.model_name)
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing_extensions import Dict, List
+
+import requests
+
+# Load generator for /invoke. Point it at a server whose GitHub, LLM and chain interactions are
+# served by local stand-ins (e.g. `CASSETTE_MODE=replay`, see cassette.py, with RPC_URLS on a local
+# node) so that the measured numbers are those of the service itself.
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values (0 if empty)."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def read_rss(pid: int) -> int:
+    """Resident memory in bytes of a process and all its descendants (e.g. gunicorn and its workers)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class Payloads:
+    """Random /invoke payloads following a weighted mix of actions."""
+
+    def __init__(self, mix: Dict[str, float], repos: List[str], issues: List[int], users: List[str]):
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.repos = repos
+        self.issues = issues
+        self.users = users
+
+    def next(self) -> dict:
+        action = random.choices(self.actions, self.weights)[0]
+        if action == "register":
+            username = random.choice(self.users)
+            return {"action": "register user", "username": username,
+                    "address": "0x" + hashlib.sha1(username.encode()).hexdigest()}
+        owner, repo = random.choice(self.repos).split("/", 1)
+        if action == "resolve":
+            return {"action": "resolve", "owner": owner, "repo": repo, "current_issue": random.choice(self.issues)}
+        return {"action": action, "owner": owner, "repo": repo}
+
+
+class Stats:
+    """Latencies and outcomes per action, for the whole run and for the current report interval."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.interval: List[float] = []
+        self.interval_errors = 0
+
+    def add(self, action: str, latency: float, outcome: str):
+        with self.lock:
+            self.latencies.setdefault(action, []).append(latency)
+            outcomes = self.outcomes.setdefault(action, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            self.interval.append(latency)
+            if outcome != "200":
+                self.interval_errors += 1
+
+    def take_interval(self):
+        with self.lock:
+            interval, errors = sorted(self.interval), self.interval_errors
+            self.interval, self.interval_errors = [], 0
+        return interval, errors
+
+    def summary(self, elapsed: float) -> dict:
+        with self.lock:
+            actions = {}
+            for action, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                outcomes = self.outcomes[action]
+                errors = sum(count for outcome, count in outcomes.items() if outcome != "200")
+                actions[action] = {
+                    "requests": len(latencies),
+                    "throughput": round(len(latencies) / elapsed, 3),
+                    "error_rate": round(errors / len(latencies), 4),
+                    "outcomes": outcomes,
+                    "p50": round(percentile(latencies, 50), 4),
+                    "p95": round(percentile(latencies, 95), 4),
+                    "p99": round(percentile(latencies, 99), 4),
+                    "max": round(latencies[-1], 4),
+                }
+            return actions
+
+
+def send(session: requests.Session, url: str, payload: dict, timeout: float, stats: Stats, scheduled: float):
+    # Latency is measured from when the request was due, so a saturated server is not hidden by
+    # requests waiting for a free client thread (coordinated omission).
+    try:
+        response = session.post(url, json=payload, timeout=timeout)
+        outcome = str(response.status_code)
+        # Drain streamed responses, so the latency covers the whole result.
+        response.content
+    except requests.RequestException as e:
+        outcome = type(e).__name__
+    stats.add(payload["action"], time.perf_counter() - scheduled, outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire a mix of /invoke requests at the agents API and report latency, errors and server memory.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/invoke")
+    parser.add_argument("--mix", default="fetch=6,resolve=3,register=1", help="action weights, actions: fetch, resolve, register")
+    parser.add_argument("--repos", default="owner/repo", help="comma-separated owner/repo to fetch and resolve on")
+    parser.add_argument("--issues", default="1", help="comma-separated PR numbers for resolve")
+    parser.add_argument("--users", type=int, default=100, help="number of distinct users to register")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, help="requests per second (open loop, Poisson arrivals)")
+    load.add_argument("--concurrency", type=int, default=8, help="requests in flight (closed loop)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="client threads in --rate mode")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--timeout", type=float, default=600, help="request timeout in seconds")
+    parser.add_argument("--pid", type=int, help="server process (gunicorn master or app.py) whose RSS is sampled")
+    parser.add_argument("--report-interval", type=float, default=5, help="seconds between progress lines")
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = {action: float(weight) for action, weight in (item.split("=") for item in args.mix.split(","))}
+    payloads = Payloads(mix, args.repos.split(","), [int(issue) for issue in args.issues.split(",")],
+                        [f"loadtest-user-{i}" for i in range(args.users)])
+    stats = Stats()
+    stop = threading.Event()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max(args.max_inflight, args.concurrency)))
+
+    def closed_loop():
+        while not stop.is_set():
+            send(session, args.url, payloads.next(), args.timeout, stats, time.perf_counter())
+
+    def open_loop(pool: ThreadPoolExecutor):
+        due = time.perf_counter()
+        while not stop.is_set():
+            due += random.expovariate(args.rate)
+            delay = due - time.perf_counter()
+            if delay > 0 and stop.wait(delay):
+                break
+            pool.submit(send, session, args.url, payloads.next(), args.timeout, stats, due)
+
+    pool = None
+    if args.rate:
+        pool = ThreadPoolExecutor(max_workers=args.max_inflight, thread_name_prefix="loadtest")
+        generators = [threading.Thread(target=open_loop, args=(pool,), daemon=True)]
+    else:
+        generators = [threading.Thread(target=closed_loop, daemon=True) for _ in range(args.concurrency)]
+
+    rss: List[list] = []
+    start = time.perf_counter()
+    for generator in generators:
+        generator.start()
+    print("elapsed  req/s    p50      p95      p99      errors  rss_mb", file=sys.stderr)
+    while True:
+        remaining = args.duration - (time.perf_counter() - start)
+        if stop.wait(min(args.report_interval, max(0.0, remaining))) or remaining <= 0:
+            break
+        elapsed = time.perf_counter() - start
+        interval, errors = stats.take_interval()
+        memory = read_rss(args.pid) if args.pid else None
+        if memory is not None:
+            rss.append([round(elapsed, 1), memory])
+        print(f"{elapsed:7.1f}  {len(interval) / args.report_interval:6.1f}  {percentile(interval, 50):7.3f}  "
+              f"{percentile(interval, 95):7.3f}  {percentile(interval, 99):7.3f}  {errors:6d}  "
+              f"{memory / 2**20 if memory is not None else float('nan'):7.1f}", file=sys.stderr)
+    stop.set()
+    # Requests still in flight are waited for and counted.
+    for generator in generators:
+        generator.join()
+    if pool is not None:
+        pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "duration": round(elapsed, 3),
+        "mode": f"rate={args.rate}" if args.rate else f"concurrency={args.concurrency}",
+        "actions": stats.summary(elapsed),
+        "rss": rss,
+    }
+    output = json.dumps(summary, indent=2)
+    print(output)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing_extensions import Dict, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+load_dotenv()
+
+# OpenTelemetry is optional. When it is installed, every timed section also opens a span so that
+# GitHub, LLM and contract calls are nested under the node and the /invoke request that caused them.
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer("gitgrant")
+except ImportError:
+    tracer = None
+
+# Latency buckets (seconds) shared by all histograms, from a fast RPC read up to a slow rating run.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# US dollars per million prompt and completion tokens, by model name prefix (longest match wins).
+# LLM_PRICES (JSON, e.g. {"gpt-4o": [2.5, 10]}) adds or overrides entries.
+LLM_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+LLM_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+# LangGraph node that is currently running, used to attribute LLM calls to their node.
+current_node = contextvars.ContextVar("current_node", default="")
+# LLM usage account of the graph run in progress (see budget.py), if any.
+current_usage = contextvars.ContextVar("current_usage", default=None)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.type = "counter"
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, keyed by label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Cumulative histogram keyed by label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        for key, series in self.values.items():
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, series):
+                yield self.name + "_bucket", {**labels, "le": repr(float(bound))}, count
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, series[-2]
+            yield self.name + "_count", labels, series[-2]
+            yield self.name + "_sum", labels, series[-1]
+
+
+def _register(metric):
+    _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return _metrics.get(name) or _register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+    return _metrics.get(name) or _register(Gauge(name, help, labels))
+
+
+def histogram(name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _metrics.get(name) or _register(Histogram(name, help, labels, buckets))
+
+
+invocation_seconds = histogram("gitgrant_invocation_duration_seconds", "Duration of /invoke requests.", ("action",))
+invocation_errors = counter("gitgrant_invocation_errors_total", "Failed /invoke requests.", ("action",))
+
+node_seconds = histogram("gitgrant_node_duration_seconds", "Duration of LangGraph node executions.", ("node",))
+node_errors = counter("gitgrant_node_errors_total", "LangGraph node executions that raised.", ("node",))
+
+github_seconds = histogram("gitgrant_github_request_duration_seconds", "Duration of GitHub API requests.", ("endpoint",))
+github_requests = counter("gitgrant_github_requests_total", "GitHub API requests by response status.", ("endpoint", "status"))
+github_errors = counter("gitgrant_github_errors_total", "GitHub API requests that failed.", ("endpoint",))
+
+llm_seconds = histogram("gitgrant_llm_call_duration_seconds", "Duration of LLM calls.", ("model", "node"))
+llm_errors = counter("gitgrant_llm_errors_total", "LLM calls that raised.", ("model", "node"))
+llm_tokens = counter("gitgrant_llm_tokens_total", "LLM tokens used.", ("model", "node", "kind"))
+llm_cost = counter("gitgrant_llm_cost_usd_total", "Estimated LLM cost in US dollars.", ("model", "node"))
+budget_degraded = counter("gitgrant_llm_budget_degraded_total", "Issues rated without the LLM agents because the run's LLM budget ran out, by how they were rated.", ("outcome",))
+
+contract_seconds = histogram("gitgrant_contract_call_duration_seconds", "Duration of contract reads and writes.", ("method", "kind"))
+contract_errors = counter("gitgrant_contract_errors_total", "Contract reads and writes that failed.", ("method", "kind"))
+heuristic_ratings = counter("gitgrant_heuristic_ratings_total", "Issues rated by the heuristic pre-scorer or sent to the LLM.", ("outcome",))
+dedup_matches = counter("gitgrant_dedup_matches_total", "Issues matched to a similar rated issue, by whether its rating was reused or only seeded the prompt.", ("kind",))
+heuristic_shadow = counter("gitgrant_heuristic_shadow_total", "Shadow-evaluated heuristic ratings by agreement with the LLM.", ("result",))
+
+contract_gas = counter("gitgrant_contract_gas_used_total", "Gas used by mined contract writes.", ("method",))
+
+rpc_seconds = histogram("gitgrant_rpc_request_duration_seconds", "Duration of JSON-RPC posts to a chain endpoint.", ("endpoint",))
+rpc_errors = counter("gitgrant_rpc_errors_total", "JSON-RPC posts that failed, by endpoint.", ("endpoint",))
+rpc_batch_size = histogram("gitgrant_rpc_batch_size", "JSON-RPC requests sent per post.", (), buckets=(1, 2, 5, 10, 20, 50, 100))
+
+
+@contextmanager
+def timed(seconds: Histogram, errors: Counter, span_name: str = None, **labels):
+    """
+    Time a block of code into a histogram, count it as an error if it raises and,
+    when OpenTelemetry is available, wrap it in a span.
+
+    Args:
+        seconds (Histogram): Histogram that receives the elapsed time.
+        errors (Counter): Counter incremented when the block raises.
+        span_name (str): Name of the OpenTelemetry span, defaults to the histogram name.
+        **labels: Label values for both metrics.
+    """
+    span = None
+    if tracer is not None:
+        span = tracer.start_as_current_span(span_name or seconds.name, attributes=labels)
+        span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        errors.inc(**labels)
+        if span is not None:
+            span.__exit__(type(e), e, e.__traceback__)
+            span = None
+        raise
+    finally:
+        seconds.observe(time.perf_counter() - start, **labels)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+def instrument_node(node):
+    """Decorator for LangGraph node functions recording their latency and errors."""
+    @functools.wraps(node)
+    def wrapper(state):
+        token = current_node.set(node.__name__)
+        try:
+            with timed(node_seconds, node_errors, span_name=f"node {node.__name__}", node=node.__name__):
+                return node(state)
+        finally:
+            current_node.reset(token)
+    return wrapper
+
+
+def llm_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost of an LLM call; 0 for models without a known price."""
+    matches = [name for name in LLM_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = LLM_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def record_llm_usage(model: str, node: str, usage: dict, seconds: float, account=None):
+    """Record the tokens and cost of an LLM request and charge them to a run's usage account, if given."""
+    llm_tokens.inc(usage.get("prompt_tokens", 0), model=model, node=node, kind="prompt")
+    llm_tokens.inc(usage.get("completion_tokens", 0), model=model, node=node, kind="completion")
+    cost = llm_cost_usd(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    llm_cost.inc(cost, model=model, node=node)
+    if account is not None:
+        account.add(node, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cost, seconds)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler recording latency, errors, token usage and cost of chat model calls,
+    and charging them to the usage account of the current run.
+    """
+
+    def __init__(self):
+        self.started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") \
+            or (kwargs.get("metadata") or {}).get("ls_model_name", "")
+        self.started[run_id] = (time.perf_counter(), model, current_node.get())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, model, node = self.started.pop(run_id, (None, "", current_node.get()))
+        seconds = time.perf_counter() - start if start is not None else 0.0
+        if start is not None:
+            llm_seconds.observe(seconds, model=model, node=node)
+        record_llm_usage(model, node, (response.llm_output or {}).get("token_usage") or {}, seconds, current_usage.get())
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, model, node = self.started.pop(run_id, (None, "", current_node.get()))
+        if start is not None:
+            llm_seconds.observe(time.perf_counter() - start, model=model, node=node)
+        llm_errors.inc(model=model, node=node)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _process_resident_memory() -> int:
+    # Linux only; other platforms simply skip the gauge.
+    try:
+        with open(f"/proc/{os.getpid()}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    rss = _process_resident_memory()
+    if rss:
+        lines.append("# HELP process_resident_memory_bytes Resident memory size in bytes.")
+        lines.append("# TYPE process_resident_memory_bytes gauge")
+        lines.append(f"process_resident_memory_bytes {rss}")
+    return "\n".join(lines) + "\n"
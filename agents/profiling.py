@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import uuid
+import random
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fraction of /invoke requests profiled without being asked to (0 disables sampling).
+sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Request header that turns profiling on for a single request.
+profile_header = os.getenv("PROFILE_HEADER", "X-GitGrant-Profile")
+# Off by default: with it on, any client can make the server profile a request and write files.
+allow_header = os.getenv("PROFILE_ALLOW_HEADER", "false").lower() == "true"
+# Where profiles are written and how many of them are kept.
+profile_dir = os.getenv("PROFILE_DIR", "profiles")
+profile_keep = int(os.getenv("PROFILE_KEEP", "20"))
+# Interval between stack samples of the wall-clock sampler, in seconds.
+sample_interval = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Only one cProfile profiler can be active per process (since Python 3.12 it is built on
+# sys.monitoring), so concurrently profiled requests get the wall-clock sampler only.
+_cprofile_lock = threading.Lock()
+
+
+def should_profile(headers) -> bool:
+    """
+    Decide whether the current request is profiled.
+
+    Args:
+        headers: Request headers (any mapping with .get).
+
+    Returns:
+        bool: True if the request asked for a profile or was picked by the sampling rate.
+    """
+    if allow_header and headers.get(profile_header, "").lower() in ("1", "true", "yes"):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class WallClockSampler(threading.Thread):
+    """
+    Periodically sample the stack of one thread, regardless of whether it is running or blocked.
+
+    Unlike cProfile, time spent waiting on sockets (GitHub, OpenAI, RPC) shows up in the samples,
+    which is where most of the time of a fetch goes.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="gitgrant-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit(os.sep, 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """Samples in the collapsed-stack format understood by flamegraph.pl and speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _rotate(directory: str, keep: int):
+    # Every profile is a .prof/.collapsed pair sharing a base name; keep the newest `keep` pairs.
+    names = sorted({name.rsplit(".", 1)[0] for name in os.listdir(directory)
+                    if name.endswith((".prof", ".collapsed"))})
+    for name in names[:-keep] if keep > 0 else names:
+        for ext in (".prof", ".collapsed"):
+            path = os.path.join(directory, name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@contextmanager
+def profile(label: str):
+    """
+    Profile the enclosed block with cProfile and a wall-clock sampler and write both results to
+    PROFILE_DIR as <timestamp>-<id>-<label>.prof (pstats) and <timestamp>-<id>-<label>.collapsed
+    (flame graph), with a random id so concurrent profiles never share a name.
+    If another request is being profiled with cProfile, only the .collapsed file is written.
+    Profiling errors are printed, never raised to the profiled request.
+
+    Args:
+        label (str): Short description of the profiled work, used in the file names.
+
+    Yields:
+        str: Base name of the files that will be written.
+    """
+    name = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}-" \
+        + "".join(c if c.isalnum() else "_" for c in label)
+    sampler = WallClockSampler(threading.get_ident(), sample_interval)
+    profiler = None
+    if _cprofile_lock.acquire(blocking=False):
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except ValueError as e:
+            # Another profiling tool (e.g. a debugger or an outside profiler) is active.
+            print(f"cProfile unavailable, sampling only: {e}")
+            profiler = None
+            _cprofile_lock.release()
+    sampler.start()
+    try:
+        yield name
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _cprofile_lock.release()
+        sampler.stop()
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(profile_dir, name + ".prof"))
+            with open(os.path.join(profile_dir, name + ".collapsed"), "w") as f:
+                f.write(sampler.collapsed())
+            _rotate(profile_dir, profile_keep)
+        except OSError as e:
+            print(f"Writing profile {name} failed: {e}")
@@ -1,11 +1,13 @@
 import sys
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
+from llm_gateway import GatewayChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 from langchain_core.messages import HumanMessage
 
+from metrics import LLMMetricsHandler
+
 # Load environment variables (GitHub and OpenAI tokens)
 load_dotenv()
 
@@ -53,7 +55,7 @@ def initialize_rating_agent(memory, config):
     computes a rating (1-100) based on the issue's priority and difficulty.
     """
     # Initialize LLM.
-    llm = ChatOpenAI(model="gpt-4o-mini")
+    llm = GatewayChatOpenAI(model="gpt-4o-mini", callbacks=[LLMMetricsHandler()])
 
     # Create a ReAct Agent that uses the same GitHub tools but with a modified state prompt.
     # This state_modifier instructs the agent to:
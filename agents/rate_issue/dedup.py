@@ -0,0 +1,239 @@
+import os
+import re
+import zlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing_extensions import Dict, Iterable, List, Optional
+
+load_dotenv()
+
+# Issues at least this similar (estimated Jaccard similarity of their shingles) to an already
+# rated one reuse its rating and action items; issues at least `seed_threshold` similar are still
+# evaluated, but with the similar issue's action items added to the prompt.
+reuse_threshold = float(os.getenv("DEDUP_REUSE_THRESHOLD", "0.85"))
+seed_threshold = float(os.getenv("DEDUP_SEED_THRESHOLD", "0.6"))
+# Most signatures of fetched, not yet rated issues kept in memory; the repos staged longest ago
+# are dropped first (their issues are then evaluated without near-duplicate matching).
+max_staged = int(os.getenv("DEDUP_MAX_STAGED", "100000"))
+
+# 64 permutations in 16 bands of 4 rows: issues with similarity 0.6 become LSH candidates ~90%
+# of the time, 0.85 practically always.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+# Odd multipliers folding the rows of a band into a single 64-bit key.
+_BAND_MIX = _rng.randint(1, 1 << 62, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text: str) -> set:
+    """Word n-grams of the normalized text (lowercase, punctuation and markup stripped)."""
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a text."""
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64)
+    if hashes.size == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(_A, hashes) + _B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def _band_keys(signatures: np.ndarray) -> np.ndarray:
+    # (n, NUM_PERM) signatures -> (n, BANDS) 64-bit band keys
+    bands = signatures.reshape(-1, BANDS, ROWS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class _BandTable:
+    """
+    Multimap from band key to row id: a sorted array searched with binary search, plus a small
+    dict of recent inserts that is merged into the array once it grows.
+    """
+
+    MERGE_AT = 4096
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.ids = np.empty(0, dtype=np.int32)
+        self.recent = {}
+        self.recent_count = 0
+
+    def add(self, key: int, row: int):
+        self.recent.setdefault(key, []).append(row)
+        self.recent_count += 1
+        if self.recent_count >= self.MERGE_AT:
+            self.merge()
+
+    def remove(self, key: int, row: int):
+        rows = self.recent.get(key)
+        if rows is not None and row in rows:
+            rows.remove(row)
+            self.recent_count -= 1
+            if not rows:
+                del self.recent[key]
+            return
+        start = self.keys.searchsorted(np.uint64(key), side="left")
+        end = self.keys.searchsorted(np.uint64(key), side="right")
+        matches = np.flatnonzero(self.ids[start:end] == row)
+        if matches.size:
+            self.keys = np.delete(self.keys, start + matches[0])
+            self.ids = np.delete(self.ids, start + matches[0])
+
+    def merge(self):
+        keys = [key for key, rows in self.recent.items() for _ in rows]
+        ids = [row for rows in self.recent.values() for row in rows]
+        keys = np.concatenate([self.keys, np.array(keys, dtype=np.uint64)])
+        ids = np.concatenate([self.ids, np.array(ids, dtype=np.int32)])
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.ids = keys[order], ids[order]
+        self.recent, self.recent_count = {}, 0
+
+    def get(self, key: np.uint64) -> List[int]:
+        # key must be a np.uint64: a Python int would make numpy compare the whole array as objects
+        start = self.keys.searchsorted(key, side="left")
+        end = self.keys.searchsorted(key, side="right")
+        return self.ids[start:end].tolist() + self.recent.get(int(key), [])
+
+
+class MinHashIndex:
+    """
+    LSH index of the rated issues of one repo. Signatures are kept in one growing 2D array,
+    so 100k issues take ~25 MB for signatures, ~19 MB for the band tables and ~30 MB for the
+    per-issue dicts, plus their action items strings: at 1-2 KB each, another 100-200 MB.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signatures = np.empty((1024, NUM_PERM), dtype=np.uint32)
+        self.numbers = []
+        self.rows = {}
+        self.ratings = {}
+        self.action_items = {}
+        self.bands = [_BandTable() for _ in range(BANDS)]
+
+    def add(self, number: int, sig: np.ndarray, rating: int, action_items: str):
+        with self.lock:
+            self.ratings[number] = rating
+            self.action_items[number] = action_items
+            keys = _band_keys(sig[None, :])[0].tolist()
+            row = self.rows.get(number)
+            if row is not None:
+                # Re-rated: the row moves from the buckets of its old signature to those of the new one.
+                for band, old, new in zip(self.bands, _band_keys(self.signatures[row][None, :])[0].tolist(), keys):
+                    if old != new:
+                        band.remove(old, row)
+                        band.add(new, row)
+                self.signatures[row] = sig
+                return
+            row = len(self.numbers)
+            if row == len(self.signatures):
+                self.signatures = np.concatenate([self.signatures, np.empty_like(self.signatures)])
+            self.signatures[row] = sig
+            self.numbers.append(number)
+            self.rows[number] = row
+            for band, key in zip(self.bands, keys):
+                band.add(key, row)
+
+    def query(self, sig: np.ndarray, exclude: Optional[int] = None):
+        """Return (issue number, estimated similarity) of the most similar indexed issue, or None."""
+        with self.lock:
+            candidates = set()
+            for band, key in zip(self.bands, _band_keys(sig[None, :])[0]):
+                candidates.update(band.get(key))
+            candidates.discard(self.rows.get(exclude))
+            if not candidates:
+                return None
+            rows = np.fromiter(candidates, dtype=np.int64)
+            similarity = (self.signatures[rows] == sig).mean(axis=1)
+            best = int(similarity.argmax())
+            return self.numbers[rows[best]], float(similarity[best])
+
+
+# repo -> index of its LLM-rated issues
+_indexes: Dict[str, MinHashIndex] = {}
+# repo -> issue number -> signature, for fetched issues of running runs; least recently staged first
+_staged: "OrderedDict[str, Dict[int, np.ndarray]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _index(repoID: str) -> MinHashIndex:
+    with _lock:
+        index = _indexes.get(repoID)
+        if index is None:
+            index = _indexes[repoID] = MinHashIndex()
+        return index
+
+
+def stage(repoID: str, issue_details: List[dict]):
+    """Compute the signatures of freshly fetched issues so they can be matched when evaluated."""
+    staged = {issue["number"]: signature(f"{issue.get('title') or ''}\n{issue.get('body') or ''}")
+              for issue in issue_details}
+    with _lock:
+        _staged.setdefault(repoID, {}).update(staged)
+        _staged.move_to_end(repoID)
+        total = sum(len(signatures) for signatures in _staged.values())
+        while total > max_staged and len(_staged) > 1:
+            _, evicted = _staged.popitem(last=False)
+            total -= len(evicted)
+
+
+def unstage(repoID: str, issue_numbers: Iterable[int]):
+    """Drop the signatures of the issues of a finished run."""
+    with _lock:
+        staged = _staged.get(repoID)
+        if staged is None:
+            return
+        for number in issue_numbers:
+            staged.pop(number, None)
+        if not staged:
+            del _staged[repoID]
+
+
+def find_similar(repoID: str, issue_number: int) -> Optional[dict]:
+    """
+    Find the most similar already-rated issue of the repo.
+
+    Args:
+        repoID (str): The repo ("owner/repo").
+        issue_number (int): A fetched (staged) issue.
+
+    Returns:
+        dict: "issue", "similarity", "rating" and "action_items" of the match if its similarity is at
+        least seed_threshold, else None.
+    """
+    with _lock:
+        sig = _staged.get(repoID, {}).get(issue_number)
+    if sig is None:
+        return None
+    index = _index(repoID)
+    match = index.query(sig, exclude=issue_number)
+    if match is None or match[1] < seed_threshold:
+        return None
+    number, similarity = match
+    return {"issue": number, "similarity": round(similarity, 3),
+            "rating": index.ratings[number], "action_items": index.action_items[number]}
+
+
+def add_rated(repoID: str, issue_number: int, rating: int, action_items: str):
+    """Index an issue the LLM has rated, so later near-duplicates can reuse the rating."""
+    with _lock:
+        sig = _staged.get(repoID, {}).get(issue_number)
+    if sig is not None:
+        _index(repoID).add(issue_number, sig, rating, action_items)
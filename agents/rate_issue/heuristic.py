@@ -0,0 +1,350 @@
+import os
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from typing_extensions import Dict, List, Optional, Tuple
+
+from metrics import heuristic_ratings, heuristic_shadow
+
+load_dotenv()
+
+# Trained model, LLM rating history it is trained from, and the confidence above which
+# the heuristic rating is used instead of evaluating the issue with the LLM agents.
+model_file = os.getenv("HEURISTIC_MODEL", "heuristic_model.json")
+history_file = os.getenv("RATING_HISTORY", "rating_history.jsonl")
+confidence_threshold = float(os.getenv("HEURISTIC_THRESHOLD", "0.8"))
+# Fraction of confidently scored issues still sent to the LLM to measure live agreement,
+# and how many rating points apart still count as agreeing.
+shadow_rate = float(os.getenv("HEURISTIC_SHADOW_RATE", "0.05"))
+agreement_tolerance = int(os.getenv("HEURISTIC_TOLERANCE", "10"))
+
+# Checked in order; the first label class an issue matches wins.
+LABEL_CLASSES = [
+    ("duplicate", ("duplicate",)),
+    ("invalid", ("invalid", "wontfix", "won't fix", "stale")),
+    ("question", ("question", "support", "discussion")),
+    ("docs", ("documentation", "docs", "typo")),
+    ("good_first", ("good first issue", "beginner", "easy")),
+    ("bug", ("bug", "crash", "regression")),
+    ("feature", ("enhancement", "feature", "proposal")),
+]
+
+FEATURE_NAMES = ("label", "body", "comments", "reactions", "age", "code")
+
+# Feature subsets used for back-off, from the most specific to the global mean.
+BACKOFF_LEVELS = [
+    FEATURE_NAMES,
+    ("label", "body", "code", "comments"),
+    ("label", "body", "code"),
+    ("label",),
+    (),
+]
+
+
+def _bucket(value: float, bounds: Tuple[float, ...]) -> int:
+    for i, bound in enumerate(bounds):
+        if value < bound:
+            return i
+    return len(bounds)
+
+
+def extract_features(issue: dict, now: Optional[float] = None) -> Dict[str, object]:
+    """
+    Compute the cheap, discretized features of a GitHub issue.
+
+    Args:
+        issue (dict): Issue JSON as returned by the GitHub issues endpoint.
+        now (float): Reference UNIX time for the age feature, defaults to the current time.
+
+    Returns:
+        dict: Feature name -> bucket.
+    """
+    labels = [label["name"].lower() if isinstance(label, dict) else str(label).lower()
+              for label in issue.get("labels") or []]
+    label_class = "other"
+    for name, keywords in LABEL_CLASSES:
+        if any(keyword in label for label in labels for keyword in keywords):
+            label_class = name
+            break
+
+    body = issue.get("body") or ""
+    title = (issue.get("title") or "").lower()
+    if label_class == "other" and "typo" in title:
+        label_class = "docs"
+
+    age_days = 0.0
+    if issue.get("created_at"):
+        created = datetime.fromisoformat(issue["created_at"].replace("Z", "+00:00")).timestamp()
+        age_days = ((now or time.time()) - created) / 86400
+
+    return {
+        "label": label_class,
+        "body": _bucket(len(body), (1, 200, 1000, 4000)),
+        "comments": _bucket(issue.get("comments") or 0, (1, 3, 10)),
+        "reactions": _bucket((issue.get("reactions") or {}).get("total_count", 0), (1, 5)),
+        "age": _bucket(age_days, (30, 180, 365)),
+        "code": int("```" in body),
+    }
+
+
+# Label keywords that make an issue worth rating (and funding) early, by weight; the highest matching weight counts.
+PRIORITY_LABELS = [
+    (("security", "vulnerability", "critical", "p0", "urgent"), 40),
+    (("priority", "p1", "high"), 30),
+    (("bug", "crash", "regression"), 20),
+    (("help wanted", "good first issue"), 10),
+]
+
+
+def priority(issue: dict, now: Optional[float] = None) -> float:
+    """
+    Cheap estimate of how valuable it is to rate an issue first, from its labels, reactions,
+    comments and how recently it was active (higher is more valuable).
+
+    Args:
+        issue (dict): Issue JSON as returned by the GitHub issues endpoint.
+        now (float): Reference UNIX time for recency, defaults to the current time.
+    """
+    labels = [label["name"].lower() if isinstance(label, dict) else str(label).lower()
+              for label in issue.get("labels") or []]
+    score = max([weight for keywords, weight in PRIORITY_LABELS
+                 if any(keyword in label for label in labels for keyword in keywords)] or [0])
+    score += 10 * math.log1p((issue.get("reactions") or {}).get("total_count", 0))
+    comments = issue.get("comments") or 0
+    score += 5 * math.log1p(comments if isinstance(comments, int) else len(comments))
+    updated = issue.get("updated_at") or issue.get("created_at")
+    if updated:
+        days = ((now or time.time()) - datetime.fromisoformat(updated.replace("Z", "+00:00")).timestamp()) / 86400
+        score += 20 * math.exp(-max(days, 0) / 30)
+    return score
+
+
+def prioritize(issue_details: List[dict]) -> List[int]:
+    """Issue numbers ordered by priority(), highest first (ties keep their order)."""
+    now = time.time()
+    return [issue["number"] for issue in sorted(issue_details, key=lambda issue: -priority(issue, now))]
+
+
+def _key(features: Dict[str, object], level: Tuple[str, ...]) -> str:
+    return "|".join(f"{name}={features[name]}" for name in level)
+
+
+class HeuristicScorer:
+    """
+    Feature-bucket model of the LLM ratings. Every bucket stores how many rated issues fell in it,
+    their mean LLM rating and how many of them were within `tolerance` points of that mean.
+    An issue is rated with the mean of its most reliable bucket, and the confidence is the
+    (smoothed) fraction of past issues in that bucket the mean agreed with, i.e. the expected
+    agreement rate with the LLM.
+    """
+
+    def __init__(self, buckets: Dict[str, List[float]], tolerance: int = 10, min_count: int = 5):
+        # bucket key -> [count, mean rating, ratings within tolerance of the mean]
+        self.buckets = buckets
+        self.tolerance = tolerance
+        self.min_count = min_count
+
+    @classmethod
+    def train(cls, records: List[dict], tolerance: int = 10, min_count: int = 5) -> "HeuristicScorer":
+        """
+        Fit the model on LLM rating history.
+
+        Args:
+            records (List[dict]): Items with "features" (as returned by extract_features) and "rating".
+            tolerance (int): Rating points within which the heuristic counts as agreeing with the LLM.
+            min_count (int): Buckets with fewer ratings are never used.
+
+        Returns:
+            HeuristicScorer: The trained scorer.
+        """
+        buckets = {}
+        for record in records:
+            for level in BACKOFF_LEVELS:
+                bucket = buckets.setdefault(_key(record["features"], level), [0, 0.0, 0])
+                bucket[0] += 1
+                bucket[1] += (float(record["rating"]) - bucket[1]) / bucket[0]
+        # Second pass, now that the bucket means are final.
+        for record in records:
+            for level in BACKOFF_LEVELS:
+                bucket = buckets[_key(record["features"], level)]
+                bucket[2] += abs(float(record["rating"]) - bucket[1]) <= tolerance
+        return cls(buckets, tolerance, min_count)
+
+    def score(self, issue: dict, features: Optional[Dict[str, object]] = None) -> Tuple[int, float]:
+        """
+        Rate an issue without calling the LLM.
+
+        Args:
+            issue (dict): Issue JSON as returned by the GitHub issues endpoint.
+            features (dict): Precomputed features of the issue, if available.
+
+        Returns:
+            Tuple[int, float]: The rating (1-100) and a confidence between 0 and 1.
+        """
+        features = features or extract_features(issue)
+        best_rating, best_confidence = 0, 0.0
+        for level in BACKOFF_LEVELS:
+            bucket = self.buckets.get(_key(features, level))
+            if bucket is None or bucket[0] < self.min_count:
+                continue
+            count, mean, within = bucket
+            # Laplace-smoothed agreement rate; small buckets cannot reach a high confidence.
+            confidence = (within + 1) / (count + 2)
+            if confidence > best_confidence:
+                best_rating, best_confidence = min(100, max(1, round(mean))), confidence
+        return best_rating, best_confidence
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"tolerance": self.tolerance, "min_count": self.min_count, "buckets": self.buckets}, f)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["HeuristicScorer"]:
+        """Load a trained model, or return None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["buckets"], data["tolerance"], data["min_count"])
+
+
+scorer = HeuristicScorer.load(model_file)
+
+# run ID -> issue number -> (features, heuristic rating if shadow-evaluated), for issues sent to the
+# LLM; keyed by run, since runs of the same repo can overlap
+_pending = {}
+_lock = threading.Lock()
+
+def pre_rate(repoID: str, run_id: str, issue_details: List[dict], issues: Dict[int, int]) -> int:
+    """
+    Rate the issues the heuristic scorer is confident about, so they skip the LLM agents.
+
+    Args:
+        repoID (str): The repo the issues belong to ("owner/repo").
+        run_id (str): The run that rates the others (see runs.py); release_pending drops them when it ends.
+        issue_details (List[dict]): Issue JSON objects from the GitHub issues endpoint.
+        issues (Dict[int, int]): Issue number -> rating, updated in place; 0 means unrated.
+
+    Returns:
+        int: Number of issues rated by the heuristic.
+    """
+    pending = {}
+    skipped = 0
+    for issue in issue_details:
+        number = issue.get("number")
+        if number not in issues or issues[number] != 0:
+            continue
+        features = extract_features(issue)
+        if scorer is None:
+            pending[number] = (features, None)
+            continue
+        rating, confidence = scorer.score(issue, features)
+        if confidence < confidence_threshold:
+            pending[number] = (features, None)
+        elif random.random() < shadow_rate:
+            pending[number] = (features, rating)
+        else:
+            issues[number] = rating
+            skipped += 1
+    heuristic_ratings.inc(skipped, outcome="heuristic")
+    heuristic_ratings.inc(len(pending), outcome="llm")
+    with _lock:
+        _pending.setdefault(run_id, {}).update(pending)
+    return skipped
+
+def release_pending(run_id: str):
+    """Forget the issues of a run that ended."""
+    with _lock:
+        _pending.pop(run_id, None)
+
+def fallback_rating(run_id: str, issue_number: int) -> Optional[int]:
+    """
+    Rate an issue that was left to the LLM with the heuristic anyway, whatever its confidence,
+    e.g. once the run's LLM budget is spent.
+
+    Returns:
+        int: The heuristic rating, or None if there is no model or the issue was not pre-rated.
+    """
+    with _lock:
+        features, _ = _pending.get(run_id, {}).pop(issue_number, (None, None))
+    if features is None or scorer is None:
+        return None
+    rating, _ = scorer.score({}, features)
+    return rating or None
+
+def record_llm_rating(repoID: str, run_id: str, issue_number: int, rating: int):
+    """
+    Add an LLM rating to the training history and, if the issue was shadow-evaluated,
+    count whether the heuristic agreed with it.
+    """
+    with _lock:
+        features, predicted = _pending.get(run_id, {}).pop(issue_number, (None, None))
+    if features is None:
+        return
+    record_history(repoID, issue_number, features, rating)
+    if predicted is not None:
+        agreed = abs(predicted - rating) <= agreement_tolerance
+        heuristic_shadow.inc(result="agree" if agreed else "disagree")
+
+
+def record_history(repoID: str, issue_number: int, features: Dict[str, object], rating: int):
+    """Append an LLM rating and the issue's features to the training history."""
+    line = json.dumps({"repo": repoID, "issue": issue_number, "features": features,
+                       "rating": rating, "time": int(time.time())}) + "\n"
+    with _lock:
+        with open(history_file, "a") as f:
+            f.write(line)
+
+
+def measure_agreement(model: HeuristicScorer, records: List[dict], threshold: float, tolerance: int) -> dict:
+    """
+    Measure how often the model would skip the LLM (coverage) and, for those issues,
+    how often it lands within `tolerance` rating points of the LLM (agreement).
+    """
+    covered = agreed = 0
+    for record in records:
+        rating, confidence = model.score({}, record["features"])
+        if confidence >= threshold:
+            covered += 1
+            agreed += abs(rating - int(record["rating"])) <= tolerance
+    return {
+        "issues": len(records),
+        "coverage": covered / len(records) if records else 0.0,
+        "agreement": agreed / covered if covered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the heuristic pre-scorer from LLM rating history.")
+    parser.add_argument("--history", default=history_file)
+    parser.add_argument("--model", default=model_file)
+    parser.add_argument("--threshold", type=float, default=confidence_threshold)
+    parser.add_argument("--tolerance", type=int, default=agreement_tolerance, help="rating points counted as agreement")
+    parser.add_argument("--holdout", type=int, default=5, help="every n-th record is held out for evaluation")
+    args = parser.parse_args()
+
+    with open(args.history) as f:
+        # Keep only the latest rating of every issue.
+        records = {}
+        for line in f:
+            record = json.loads(line)
+            records[(record["repo"], record["issue"])] = record
+    records = list(records.values())
+
+    train = [r for i, r in enumerate(records) if i % args.holdout]
+    test = [r for i, r in enumerate(records) if not i % args.holdout]
+    held_out = HeuristicScorer.train(train, args.tolerance)
+    print("Holdout:", measure_agreement(held_out, test, args.threshold, args.tolerance))
+
+    model = HeuristicScorer.train(records, args.tolerance)
+    model.save(args.model)
+    print(f"Model trained on {len(records)} ratings saved to {args.model}.")
+
+
+if __name__ == "__main__":
+    main()
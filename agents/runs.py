@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from typing_extensions import Dict, Iterator, Optional, Tuple
+
+from ledger import IssueLedger
+
+load_dotenv()
+
+# Progress of every fetch run (its issues and the ratings collected so far) is checkpointed here,
+# so a failed or interrupted run can be resumed or flushed to the contract.
+runs_db = os.getenv("RUNS_DB", "runs.db")
+# A running run that has not checkpointed anything for this long is taken to be abandoned (its
+# process died), so it may be resumed.
+stale_after = float(os.getenv("RUN_STALE_AFTER", "900"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    created INTEGER NOT NULL,
+    updated INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_issues (
+    run_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    rating INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (run_id, number)
+);
+"""
+
+# Run status values
+RUNNING = "running"
+FAILED = "failed"
+# Committed without the issues a time box cut off; they are rated by resuming the run.
+PARTIAL = "partial"
+COMMITTED = "committed"
+
+_local = threading.local()
+
+
+def _connection() -> sqlite3.Connection:
+    # One connection per thread; WAL lets the Flask threads read while a run is writing.
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(runs_db, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def create_run(run_id: str, repoID: str, issues: Dict[int, int]):
+    """
+    Checkpoint a new fetch run with its issues (0 = not rated yet).
+
+    Raises:
+        ValueError: If a run with this id already exists.
+    """
+    now = int(time.time())
+    conn = _connection()
+    try:
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO runs (run_id, repo, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                         (run_id, repoID, RUNNING, now, now))
+            conn.executemany("INSERT INTO run_issues (run_id, number, rating) VALUES (?, ?, ?)",
+                             ((run_id, int(number), int(rating)) for number, rating in issues.items()))
+    except sqlite3.IntegrityError:
+        raise ValueError(f"Run {run_id} already exists.")
+
+
+def claim_run(run_id: str) -> bool:
+    """
+    Mark a run as running for a resume, unless it is committed or another process is still
+    running it (it is running and was updated less than RUN_STALE_AFTER seconds ago).
+
+    Returns:
+        bool: True if the caller may resume the run.
+    """
+    now = int(time.time())
+    cursor = _connection().execute(
+        "UPDATE runs SET status = ?, updated = ? WHERE run_id = ? AND status != ? AND (status != ? OR updated < ?)",
+        (RUNNING, now, run_id, COMMITTED, RUNNING, now - stale_after))
+    return cursor.rowcount == 1
+
+
+def record_rating(run_id: str, number: int, rating: int):
+    """Checkpoint the rating of one issue."""
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("UPDATE run_issues SET rating = ?, error = NULL WHERE run_id = ? AND number = ?",
+                     (int(rating), run_id, int(number)))
+        conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (int(time.time()), run_id))
+
+
+def record_failure(run_id: str, number: int, error: str):
+    """Mark an issue whose evaluation failed; it stays unrated and is retried when the run is resumed."""
+    _connection().execute("UPDATE run_issues SET error = ? WHERE run_id = ? AND number = ?",
+                          (error, run_id, int(number)))
+
+
+def set_status(run_id: str, status: str, message: str = ""):
+    _connection().execute("UPDATE runs SET status = ?, message = ?, updated = ? WHERE run_id = ?",
+                          (status, message, int(time.time()), run_id))
+
+
+def fail_run(run_id: str, message: str):
+    """Mark a run failed if it is running; a run in any other state is left as it is."""
+    _connection().execute("UPDATE runs SET status = ?, message = ?, updated = ? WHERE run_id = ? AND status = ?",
+                          (FAILED, message, int(time.time()), run_id, RUNNING))
+
+
+def load_run(run_id: str) -> Optional[Tuple[str, str, IssueLedger, Dict[int, str]]]:
+    """
+    Load a checkpointed run.
+
+    Returns:
+        tuple: The repo ID, the run status, the issue ledger and the failed issues
+        (issue number -> error), or None if there is no such run.
+    """
+    conn = _connection()
+    run = conn.execute("SELECT repo, status FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if run is None:
+        return None
+    rows = conn.execute("SELECT number, rating, error FROM run_issues WHERE run_id = ? ORDER BY rowid",
+                        (run_id,)).fetchall()
+    ledger = IssueLedger({number: rating for number, rating, _ in rows})
+    failed = {number: error for number, rating, error in rows if error is not None and rating == 0}
+    return run[0], run[1], ledger, failed
+
+
+def iter_run_issues(run_id: str) -> Iterator[Tuple[int, int, Optional[str]]]:
+    """Yield the (issue number, rating, error) of a run in rating order, without loading them all."""
+    yield from _connection().execute("SELECT number, rating, error FROM run_issues WHERE run_id = ? ORDER BY rowid", (run_id,))
+
+
+def run_info(run_id: str) -> Optional[Tuple[str, str, str]]:
+    """The repo ID, status and message of a run, or None if there is no such run."""
+    return _connection().execute("SELECT repo, status, message FROM runs WHERE run_id = ?", (run_id,)).fetchone()
@@ -0,0 +1,248 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from typing_extensions import Callable, List, Optional, Tuple
+
+from admission import Rejected
+from github.client import run
+from interactions.registry import get_registered_repos
+from metrics import counter, gauge
+import runs
+
+load_dotenv()
+
+# Scheduled refresh of the registered repos. Each repo is checked for issue activity with one
+# conditional GitHub request (free when nothing changed) and only refreshed (see the "refresh"
+# action in chain.py) when it did change. A repo's check interval shrinks to the minimum when it
+# changes and doubles every time it did not, so active repos stay fresh and idle ones cost about
+# one request a day. The schedule is kept in SQLite, so checks that fell due while the scheduler
+# was down run as soon as it is back.
+scheduler_db = os.getenv("SCHEDULER_DB", "scheduler.db")
+min_interval = float(os.getenv("SCHEDULER_MIN_INTERVAL", "600"))
+max_interval = float(os.getenv("SCHEDULER_MAX_INTERVAL", "86400"))
+backoff = float(os.getenv("SCHEDULER_BACKOFF", "2"))
+# Every interval is stretched or shrunk by up to this fraction, so repos drift apart.
+jitter = float(os.getenv("SCHEDULER_JITTER", "0.1"))
+# Repos checked or refreshed at once, across all repos.
+concurrency = int(os.getenv("SCHEDULER_CONCURRENCY", "2"))
+# Longest the scheduler sleeps before looking for newly registered repos.
+poll_interval = float(os.getenv("SCHEDULER_POLL", "60"))
+# A claimed repo that was not rescheduled within this time (the process died) is due again.
+lease = float(os.getenv("SCHEDULER_LEASE", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule (
+    repo TEXT PRIMARY KEY,
+    next_run REAL NOT NULL,
+    interval REAL NOT NULL,
+    etag TEXT NOT NULL DEFAULT '',
+    activity TEXT NOT NULL DEFAULT '',
+    last_check REAL,
+    last_change REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT ''
+);
+"""
+
+scheduler_checks = counter("gitgrant_scheduler_checks_total", "Scheduled repo checks by outcome.", ("outcome",))
+scheduler_overdue = gauge("gitgrant_scheduler_overdue_repos", "Repos whose scheduled check is due but not started yet.")
+
+_local = threading.local()
+
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(scheduler_db, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def jittered(interval: float) -> float:
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+def sync_repos(repoIDs: List[str], now: float):
+    """Add newly registered repos to the schedule, spread over the first interval, and drop unknown ones."""
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN")
+        known = {row[0] for row in conn.execute("SELECT repo FROM schedule")}
+        conn.executemany("INSERT INTO schedule (repo, next_run, interval) VALUES (?, ?, ?)",
+                         ((repoID, now + random.uniform(0, min_interval), min_interval) for repoID in repoIDs if repoID not in known))
+        conn.executemany("DELETE FROM schedule WHERE repo = ?", ((repoID,) for repoID in known - set(repoIDs)))
+
+
+def claim_due(now: float, limit: int) -> List[Tuple[str, float, str, str, int]]:
+    """
+    Take up to `limit` due repos, most overdue first. A claimed repo is pushed back by the lease,
+    so neither this nor another process picks it up again while it is being checked.
+
+    Returns:
+        list: (repoID, interval, etag, activity, failures) of the claimed repos.
+    """
+    conn = _connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        scheduler_overdue.set(conn.execute("SELECT COUNT(*) FROM schedule WHERE next_run <= ?", (now,)).fetchone()[0])
+        rows = conn.execute("SELECT repo, interval, etag, activity, failures FROM schedule WHERE next_run <= ? "
+                            "ORDER BY next_run LIMIT ?", (now, limit)).fetchall()
+        conn.executemany("UPDATE schedule SET next_run = ? WHERE repo = ?", ((now + lease, row[0]) for row in rows))
+    return rows
+
+
+def next_due() -> Optional[float]:
+    """When the next check falls due, or None if no repo is scheduled."""
+    return _connection().execute("SELECT MIN(next_run) FROM schedule").fetchone()[0]
+
+
+def reschedule(repoID: str, next_run: float, interval: float, failures: int, message: str,
+               etag: Optional[str] = None, activity: Optional[str] = None, changed: bool = False):
+    conn = _connection()
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("UPDATE schedule SET next_run = ?, interval = ?, failures = ?, message = ?, last_check = ?, "
+                     "etag = COALESCE(?, etag), activity = COALESCE(?, activity), "
+                     "last_change = CASE WHEN ? THEN ? ELSE last_change END WHERE repo = ?",
+                     (next_run, interval, failures, message, now, etag, activity, changed, now, repoID))
+
+
+def schedule() -> List[dict]:
+    """The schedule of all repos, next due first."""
+    rows = _connection().execute("SELECT repo, next_run, interval, last_check, last_change, failures, message "
+                                 "FROM schedule ORDER BY next_run").fetchall()
+    return [{"repo": repo, "next_run": next_run, "interval": interval, "last_check": last_check,
+             "last_change": last_change, "failures": failures, "message": message}
+            for repo, next_run, interval, last_check, last_change, failures, message in rows]
+
+
+class Scheduler:
+    """
+    Checks the registered repos on their schedule and refreshes the ones that changed.
+
+    Args:
+        invoke (Callable): Runs the chain on an input state and returns the final state; it may raise
+            Rejected (admission control) to have the refresh retried later.
+    """
+
+    def __init__(self, invoke: Callable[[dict], dict], concurrency: int = concurrency):
+        self.invoke = invoke
+        self.concurrency = concurrency
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="scheduler")
+        self.lock = threading.Lock()
+        self.running = 0
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+
+    def check(self, repoID: str, interval: float, etag: str, activity: str, failures: int):
+        owner, repo = repoID.split("/", 1)
+        now = time.time()
+        try:
+            latest = run(lambda github: github.latest_activity(owner, repo, etag or None))
+            if latest is None or latest[1] == activity:
+                # Nothing happened: back off towards the maximum interval.
+                interval = min(max_interval, interval * backoff)
+                scheduler_checks.inc(outcome="unchanged")
+                reschedule(repoID, now + jittered(interval), interval, 0, "unchanged",
+                           etag=latest[0] if latest else None)
+                return
+            state = {"action": "refresh", "owner": owner, "repo": repo, "run_id": runs.new_run_id()}
+            try:
+                final_state = self.invoke(state)
+            except Rejected as e:
+                # The server is busy; the change is picked up again on the next try.
+                scheduler_checks.inc(outcome="rejected")
+                reschedule(repoID, time.time() + e.retry_after, interval, failures, str(e))
+                return
+            except Exception:
+                runs.fail_run(state["run_id"], "refresh failed")
+                raise
+            scheduler_checks.inc(outcome="changed")
+            # The ETag is only stored once every issue was rated and committed (or the repo was up to
+            # date); after a partial or failed refresh the next check sees the change and refreshes again.
+            info = runs.run_info(state["run_id"])
+            completed = not final_state.get("failed") and (info is None or info[1] == runs.COMMITTED)
+            reschedule(repoID, time.time() + jittered(min_interval), min_interval, 0, final_state.get("message", ""),
+                       etag=latest[0] if completed else None, activity=latest[1] if completed else None, changed=True)
+        except Exception as e:
+            scheduler_checks.inc(outcome="error")
+            retry = min(max_interval, min_interval * 2 ** failures)
+            reschedule(repoID, time.time() + jittered(retry), interval, failures + 1, f"{type(e).__name__}: {e}")
+
+    def _run(self, row: tuple):
+        try:
+            self.check(*row)
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.wake.set()
+
+    def run_forever(self):
+        """Check due repos until stop is set; at most `concurrency` at a time."""
+        while not self.stop.is_set():
+            now = time.time()
+            sync_repos(get_registered_repos(), now)
+            with self.lock:
+                free = self.concurrency - self.running
+            for row in claim_due(now, free) if free > 0 else []:
+                with self.lock:
+                    self.running += 1
+                self.pool.submit(self._run, row)
+            due = next_due()
+            timeout = poll_interval if due is None else min(poll_interval, max(0.0, due - time.time()))
+            self.wake.wait(timeout)
+            self.wake.clear()
+        self.pool.shutdown(wait=True)
+
+    def start(self) -> threading.Thread:
+        """Run the scheduler on a daemon thread."""
+        thread = threading.Thread(target=self.run_forever, name="scheduler", daemon=True)
+        thread.start()
+        return thread
+
+
+def serve():
+    """Run the scheduler in this process, invoking the chain directly, until interrupted."""
+    from chain import init_chain
+    import budget
+
+    chain = init_chain()
+    recursion_limit = int(os.getenv("RECURSION_LIMIT", "100000"))
+
+    def invoke(state: dict) -> dict:
+        with budget.track(state):
+            return chain.invoke(state, {"recursion_limit": recursion_limit})
+
+    scheduler = Scheduler(invoke)
+    print(f"Scheduling {len(get_registered_repos())} registered repos (schedule in {scheduler_db}).")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop.set()
+        scheduler.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the registered repos rated: check them for changes on a schedule and refresh the ones that changed.")
+    parser.add_argument("--list", action="store_true", help="print the schedule and exit")
+    args = parser.parse_args()
+    if args.list:
+        now = time.time()
+        for entry in schedule():
+            print(f"{entry['repo']:40}  due in {entry['next_run'] - now:8.0f}s  every {entry['interval']:6.0f}s  "
+                  f"failures {entry['failures']}  {entry['message']}")
+        return
+    serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import threading
+from typing_extensions import Any, Callable, Hashable, Tuple
+
+
+class _Call:
+    """An in-flight call that later identical callers attach to."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs the function,
+    later callers wait for it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers using the same key.
+
+        Args:
+            key (Hashable): Identifies identical work.
+            fn (Callable): The work, called without arguments.
+
+        Returns:
+            Tuple[Any, bool]: The result of fn, and whether it was shared with another caller.
+
+        Raises:
+            Exception: Whatever fn raised, re-raised in every caller.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+_repo_locks = {}
+_repo_locks_lock = threading.Lock()
+
+def repo_lock(repoID: str) -> threading.RLock:
+    """
+    Lock serializing state-mutating contract writes (and the reads they depend on) of one repo.
+    Re-entrant, so a read-compute-write sequence can hold it around the write helpers that take it too.
+    """
+    with _repo_locks_lock:
+        lock = _repo_locks.get(repoID)
+        if lock is None:
+            lock = _repo_locks[repoID] = threading.RLock()
+        return lock
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from dotenv import load_dotenv
+from typing_extensions import Dict, Iterable, List, Optional, Tuple
+
+load_dotenv()
+
+# Columnar snapshot of every cached issue rating, written by the dashboard cache after the
+# ratings changed and memory-mapped when it starts, so aggregates over all repos are numpy
+# operations on the mapped file instead of RPC reads of every repo.
+snapshot_file = os.getenv("SNAPSHOT_FILE", "ratings.snapshot")
+
+MAGIC = b"GGRSNAP1"
+# Every array starts at a multiple of this many bytes.
+ALIGN = 64
+RATING_RANGE = (0, 100)
+
+# Columns with one row per issue. Rows are grouped by repo, in the order of the string table, and
+# keep the on-chain order within a repo. Rewards are in wei, which does not fit in 64 bits, so
+# they are kept as the high and low 64 bits of a 128-bit integer.
+ROW_COLUMNS = {
+    "repo": "<u4",        # index into the string table
+    "issue": "<i8",
+    "rating": "<i4",
+    "updated_at": "<i8",  # when the issue last got this rating (Unix time)
+    "reward_hi": "<u8",
+    "reward_lo": "<u8",
+}
+# Columns with one entry per repo, plus one: the first row of each repo, the start of each
+# repo ID in the string bytes.
+REPO_COLUMNS = {
+    "repo_start": "<u8",
+    "string_offsets": "<u8",
+}
+
+_LOW = (1 << 64) - 1
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write(path: str, repos: Dict[str, Iterable[Tuple[int, int, int, int]]]):
+    """
+    Write a snapshot, replacing the file atomically (readers that mapped the old one keep it).
+
+    Args:
+        path (str): Snapshot file.
+        repos (dict): repoID -> (issue number, rating, reward in wei, updated_at) of its issues.
+    """
+    repoIDs = sorted(repos)
+    rows = [(index, *issue) for index, repoID in enumerate(repoIDs) for issue in repos[repoID]]
+    counts = np.bincount(np.fromiter((row[0] for row in rows), np.int64, len(rows)), minlength=len(repoIDs))
+    names = [repoID.encode() for repoID in repoIDs]
+    strings = np.frombuffer(b"".join(names), np.uint8)
+    arrays = {
+        "repo": [row[0] for row in rows],
+        "issue": [row[1] for row in rows],
+        "rating": [row[2] for row in rows],
+        "updated_at": [row[4] for row in rows],
+        "reward_hi": [row[3] >> 64 for row in rows],
+        "reward_lo": [row[3] & _LOW for row in rows],
+        "repo_start": np.concatenate(([0], np.cumsum(counts))),
+        "string_offsets": np.concatenate(([0], np.cumsum([len(name) for name in names], dtype=np.int64))),
+    }
+    arrays = {name: np.asarray(values, dtype={**ROW_COLUMNS, **REPO_COLUMNS}[name]) for name, values in arrays.items()}
+    arrays["strings"] = strings
+
+    # Header: magic, header length, JSON header; then the arrays, each aligned.
+    header = {"rows": len(rows), "repos": len(repoIDs), "created": int(time.time()), "columns": {}}
+    offset = 0
+    for name, array in arrays.items():
+        header["columns"][name] = [array.dtype.str, offset, len(array)]
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(header).encode()
+    start = _aligned(len(MAGIC) + 4 + len(encoded))
+
+    # A temp file of its own, since every server worker writes the same snapshot.
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + len(encoded).to_bytes(4, "little") + encoded)
+            for name, array in arrays.items():
+                f.seek(start + header["columns"][name][1])
+                f.write(array.tobytes())
+            f.truncate(start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot. The columns are read-only numpy views of the file, so opening one
+    costs the same for any number of issues and pages are only read when they are used.
+
+    Args:
+        path (str): Snapshot file.
+
+    Raises:
+        ValueError: If the file is not a snapshot.
+    """
+
+    def __init__(self, path: str):
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(data) < len(MAGIC) + 4 or bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a ratings snapshot.")
+        length = int.from_bytes(bytes(data[len(MAGIC):len(MAGIC) + 4]), "little")
+        header = json.loads(bytes(data[len(MAGIC) + 4:len(MAGIC) + 4 + length]))
+        start = _aligned(len(MAGIC) + 4 + length)
+        columns = {}
+        for name, (dtype, offset, count) in header["columns"].items():
+            dtype = np.dtype(dtype)
+            columns[name] = data[start + offset:start + offset + count * dtype.itemsize].view(dtype)
+        self.path = path
+        self.created: int = header["created"]
+        self.repo, self.issue, self.rating = columns["repo"], columns["issue"], columns["rating"]
+        self.updated_at = columns["updated_at"]
+        self.reward_hi, self.reward_lo = columns["reward_hi"], columns["reward_lo"]
+        self.repo_start = columns["repo_start"]
+        offsets, strings = columns["string_offsets"], columns["strings"]
+        self.repos: List[str] = [bytes(strings[offsets[i]:offsets[i + 1]]).decode() for i in range(header["repos"])]
+        self.index = {repoID: i for i, repoID in enumerate(self.repos)}
+
+    def __len__(self) -> int:
+        return len(self.issue)
+
+    def rows(self, repoID: Optional[str] = None) -> Optional[slice]:
+        """The rows of a repo (all rows for None), or None if the repo is not in the snapshot."""
+        if repoID is None:
+            return slice(0, len(self))
+        i = self.index.get(repoID)
+        if i is None:
+            return None
+        return slice(int(self.repo_start[i]), int(self.repo_start[i + 1]))
+
+    def rewards(self, rows: slice = slice(None)) -> np.ndarray:
+        """Rewards in wei as float64 (rounded above 2**53 wei), for ranking and aggregates."""
+        return self.reward_hi[rows] * 2.0 ** 64 + self.reward_lo[rows]
+
+    def reward(self, row: int) -> int:
+        """The exact reward of a row in wei."""
+        return int(self.reward_hi[row]) << 64 | int(self.reward_lo[row])
+
+    def issues(self, repoID: str) -> Optional[List[Tuple[int, int, int, int]]]:
+        """(issue number, rating, reward, updated_at) of a repo's issues, in on-chain order."""
+        rows = self.rows(repoID)
+        if rows is None:
+            return None
+        return [(int(self.issue[row]), int(self.rating[row]), self.reward(row), int(self.updated_at[row]))
+                for row in range(rows.start, rows.stop)]
+
+    def top_issues(self, n: int, repoID: Optional[str] = None) -> List[dict]:
+        """
+        The `n` issues with the largest rewards, of one repo or of all repos.
+
+        Returns:
+            list: {"repo", "issue", "rating", "reward" (wei, as a string), "updated_at"}, largest reward first.
+        """
+        rows = self.rows(repoID)
+        if rows is None or n <= 0:
+            return []
+        rewards = self.rewards(rows)
+        if n < len(rewards):
+            candidates = np.argpartition(-rewards, n - 1)[:n]
+        else:
+            candidates = np.arange(len(rewards))
+        candidates += rows.start
+        # Exact order among the candidates: by the high, then the low 64 bits, largest first.
+        order = candidates[np.lexsort((self.reward_lo[candidates], self.reward_hi[candidates]))[::-1]]
+        return [{"repo": self.repos[self.repo[row]], "issue": int(self.issue[row]), "rating": int(self.rating[row]),
+                 "reward": str(self.reward(row)), "updated_at": int(self.updated_at[row])} for row in order]
+
+    def rating_histogram(self, repoID: Optional[str] = None, bins: int = 10) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Rating distribution of a repo (all repos for None) over `bins` equal bins of the rating range.
+
+        Returns:
+            tuple: (counts, bin edges), or None if the repo is not in the snapshot.
+        """
+        rows = self.rows(repoID)
+        if rows is None:
+            return None
+        return np.histogram(self.rating[rows], bins=bins, range=RATING_RANGE)
+
+    def rating_histograms(self, bins: int = 10) -> np.ndarray:
+        """Rating distribution of every repo at once: a (repos, bins) array of counts, repos in `self.repos` order."""
+        edges = np.linspace(*RATING_RANGE, bins + 1)
+        # Same bins as np.histogram: the last one includes the upper end of the range.
+        binned = np.clip(np.searchsorted(edges, self.rating, side="right") - 1, 0, bins - 1)
+        counts = np.zeros((len(self.repos), bins), dtype=np.int64)
+        np.add.at(counts, (self.repo, binned), 1)
+        return counts
+
+
+def load(path: str = snapshot_file) -> Optional[Snapshot]:
+    """Map a snapshot, or return None if there is none (or it is unreadable)."""
+    try:
+        return Snapshot(path)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, json.JSONDecodeError) as e:
+        print(f"Ignoring ratings snapshot {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the ratings snapshot without touching the chain.")
+    parser.add_argument("--file", default=snapshot_file, help="snapshot file (default: SNAPSHOT_FILE)")
+    parser.add_argument("--repo", help="limit to one repo (owner/repo)")
+    parser.add_argument("--top", type=int, default=10, help="issues with the largest rewards to print")
+    parser.add_argument("--bins", type=int, default=10, help="bins of the rating histogram")
+    args = parser.parse_args()
+    snapshot = load(args.file)
+    if snapshot is None:
+        parser.error(f"no snapshot at {args.file}")
+    rows = snapshot.rows(args.repo)
+    if rows is None:
+        parser.error(f"{args.repo} is not in the snapshot")
+    print(f"{rows.stop - rows.start} issues in {1 if args.repo else len(snapshot.repos)} repos, "
+          f"written {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created))}")
+    for issue in snapshot.top_issues(args.top, args.repo):
+        print(f"{issue['repo']:40} #{issue['issue']:<8} rating {issue['rating']:3}  reward {issue['reward']}")
+    counts, edges = snapshot.rating_histogram(args.repo, args.bins)
+    for count, low, high in zip(counts, edges, edges[1:]):
+        print(f"{low:5.0f}-{high:<5.0f} {count}")
+
+
+if __name__ == "__main__":
+    main()
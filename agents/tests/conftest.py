@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# The agents are flat modules that read their data files relative to this directory.
+AGENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENTS_DIR)
+os.chdir(AGENTS_DIR)
+
+# Local state of the modules goes to a scratch directory instead of the working tree.
+state_dir = tempfile.mkdtemp(prefix="gitgrant-tests-")
+for name, file in (("RUNS_DB", "runs.db"), ("DASHBOARD_DB", "dashboard.db"), ("SCHEDULER_DB", "scheduler.db"),
+                   ("SNAPSHOT_FILE", "ratings.snapshot"), ("RATING_HISTORY", "rating_history.jsonl"),
+                   ("HEURISTIC_MODEL", "heuristic_model.json"), ("PROFILE_DIR", "profiles")):
+    os.environ[name] = os.path.join(state_dir, file)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# Modules are imported replaying an empty cassette, so no test can reach GitHub, OpenAI, CDP or
+# the chain; tests that record or replay interactions set cassette.active themselves.
+empty_cassette = os.path.join(state_dir, "empty.cassette")
+open(empty_cassette, "w").close()
+os.environ["CASSETTE"] = empty_cassette
+os.environ["CASSETTE_MODE"] = "replay"
+os.environ["CASSETTE_LATENCY"] = "zero"
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from admission import Admission, Rejected, BULK, CRITICAL, STANDARD
+
+
+def limits(critical=8, standard=8, bulk=8):
+    return {CRITICAL: critical, STANDARD: standard, BULK: bulk}
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reserved_slots_are_kept_for_critical_requests():
+    admission = Admission(2, 1, limits(), 2, timeout=0.1)
+    admission.acquire("fetch", "o/a")
+    with pytest.raises(Rejected) as rejected:
+        admission.acquire("fetch", "o/b")
+    assert rejected.value.reason == "queue timeout"
+    assert admission.acquire("resolve", "o/a").priority == CRITICAL
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    admission = Admission(1, 0, limits(standard=0), 2, timeout=10)
+    admission.acquire("fetch")
+    with pytest.raises(Rejected) as rejected:
+        admission.acquire("fetch")
+    assert rejected.value.reason == "queue full"
+    assert rejected.value.retry_after >= 1
+
+
+def test_one_repo_cannot_fill_a_queue():
+    admission = Admission(1, 0, limits(), 1, timeout=10)
+    running = admission.acquire("fetch", "o/a")
+    waiter = threading.Thread(target=lambda: admission.release(admission.acquire("fetch", "o/a")))
+    waiter.start()
+    wait_until(lambda: admission.queues[STANDARD])
+    with pytest.raises(Rejected) as rejected:
+        admission.acquire("fetch", "o/a")
+    assert rejected.value.reason == "repo queue full"
+    admission.release(running)
+    waiter.join(timeout=5)
+
+
+def test_waiting_requests_are_admitted_highest_class_first():
+    admission = Admission(1, 0, limits(), 2, timeout=10)
+    running = admission.acquire("fetch")
+    order = []
+
+    def request(action):
+        ticket = admission.acquire(action)
+        order.append(action)
+        admission.release(ticket)
+
+    waiters = []
+    for action, priority in (("refresh", BULK), ("fetch", STANDARD), ("resolve", CRITICAL)):
+        waiters.append(threading.Thread(target=request, args=(action,)))
+        waiters[-1].start()
+        wait_until(lambda: admission.queues[priority])
+    admission.release(running)
+    for waiter in waiters:
+        waiter.join(timeout=5)
+    assert order == ["resolve", "fetch", "refresh"]
+    assert admission.running == 0
@@ -0,0 +1,43 @@
+import gzip
+import json
+
+import pytest
+
+import app
+import dashboard
+
+
+@pytest.fixture
+def client(monkeypatch):
+    issues = [[number, 50, str(10 ** 18)] for number in range(1, 200)]
+    monkeypatch.setitem(dashboard.cache.repos, "o/r", {"repo": "o/r", "owner": "o", "remaining_budget": str(10 ** 20),
+                                                        "rating_sum": 50 * len(issues), "issue_count": len(issues),
+                                                        "updated": 0, "paid_out": "0", "issues": issues})
+    return app.app.test_client()
+
+
+def test_gzipped_dashboard_response_has_its_own_etag(client):
+    plain = client.get("/dashboard/repos/o/r/issues?per_page=200", headers={"Accept-Encoding": "identity"})
+    zipped = client.get("/dashboard/repos/o/r/issues?per_page=200", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert zipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gz"'
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+    assert zipped.headers["Vary"] == plain.headers["Vary"] == "Accept-Encoding"
+
+    revalidated = client.get("/dashboard/repos/o/r/issues?per_page=200",
+                             headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["ETag"]})
+    assert revalidated.status_code == 304
+    # An ETag of the uncompressed body does not validate the gzipped one.
+    crossed = client.get("/dashboard/repos/o/r/issues?per_page=200",
+                         headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]})
+    assert crossed.status_code == 200
+
+
+def test_uncached_registered_repo_is_refreshed(client, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(app, "get_registered_repos", lambda: ["o/new"])
+    monkeypatch.setattr(dashboard.cache, "request_refresh", refreshed.append)
+    assert client.get("/dashboard/repos/o/new").status_code == 404
+    assert client.get("/dashboard/repos/o/unknown").status_code == 404
+    assert client.get("/dashboard/repos/o/r").status_code == 200
+    assert refreshed == ["o/new"]
@@ -0,0 +1,62 @@
+import threading
+
+import batch
+import chain
+import runs
+from batch import FairQueue
+
+
+def test_get_round_robin_across_repos():
+    work = FairQueue()
+    for task in (1, 2, 3):
+        work.put("o/big", task)
+    work.put("o/small", 10)
+    assert [work.get() for _ in range(4)] == [("o/big", 1), ("o/small", 10), ("o/big", 2), ("o/big", 3)]
+
+
+def test_close_drops_queued_tasks():
+    work = FairQueue()
+    work.put("o/a", 1)
+    work.put("o/b", 2)
+    work.close()
+    assert work.get() is None
+    work.put("o/a", 3)
+    assert work.get() is None
+
+
+def test_close_wakes_waiting_workers():
+    work = FairQueue()
+    results = []
+    worker = threading.Thread(target=lambda: results.append(work.get()))
+    worker.start()
+    work.close()
+    worker.join(timeout=5)
+    assert results == [None]
+
+
+def test_failing_issue_does_not_drop_its_repo(monkeypatch):
+    details = {"o/a": [{"number": n, "title": f"Issue {n}", "labels": [], "comments": 0} for n in (1, 2, 3)],
+               "o/b": [{"number": 4, "title": "Issue 4", "labels": [], "comments": 0}]}
+    written = {}
+
+    def evaluate(owner, repo, issue, reduced=False):
+        if issue == 2:
+            raise RuntimeError("agent crashed")
+        return f"items of {issue}", None
+
+    monkeypatch.setattr(chain, "issue_attempts", 1)
+    monkeypatch.setattr(batch, "get_all_open_issue_details", lambda owner, repo: details[f"{owner}/{repo}"])
+    monkeypatch.setattr(batch, "evaluate", evaluate)
+    monkeypatch.setattr(batch, "rate", lambda action_items: 10 * int(action_items.split()[-1]))
+    monkeypatch.setattr(batch, "update_issues", lambda repoID, numbers, ratings, total: written.update({repoID: (numbers, ratings, total)}))
+
+    results = {result["repo"]: result for result in batch.run_batch(["o/a", "o/b"])}
+
+    a = results["o/a"]
+    assert "error" not in a
+    assert a["issues"] == {1: 10, 3: 30} and list(a["failed"]) == [2]
+    assert written["o/a"] == (["1", "3"], ["10", "30"], "40")
+    repoID, status, ledger, failed = runs.load_run(a["run_id"])
+    assert status == runs.FAILED and list(failed) == [2] and ledger.to_dict() == {1: 10, 2: 0, 3: 30}
+    assert results["o/b"]["issues"] == {4: 40} and not results["o/b"]["failed"]
+    assert runs.run_info(results["o/b"]["run_id"])[1] == runs.COMMITTED
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import cassette
+import chain
+import dashboard
+from interactions import deploy
+from rate_issue import dedup
+
+ISSUES = [
+    {"number": 7, "title": "Crash when the config file is missing", "body": "Starting without config.yaml raises KeyError.",
+     "labels": [{"name": "bug"}], "comments": 3, "reactions": {"total_count": 2}, "updated_at": "2024-05-01T00:00:00Z"},
+    {"number": 9, "title": "Document the plugin API", "body": "There is no reference for writing plugins.",
+     "labels": [{"name": "docs"}], "comments": 0, "reactions": {"total_count": 0}, "updated_at": "2024-04-01T00:00:00Z"},
+]
+RATINGS = {"Owner:o, Repo:r, Issue:7": "40", "Owner:o, Repo:r, Issue:9": "15"}
+
+
+class Agent:
+    """An LLM agent whose replies go through the cassette, like the real agents' model calls."""
+
+    def __init__(self, name, reply):
+        self.reply = reply
+        self.invoke = cassette.recorded(
+            "llm",
+            key=lambda inputs: [name, [str(message) for message in inputs["messages"]]],
+            encode=lambda result: result["messages"][-1].content,
+            decode=lambda content: {"messages": [AIMessage(content)]},
+        )(self._invoke)
+
+    def _invoke(self, inputs):
+        if self.reply is None:
+            raise AssertionError("the service was called during replay")
+        return {"messages": [AIMessage(self.reply(str(inputs["messages"][-1])))]}
+
+
+def services(monkeypatch, live: bool):
+    # The network-facing functions of a fetch, answering only while recording.
+    writes = []
+
+    def issues(owner, repo):
+        assert live, "the service was called during replay"
+        return ISSUES
+
+    def send(method, args, repoID, owner):
+        assert live, "the service was called during replay"
+        return {"transactionHash": "0x01", "gasUsed": 21000}
+
+    def route(prompt):
+        return json.dumps({"ACTION": "FETCH", "RESULT": [9, 7]})
+
+    def action_items(prompt):
+        return "Fix it for " + prompt
+
+    def rating(action_items):
+        return RATINGS[action_items.removeprefix("Fix it for ")]
+
+    monkeypatch.setattr(chain, "meta_agent", Agent("meta", route if live else None))
+    monkeypatch.setattr(chain, "github_agent", Agent("github", action_items if live else None))
+    monkeypatch.setattr(chain, "rating_agent", Agent("rating", rating if live else None))
+    monkeypatch.setattr(chain, "get_all_open_issue_details", cassette.recorded("github")(issues))
+    monkeypatch.setattr(deploy, "_send", cassette.recorded("chain", key=lambda method, args, repoID, owner: [method, args])(send))
+    monkeypatch.setattr(deploy, "write_listeners", [lambda method, args: writes.append((method, args))])
+    # Each run starts without the ratings of the other, as in a fresh process.
+    monkeypatch.setattr(dedup, "_indexes", {})
+    return writes
+
+
+def fetch(run_id):
+    final_state = chain.init_chain().invoke({"owner": "o", "repo": "r", "action": "fetch", "run_id": run_id})
+    return {key: value for key, value in final_state.items() if key not in ("run_id", "message", "deadline", "committed_at")}, final_state["message"]
+
+
+def test_fetch_replays_as_recorded(monkeypatch, tmp_path):
+    path = str(tmp_path / "fetch.cassette")
+
+    monkeypatch.setattr(cassette, "active", cassette.Cassette(path, "record", "zero"))
+    recorded_writes = services(monkeypatch, live=True)
+    recorded_state, _ = fetch("record")
+    assert recorded_state["issues"].to_dict() == {9: 15, 7: 40}
+    assert recorded_writes[-1][0] == "updateIssues"
+
+    monkeypatch.setattr(cassette, "active", cassette.Cassette(path, "replay", "zero"))
+    replayed_writes = services(monkeypatch, live=False)
+    replayed_state, message = fetch("replay")
+    assert message.startswith("Total 2 issues are fetched and rated.")
+    assert replayed_state["issues"].to_dict() == recorded_state["issues"].to_dict()
+    assert {key: value for key, value in replayed_state.items() if key != "issues"} == \
+        {key: value for key, value in recorded_state.items() if key != "issues"}
+    assert replayed_writes == recorded_writes
+
+
+def test_replay_miss_raises(monkeypatch, tmp_path):
+    path = tmp_path / "empty.cassette"
+    path.write_text("")
+    monkeypatch.setattr(cassette, "active", cassette.Cassette(str(path), "replay", "zero"))
+    services(monkeypatch, live=False)
+    with pytest.raises(cassette.CassetteMiss):
+        fetch("miss")
+
+
+def test_dashboard_does_not_refresh_in_the_background(monkeypatch, tmp_path):
+    monkeypatch.setattr(deploy, "write_listeners", [])
+    cache = dashboard.DashboardCache(str(tmp_path / "dashboard.db"))
+    cache.start(refresh=False)
+    assert cache.thread is None
+    assert deploy.write_listeners == []
@@ -0,0 +1,36 @@
+import json
+
+from langchain_core.messages import AIMessage
+
+import chain
+from rate_issue import dedup
+
+
+class Agent:
+    def __init__(self, reply):
+        self.reply = reply
+
+    def invoke(self, inputs):
+        return {"messages": [AIMessage(self.reply(str(inputs["messages"][-1])))]}
+
+
+def test_partial_commits_after_the_first_append_new_issues_only(monkeypatch):
+    numbers = [3, 5, 8]
+    writes = []
+    monkeypatch.setattr(dedup, "_indexes", {})
+    monkeypatch.setattr(chain, "meta_agent", Agent(lambda prompt: json.dumps({"ACTION": "FETCH", "RESULT": numbers})))
+    monkeypatch.setattr(chain, "github_agent", Agent(lambda prompt: prompt.rsplit(":", 1)[1]))
+    monkeypatch.setattr(chain, "rating_agent", Agent(lambda issue: str(10 * int(issue))))
+    monkeypatch.setattr(chain, "get_all_open_issue_details", lambda owner, repo: [
+        {"number": number, "title": f"Unrelated issue number {number} " * number, "labels": [], "comments": 0} for number in numbers])
+    monkeypatch.setattr(chain, "update_issues", lambda repoID, issues, ratings, total: writes.append(("update", issues, ratings, total)))
+    monkeypatch.setattr(chain, "append_issues", lambda repoID, issues, ratings: writes.append(("append", issues, ratings)))
+
+    final_state = chain.init_chain().invoke({"owner": "o", "repo": "r", "action": "fetch", "run_id": "partial-commits", "commit_every": 1})
+
+    assert writes == [
+        ("update", ["3"], ["30"], "30"),
+        ("append", ["5"], ["50"]),
+        ("update", ["3", "5", "8"], ["30", "50", "80"], "160"),
+    ]
+    assert final_state["committed"] == 2
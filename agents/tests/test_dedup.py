@@ -0,0 +1,61 @@
+import numpy as np
+
+from rate_issue import dedup
+
+BODY = "Starting the server without a config file raises a KeyError in the loader instead of using the defaults."
+
+
+def issue(number, title, body=BODY):
+    return {"number": number, "title": title, "body": body}
+
+
+def test_band_table_finds_recent_and_merged_rows():
+    table = dedup._BandTable()
+    table.add(5, 1)
+    table.merge()
+    table.add(5, 2)
+    assert sorted(table.get(np.uint64(5))) == [1, 2]
+    table.remove(5, 1)
+    table.remove(5, 2)
+    assert table.get(np.uint64(5)) == []
+
+
+def test_signature_similarity_tracks_text_similarity():
+    same = dedup.signature("Crash on startup " + BODY)
+    near = dedup.signature("Crash at startup " + BODY)
+    other = dedup.signature("Document the plugin API and add examples of writing a custom exporter.")
+    assert (same == near).mean() > dedup.seed_threshold
+    assert (same == other).mean() < 0.2
+
+
+def test_readded_issue_moves_to_its_new_buckets():
+    index = dedup.MinHashIndex()
+    old = dedup.signature("Crash on startup " + BODY)
+    new = dedup.signature("Document the plugin API and add examples of writing a custom exporter.")
+    index.add(1, old, 40, "fix the loader")
+    index.add(1, new, 15, "write the docs")
+    assert index.query(old) is None
+    assert index.query(new) == (1, 1.0)
+    assert index.ratings[1] == 15
+    assert all(sum(len(rows) for rows in band.recent.values()) + len(band.ids) == 1 for band in index.bands)
+
+
+def test_near_duplicate_reuses_rating(monkeypatch):
+    monkeypatch.setattr(dedup, "_indexes", {})
+    monkeypatch.setattr(dedup, "_staged", dedup.OrderedDict())
+    dedup.stage("o/r", [issue(1, "Crash on startup"), issue(2, "Crash on startup!"), issue(3, "Plugin API", "Undocumented.")])
+    dedup.add_rated("o/r", 1, 40, "fix the loader")
+    similar = dedup.find_similar("o/r", 2)
+    assert similar["issue"] == 1 and similar["rating"] == 40 and similar["action_items"] == "fix the loader"
+    assert similar["similarity"] >= dedup.reuse_threshold
+    assert dedup.find_similar("o/r", 3) is None
+
+
+def test_staged_signatures_are_capped_and_unstaged(monkeypatch):
+    monkeypatch.setattr(dedup, "_staged", dedup.OrderedDict())
+    monkeypatch.setattr(dedup, "max_staged", 3)
+    dedup.stage("o/a", [issue(1, "a"), issue(2, "b")])
+    dedup.stage("o/b", [issue(1, "c"), issue(2, "d")])
+    assert list(dedup._staged) == ["o/b"]
+    dedup.unstage("o/b", [1, 2])
+    assert not dedup._staged
@@ -0,0 +1,22 @@
+from rate_issue import heuristic
+
+
+def details(*numbers):
+    return [{"number": number, "title": f"Issue {number}", "labels": [], "comments": 0} for number in numbers]
+
+
+def test_overlapping_runs_of_a_repo_keep_their_pending_issues(monkeypatch):
+    monkeypatch.setattr(heuristic, "scorer", None)
+    recorded = []
+    monkeypatch.setattr(heuristic, "record_history", lambda repoID, number, features, rating: recorded.append((number, rating)))
+
+    heuristic.pre_rate("o/r", "run-a", details(1, 2), {1: 0, 2: 0})
+    heuristic.pre_rate("o/r", "run-b", details(3), {3: 0})
+    heuristic.record_llm_rating("o/r", "run-a", 1, 40)
+    heuristic.record_llm_rating("o/r", "run-b", 3, 20)
+    heuristic.release_pending("run-a")
+    heuristic.record_llm_rating("o/r", "run-a", 2, 10)
+
+    assert recorded == [(1, 40), (3, 20)]
+    heuristic.release_pending("run-b")
+    assert "run-a" not in heuristic._pending and "run-b" not in heuristic._pending
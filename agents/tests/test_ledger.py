@@ -0,0 +1,20 @@
+from ledger import IssueLedger, merge_issues
+
+
+def test_rated_since_returns_issues_in_rating_order():
+    issues = IssueLedger({1: 0, 2: 30, 3: 0, 4: 0})
+    merge_issues(issues, {3: 20})
+    mark = len(issues.rated)
+    merge_issues(issues, {4: 10})
+    merge_issues(issues, {1: 40})
+    assert issues.rated_since(0) == (["2", "3", "4", "1"], ["30", "20", "10", "40"])
+    assert issues.rated_since(mark) == (["4", "1"], ["10", "40"])
+    assert issues.rated_since(len(issues.rated)) == ([], [])
+
+
+def test_next_pending_skips_rated_and_failed_issues():
+    issues = IssueLedger({1: 0, 2: 0, 3: 0})
+    merge_issues(issues, {1: 10})
+    assert issues.next_pending() == 2
+    assert issues.next_pending(skip={2}) == 3
+    assert issues.unrated == 2 and issues.rating_sum == 10
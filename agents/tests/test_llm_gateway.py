@@ -0,0 +1,68 @@
+import time
+from collections import deque
+
+import httpx
+import openai
+import pytest
+from langchain_core.outputs import ChatResult
+
+import llm_gateway
+from budget import RunUsage
+from metrics import current_usage
+
+
+def answer(prompt_tokens, completion_tokens):
+    return ChatResult(generations=[], llm_output={"token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}})
+
+
+def gateway(timeout=10.0):
+    return llm_gateway.Gateway(2, 1, 4, timeout)
+
+
+def test_transient_error_is_retried():
+    calls = []
+
+    def request(hedge):
+        calls.append(hedge)
+        if len(calls) == 1:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+        return answer(1, 1)
+
+    assert gateway().call(request, "m").llm_output["token_usage"]["prompt_tokens"] == 1
+    assert calls == [False, False]
+
+
+def test_other_errors_are_not_retried():
+    calls = []
+
+    def request(hedge):
+        calls.append(hedge)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        gateway().call(request, "m")
+    assert calls == [False]
+
+
+def test_unused_hedged_request_is_charged(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "hedge_budget", 1.0)
+    monkeypatch.setattr(llm_gateway, "hedge_min_samples", 1)
+    slow = gateway()
+    slow.latencies["m"] = deque([0.01])
+
+    def request(hedge):
+        if hedge:
+            return answer(7, 3)
+        time.sleep(0.2)
+        return answer(10, 5)
+
+    account = RunUsage()
+    token = current_usage.set(account)
+    try:
+        result = slow.call(request, "m")
+    finally:
+        current_usage.reset(token)
+    assert result.llm_output["token_usage"]["prompt_tokens"] == 7
+    slow.pool.shutdown(wait=True)
+    # The hedge's answer is charged by the callback handler of the model; the first request by the gateway.
+    assert account.totals["prompt_tokens"] == 10 and account.totals["completion_tokens"] == 5
@@ -0,0 +1,18 @@
+from loadtest import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 11)]
+    assert percentile(values, 50) == 5.0
+    assert percentile(values, 95) == 10.0
+    assert percentile(values, 99) == 10.0
+    assert percentile(values, 10) == 1.0
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 10.0
+
+
+def test_percentile_of_few_values():
+    assert percentile([], 99) == 0.0
+    assert percentile([3.0], 50) == 3.0
+    assert percentile([1.0, 2.0], 50) == 1.0
+    assert percentile([1.0, 2.0], 51) == 2.0
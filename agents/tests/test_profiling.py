@@ -0,0 +1,27 @@
+import os
+import threading
+
+import profiling
+
+
+def test_concurrent_profiles_get_their_own_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "profile_dir", str(tmp_path))
+    names = []
+    started = threading.Barrier(2)
+
+    def run():
+        with profiling.profile("fetch") as name:
+            started.wait(timeout=5)
+            names.append(name)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(set(names)) == 2
+    files = os.listdir(tmp_path)
+    assert all(name + ".collapsed" in files for name in names)
+    # Only one of them could run cProfile.
+    assert sum(name + ".prof" in files for name in names) == 1
@@ -0,0 +1,55 @@
+import pytest
+
+import runs
+
+
+def test_checkpointed_run_loads_back():
+    run_id = runs.new_run_id()
+    runs.create_run(run_id, "o/r", {3: 0, 1: 20, 2: 0})
+    runs.record_rating(run_id, 3, 40)
+    runs.record_failure(run_id, 2, "agent crashed")
+    repoID, status, issues, failed = runs.load_run(run_id)
+    assert (repoID, status) == ("o/r", runs.RUNNING)
+    assert list(issues.items()) == [(3, 40), (1, 20), (2, 0)]
+    assert failed == {2: "agent crashed"}
+    assert list(runs.iter_run_issues(run_id)) == [(3, 40, None), (1, 20, None), (2, 0, "agent crashed")]
+
+
+def test_rating_clears_an_earlier_failure():
+    run_id = runs.new_run_id()
+    runs.create_run(run_id, "o/r", {1: 0})
+    runs.record_failure(run_id, 1, "timeout")
+    runs.record_rating(run_id, 1, 30)
+    assert runs.load_run(run_id)[3] == {}
+
+
+def test_existing_run_id_is_refused():
+    run_id = runs.new_run_id()
+    runs.create_run(run_id, "o/r", {1: 0})
+    with pytest.raises(ValueError):
+        runs.create_run(run_id, "o/other", {2: 0})
+    assert runs.run_info(run_id)[0] == "o/r"
+
+
+def test_only_stale_or_stopped_runs_can_be_claimed(monkeypatch):
+    run_id = runs.new_run_id()
+    runs.create_run(run_id, "o/r", {1: 0})
+    assert not runs.claim_run(run_id)
+    monkeypatch.setattr(runs, "stale_after", -1)
+    assert runs.claim_run(run_id)
+    monkeypatch.setattr(runs, "stale_after", 900)
+    runs.set_status(run_id, runs.PARTIAL, "time box")
+    assert runs.claim_run(run_id)
+    runs.set_status(run_id, runs.COMMITTED, "done")
+    assert not runs.claim_run(run_id)
+
+
+def test_fail_run_leaves_finished_runs_alone():
+    running, committed = runs.new_run_id(), runs.new_run_id()
+    for run_id in (running, committed):
+        runs.create_run(run_id, "o/r", {1: 0})
+    runs.set_status(committed, runs.COMMITTED, "done")
+    runs.fail_run(running, "crashed")
+    runs.fail_run(committed, "crashed")
+    assert runs.run_info(running)[1:] == (runs.FAILED, "crashed")
+    assert runs.run_info(committed)[1:] == (runs.COMMITTED, "done")
@@ -0,0 +1,52 @@
+import pytest
+
+import runs
+import scheduler
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    monkeypatch.setattr(scheduler, "run", lambda request: ("new-etag", "new-activity"))
+    monkeypatch.setattr(scheduler, "jitter", 0.0)
+    scheduler.sync_repos([], 0)
+    scheduler.sync_repos(["o/r"], 0)
+    scheduler.reschedule("o/r", 0, scheduler.min_interval, 0, "", etag="old-etag", activity="old-activity")
+    return "o/r"
+
+
+def stored(repoID):
+    return scheduler._connection().execute("SELECT etag, activity FROM schedule WHERE repo = ?", (repoID,)).fetchone()
+
+
+def refresh(status, failed=None):
+    def invoke(state):
+        runs.create_run(state["run_id"], "o/r", {1: 10, 2: 0})
+        runs.set_status(state["run_id"], status)
+        return {"message": status, "failed": failed or {}}
+    return invoke
+
+
+def test_committed_refresh_stores_etag(repo):
+    scheduler.Scheduler(refresh(runs.COMMITTED), concurrency=1).check(repo, scheduler.min_interval, "old-etag", "old-activity", 0)
+    assert stored(repo) == ("new-etag", "new-activity")
+
+
+@pytest.mark.parametrize("status, failed", [(runs.PARTIAL, None), (runs.FAILED, {2: "timeout"})])
+def test_incomplete_refresh_keeps_etag(repo, status, failed):
+    scheduler.Scheduler(refresh(status, failed), concurrency=1).check(repo, 3600, "old-etag", "old-activity", 0)
+    assert stored(repo) == ("old-etag", "old-activity")
+    assert scheduler.schedule()[0]["interval"] == scheduler.min_interval
+
+
+def test_failed_refresh_fails_its_run(repo):
+    run_ids = []
+
+    def invoke(state):
+        run_ids.append(state["run_id"])
+        runs.create_run(state["run_id"], "o/r", {1: 0})
+        raise RuntimeError("boom")
+
+    scheduler.Scheduler(invoke, concurrency=1).check(repo, scheduler.min_interval, "old-etag", "old-activity", 0)
+    assert runs.run_info(run_ids[0])[1] == runs.FAILED
+    assert stored(repo) == ("old-etag", "old-activity")
+    assert scheduler.schedule()[0]["failures"] == 1
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from singleflight import Group, repo_lock
+
+
+class WatchedEvent(threading.Event):
+    """An Event that tells when someone started waiting on it."""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+
+def coalesce(group, work):
+    # Start a leader, attach a follower while the leader's call is in flight, then let it finish.
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def leader_work():
+        started.set()
+        release.wait(timeout=5)
+        return work()
+
+    def call(fn):
+        try:
+            results.append(group.do("key", fn))
+        except Exception as e:
+            results.append(e)
+
+    leader = threading.Thread(target=call, args=(leader_work,))
+    leader.start()
+    started.wait(timeout=5)
+    done = group.calls["key"].done = WatchedEvent()
+    follower = threading.Thread(target=call, args=(lambda: pytest.fail("the follower ran the work"),))
+    follower.start()
+    done.waiting.wait(timeout=5)
+    release.set()
+    leader.join(timeout=5)
+    follower.join(timeout=5)
+    return results
+
+
+def test_concurrent_calls_share_one_result():
+    results = coalesce(Group(), lambda: "result")
+    assert sorted(results, key=lambda result: result[1]) == [("result", False), ("result", True)]
+
+
+def test_concurrent_calls_share_the_error():
+    error = RuntimeError("boom")
+
+    def work():
+        raise error
+
+    assert coalesce(Group(), work) == [error, error]
+
+
+def test_finished_call_is_not_shared():
+    group = Group()
+    assert group.do("key", lambda: 1) == (1, False)
+    assert group.do("key", lambda: 2) == (2, False)
+    assert not group.calls
+
+
+def test_repo_lock_is_per_repo_and_reentrant():
+    assert repo_lock("o/a") is repo_lock("o/a")
+    assert repo_lock("o/a") is not repo_lock("o/b")
+    with repo_lock("o/a"):
+        with repo_lock("o/a"):
+            pass
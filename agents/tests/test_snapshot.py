@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import snapshot
+
+BIG = 3 * 10 ** 20  # wei, more than 64 bits
+
+REPOS = {
+    "o/b": [(1, 90, BIG, 100), (2, 10, 5, 200)],
+    "o/a": [(7, 50, BIG + 1, 300)],
+    "o/empty": [],
+}
+
+
+@pytest.fixture
+def mapped(tmp_path):
+    path = str(tmp_path / "ratings.snapshot")
+    snapshot.write(path, REPOS)
+    return snapshot.Snapshot(path)
+
+
+def test_round_trip_keeps_order_and_exact_rewards(mapped):
+    assert mapped.repos == ["o/a", "o/b", "o/empty"]
+    assert len(mapped) == 3
+    assert mapped.issues("o/b") == REPOS["o/b"]
+    assert mapped.issues("o/a") == REPOS["o/a"]
+    assert mapped.issues("o/empty") == []
+    assert mapped.issues("o/missing") is None
+
+
+def test_top_issues_orders_by_exact_reward(mapped):
+    top = mapped.top_issues(2)
+    assert [(issue["repo"], issue["issue"], issue["reward"]) for issue in top] == [("o/a", 7, str(BIG + 1)), ("o/b", 1, str(BIG))]
+    assert [issue["issue"] for issue in mapped.top_issues(5, "o/b")] == [1, 2]
+    assert mapped.top_issues(3, "o/missing") == []
+
+
+def test_histograms_agree(mapped):
+    counts, edges = mapped.rating_histogram(bins=10)
+    assert counts.tolist() == [0, 1, 0, 0, 0, 1, 0, 0, 0, 1] and edges[0] == 0 and edges[-1] == 100
+    per_repo = mapped.rating_histograms(bins=10)
+    assert per_repo.shape == (3, 10)
+    assert np.array_equal(per_repo.sum(axis=0), counts)
+    assert np.array_equal(per_repo[mapped.repos.index("o/b")], mapped.rating_histogram("o/b", 10)[0])
+
+
+def test_rewrite_leaves_mapped_snapshot_readable(tmp_path):
+    path = str(tmp_path / "ratings.snapshot")
+    snapshot.write(path, REPOS)
+    old = snapshot.Snapshot(path)
+    snapshot.write(path, {"o/c": [(1, 1, 1, 1)]})
+    assert old.issues("o/a") == REPOS["o/a"]
+    assert snapshot.load(path).repos == ["o/c"]
+    assert [name for name in tmp_path.iterdir() if name.suffix == ".tmp"] == []
+
+
+def test_load_ignores_missing_and_foreign_files(tmp_path):
+    assert snapshot.load(str(tmp_path / "missing")) is None
+    foreign = tmp_path / "foreign"
+    foreign.write_bytes(b"not a snapshot at all")
+    assert snapshot.load(str(foreign)) is None
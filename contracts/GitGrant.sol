@@ -2,19 +2,22 @@
 pragma solidity ^0.8.0;
 
 contract GitGrant {
-    // The wallet address that controls the state of the contract.
+    // The wallet address that controls the state of the contract and manages the agents.
     address public owner;
 
+    // Agent wallets allowed to update the state of the contract, in addition to the owner.
+    mapping(address => bool) public agents;
+
     // Mapping from GitHub username to the user's wallet address.
     mapping(string => address) public userWallets;
 
     // Mapping from repository name to its RepoState.
     mapping(string => RepoState) public repoStates;
 
-    // Struct representing an issue.
+    // Struct representing an issue, packed into a single storage slot.
     struct Issue {
-        uint issueNumber;
-        uint difficultyRating;
+        uint64 issueNumber;
+        uint32 difficultyRating;
     }
 
     // Struct representing the state for a GitHub repo.
@@ -32,16 +35,60 @@ contract GitGrant {
         _;
     }
 
+    // Modifier to restrict functions to the owner and the authorized agents.
+    modifier onlyAgent() {
+        require(msg.sender == owner || agents[msg.sender], "Only agents allowed");
+        _;
+    }
+
     // Set the deployer as the owner.
     constructor(address agent) {
         owner = agent;
     }
 
-    // Custom getter to retrieve the complete issues array.
-    function getRepoIssues(
+    /// @notice Authorize an agent wallet to send state updates.
+    /// @param agent The agent wallet address.
+    function addAgent(address agent) external onlyOwner {
+        require(agent != address(0), "Invalid agent address");
+        agents[agent] = true;
+    }
+
+    /// @notice Revoke an agent wallet.
+    /// @param agent The agent wallet address.
+    function removeAgent(address agent) external onlyOwner {
+        agents[agent] = false;
+    }
+
+    /// @notice Number of issues of a repository.
+    /// @param repoName The repository name.
+    function getRepoIssueCount(
         string memory repoName
+    ) public view returns (uint) {
+        return repoStates[repoName].issueRatings.length;
+    }
+
+    /// @notice Page through the issues of a repository.
+    /// @param repoName The repository name.
+    /// @param offset Index of the first issue to return.
+    /// @param limit Maximum number of issues to return.
+    function getRepoIssues(
+        string memory repoName,
+        uint offset,
+        uint limit
     ) public view returns (Issue[] memory) {
-        return repoStates[repoName].issueRatings;
+        Issue[] storage issues = repoStates[repoName].issueRatings;
+        if (offset >= issues.length) {
+            return new Issue[](0);
+        }
+        uint end = offset + limit;
+        if (end > issues.length) {
+            end = issues.length;
+        }
+        Issue[] memory page = new Issue[](end - offset);
+        for (uint i = offset; i < end; i++) {
+            page[i - offset] = issues[i];
+        }
+        return page;
     }
 
     /// @notice Register a GitHub user by mapping their GitHub username to their wallet address.
@@ -50,7 +97,7 @@ contract GitGrant {
     function registerUser(
         string memory username,
         address wallet
-    ) external onlyOwner {
+    ) external onlyAgent {
         require(wallet != address(0), "Invalid wallet address");
         userWallets[username] = wallet;
     }
@@ -63,7 +110,7 @@ contract GitGrant {
         string memory repoName,
         string memory githubOwnerName,
         string memory githubRepoName
-    ) external onlyOwner {
+    ) external onlyAgent {
         // Ensure that this repo has not been registered already.
         require(
             bytes(repoStates[repoName].githubOwnerName).length == 0,
@@ -99,10 +146,10 @@ contract GitGrant {
     /// @param totalRating total difficulty ratings for all the issues.
     function updateIssues(
         string memory repoName,
-        uint256[] memory issueNumbers,
-        uint256[] memory difficultyRatings,
+        uint64[] calldata issueNumbers,
+        uint32[] calldata difficultyRatings,
         uint totalRating
-    ) external onlyOwner {
+    ) external onlyAgent {
         require(
             bytes(repoStates[repoName].githubOwnerName).length > 0,
             "Repo not registered"
@@ -128,6 +175,40 @@ contract GitGrant {
         repo.ratingSum = totalRating;
     }
 
+    /// @notice Add newly rated issues to a repository's list of issues and their ratings to its
+    ///         rating sum, e.g. for the partial commits of a long rating run; the cost depends on
+    ///         the issues added only. The issues must not be on the list yet.
+    /// @param repoName The repository to update.
+    /// @param issueNumbers new issues.
+    /// @param difficultyRatings their ratings.
+    function appendIssues(
+        string memory repoName,
+        uint64[] calldata issueNumbers,
+        uint32[] calldata difficultyRatings
+    ) external onlyAgent {
+        require(
+            bytes(repoStates[repoName].githubOwnerName).length > 0,
+            "Repo not registered"
+        );
+
+        require(
+            issueNumbers.length == difficultyRatings.length,
+            "Array lengths mismatch"
+        );
+
+        RepoState storage repo = repoStates[repoName];
+        uint added = 0;
+
+        for (uint i = 0; i < issueNumbers.length; i++) {
+            repo.issueRatings.push(
+                Issue(issueNumbers[i], difficultyRatings[i])
+            );
+            added += difficultyRatings[i];
+        }
+
+        repo.ratingSum += added;
+    }
+
     /// @notice Resolve an issue: remove it from the issues list, update the rating sum,
     ///         subtract the payout amount from the remaining budget, and transfer the payout
     ///         to the GitHub user’s wallet.
@@ -140,7 +221,7 @@ contract GitGrant {
         uint issueNumber,
         string memory githubUsername,
         uint amount
-    ) external onlyOwner {
+    ) external onlyAgent {
         RepoState storage repo = repoStates[repoName];
         require(bytes(repo.githubOwnerName).length > 0, "Repo not registered");
 